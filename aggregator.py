@@ -0,0 +1,149 @@
+"""
+多周期K线聚合
+只订阅一个基础周期（默认1m）的K线流，在内存中增量合成 5m/15m/1h/4h 等高周期K线。
+桶边界与交易所一致：按 UTC 纪元时间对齐（open_time // 周期 * 周期），周线/月线不支持。
+
+每帧基础K线返回各周期当前K线（未收盘时为实时合成值）；基础K线收盘且恰好是某个桶的最后一根时，
+该周期K线随之收盘。启动或断线重连时用数据库中的基础K线回放当前桶，桶内缺少基础K线的
+（启动于桶中途、断线漏帧）标记为不完整，收盘价仍然正确但不写入数据库。
+"""
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from backfill import interval_to_ms
+
+
+class CandleUpdate(NamedTuple):
+    interval: str
+    open_time: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    closed: bool
+    complete: bool = True
+
+
+class _Bucket:
+    """一个周期正在形成的K线（只累计已收盘的基础K线）"""
+
+    __slots__ = ("open_time", "open", "high", "low", "close", "volume", "last_base", "complete")
+
+    def __init__(self, open_time: int, complete: bool):
+        self.open_time = open_time
+        self.open = 0.0
+        self.high = 0.0
+        self.low = 0.0
+        self.close = 0.0
+        self.volume = 0.0
+        self.last_base = 0  # 已累计的最后一根基础K线 open_time，0 表示还没有
+        self.complete = complete
+
+    def fold(self, open_time: int, o: float, h: float, l: float, c: float, v: float, base_ms: int):
+        if self.last_base:
+            if open_time != self.last_base + base_ms:
+                self.complete = False
+            self.high = max(self.high, h)
+            self.low = min(self.low, l)
+            self.volume += v
+        else:
+            self.open, self.high, self.low, self.volume = o, h, l, v
+        self.close = c
+        self.last_base = open_time
+
+    def live(self, o: float, h: float, l: float, c: float, v: float):
+        """已累计部分与正在形成的基础K线合成的实时K线 (open, high, low, close, volume)"""
+        if not self.last_base:
+            return o, h, l, c, v
+        return self.open, max(self.high, h), min(self.low, l), c, self.volume + v
+
+
+def resample(rows: Sequence[Dict], src_ms: int, dst_ms: int) -> List[Dict]:
+    """把时间升序的已收盘K线（fetch_klines 的返回值）合成为高周期K线，只保留根数完整的桶"""
+    per = dst_ms // src_ms
+    out: List[Dict] = []
+    group: List[Dict] = []
+
+    def flush():
+        if len(group) == per:
+            out.append({
+                "open_time": int(group[0]["open_time"]) // dst_ms * dst_ms,
+                "open": float(group[0]["open"]),
+                "high": max(float(r["high"]) for r in group),
+                "low": min(float(r["low"]) for r in group),
+                "close": float(group[-1]["close"]),
+                "volume": sum(float(r.get("volume") or 0) for r in group),
+            })
+
+    start = None
+    for r in rows:
+        b = int(r["open_time"]) // dst_ms * dst_ms
+        if b != start:
+            flush()
+            group = []
+            start = b
+        group.append(r)
+    flush()
+    return out
+
+
+class CandleAggregator:
+    def __init__(self, base: str, intervals: Iterable[str]):
+        self.base = base
+        self.base_ms = interval_to_ms(base)
+        self.frames: Dict[str, int] = {}
+        for itv in intervals:
+            ms = interval_to_ms(itv)
+            if itv == base:
+                continue
+            if ms % self.base_ms:
+                raise ValueError(f"周期 {itv} 不是基础周期 {base} 的整数倍")
+            self.frames[itv] = ms
+        self._buckets: Dict[str, Optional[_Bucket]] = {itv: None for itv in self.frames}
+
+    @property
+    def span_ms(self) -> int:
+        """最长周期的时长（回放当前桶需要的基础K线时间跨度）"""
+        return max(self.frames.values(), default=self.base_ms)
+
+    def seed(self, rows: Iterable[Dict]):
+        """用数据库中时间升序的已收盘基础K线回放各周期的当前桶（不产生收盘输出）"""
+        self._buckets = {itv: None for itv in self.frames}
+        for r in rows:
+            self.update(int(r["open_time"]), float(r["open"]), float(r["high"]), float(r["low"]),
+                        float(r["close"]), float(r.get("volume") or 0), True)
+        # 回放时恰好收盘的桶已清空；残留的都是当前正在形成的桶
+
+    def update(self, open_time: int, o: float, h: float, l: float, c: float, v: float,
+               is_closed: bool) -> List[CandleUpdate]:
+        """
+        喂入一帧基础K线，返回基础周期与各高周期的当前K线
+
+        基础K线跳过了某个桶的最后一根（断线漏帧）时，该桶在下一个桶的第一帧到来时以不完整状态收盘。
+        """
+        out = [CandleUpdate(self.base, open_time, o, h, l, c, v, is_closed)]
+        base_ms = self.base_ms
+        for itv, ms in self.frames.items():
+            start = open_time // ms * ms
+            b = self._buckets[itv]
+            if b is not None and b.open_time != start:
+                if start < b.open_time:
+                    continue  # 迟到的旧帧
+                if b.last_base:
+                    out.append(CandleUpdate(itv, b.open_time, b.open, b.high, b.low, b.close, b.volume, True, False))
+                b = None
+            if b is None:
+                b = self._buckets[itv] = _Bucket(start, complete=open_time == start)
+            if is_closed:
+                if open_time <= b.last_base:
+                    continue  # 重复的收盘帧
+                b.fold(open_time, o, h, l, c, v, base_ms)
+                if open_time + base_ms >= start + ms:
+                    out.append(CandleUpdate(itv, start, b.open, b.high, b.low, b.close, b.volume, True, b.complete))
+                    self._buckets[itv] = None
+                    continue
+                out.append(CandleUpdate(itv, start, b.open, b.high, b.low, b.close, b.volume, False, b.complete))
+            else:
+                out.append(CandleUpdate(itv, start, *b.live(o, h, l, c, v), False, b.complete))
+        return out
@@ -0,0 +1,171 @@
+"""
+Flask 接口响应缓存
+按 (接口, 查询参数) 缓存序列化后的响应体，由事件总线的数据变更事件失效（K线收盘、新成交、新日志等），
+不依赖固定过期时间：每个事件主题维护一个版本号，发布事件只把版本号加一（O(1)，不阻塞发布者），
+缓存项记录计算时各依赖主题的版本号，不一致即视为过期。
+
+同一缓存项的并发未命中只计算一次（其余请求等待结果），N 个页面每次数据变化只触发一次计算。
+响应带 ETag（响应体摘要）与 Cache-Control: no-cache，浏览器重新验证时内容未变直接返回 304。
+
+用法:
+    cache = ResponseCache()
+    cache.watch(events.KLINE, lambda rows: ...)   # 可选：只有满足条件的事件才失效
+
+    @app.get("/api/trades")
+    @cache.cached(events.TRADE)
+    def api_trades(): ...
+"""
+
+import functools
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import make_response, request
+
+import events
+import exporter
+
+_REQUESTS = exporter.registry.counter("api_cache_requests_total", "API response cache lookups",
+                                      ["endpoint", "result"])
+
+
+# 每次响应单独生成的头，不随缓存项保存
+_PER_RESPONSE_HEADERS = {"Content-Length", "ETag", "Cache-Control"}
+
+
+class _Entry:
+    __slots__ = ("versions", "etag", "body", "status", "headers")
+
+    def __init__(self, versions: Tuple[int, ...], etag: str, body: bytes, status: int, headers: Dict[str, str]):
+        self.versions = versions
+        self.etag = etag
+        self.body = body
+        self.status = status
+        self.headers = headers
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._watched = set()
+        self._entries: Dict[Tuple, _Entry] = {}
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    # ==================== 失效 ====================
+
+    def watch(self, topic: str, predicate: Optional[Callable[[Any], bool]] = None):
+        """订阅事件主题；predicate 给出时只有其返回 True 的事件才使依赖该主题的缓存失效"""
+        if topic in self._watched:
+            return
+        self._watched.add(topic)
+
+        def _bump(payload):
+            if predicate is None or predicate(payload):
+                self._versions[topic] += 1
+
+        events.subscribe(topic, _bump)
+
+    def invalidate(self, topic: Optional[str] = None):
+        """手动失效某个主题（或全部缓存）"""
+        if topic is not None:
+            self._versions[topic] += 1
+            return
+        with self._lock:
+            self._entries.clear()
+
+    # ==================== 装饰器 ====================
+
+    def cached(self, *topics: str, vary: Optional[Callable[[], Any]] = None):
+        """
+        缓存 GET 接口的 200 响应
+
+        Args:
+            topics: 依赖的事件主题，任一主题有事件即失效
+            vary: 额外的缓存键（例如按日期变化的内容传入当天日期）
+        """
+        for topic in topics:
+            self.watch(topic)
+
+        def decorator(view):
+            endpoint = view.__name__
+
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (endpoint, tuple(sorted(request.args.items(multi=True))), vary() if vary else None)
+                entry = self._entries.get(key)
+                result = "hit"
+                if entry is None or entry.versions != self._current(topics):
+                    with self._key_lock(key):
+                        # 等锁期间其他请求可能已经算好
+                        versions = self._current(topics)
+                        entry = self._entries.get(key)
+                        if entry is None or entry.versions != versions:
+                            result = "miss"
+                            resp = make_response(view(*args, **kwargs))
+                            if resp.status_code != 200 or resp.direct_passthrough:
+                                self._count(endpoint, result)
+                                return resp
+                            entry = self._store(key, versions, resp)
+                if entry.etag in request.if_none_match:
+                    result = "not_modified"
+                self._count(endpoint, result)
+                return self._respond(entry, result == "not_modified")
+
+            return wrapper
+
+        return decorator
+
+    # ==================== 内部 ====================
+
+    def _current(self, topics: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self._versions[t] for t in topics)
+
+    def _key_lock(self, key: Tuple) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _store(self, key: Tuple, versions: Tuple[int, ...], resp) -> _Entry:
+        body = resp.get_data()
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        headers = {k: v for k, v in resp.headers.items() if k not in _PER_RESPONSE_HEADERS}
+        entry = _Entry(versions, etag, body, resp.status_code, headers)
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                # 淘汰最早写入的缓存项
+                oldest = next(iter(self._entries))
+                del self._entries[oldest]
+                self._key_locks.pop(oldest, None)
+            self._entries[key] = entry
+        return entry
+
+    def _respond(self, entry: _Entry, not_modified: bool):
+        if not_modified:
+            resp = make_response("", 304)
+        else:
+            resp = make_response(entry.body, entry.status)
+            resp.headers.update(entry.headers)
+        resp.set_etag(entry.etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+
+    @staticmethod
+    def _count(endpoint: str, result: str):
+        _REQUESTS.inc(1, endpoint, result)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各接口命中/未命中/304 次数与缓存项数量"""
+        out: Dict[str, Dict[str, float]] = defaultdict(lambda: {"hit": 0, "miss": 0, "not_modified": 0})
+        for (endpoint, result), n in _REQUESTS.values().items():
+            out[endpoint][result] = n
+        for s in out.values():
+            total = s["hit"] + s["miss"] + s["not_modified"]
+            s["hit_rate"] = (total - s["miss"]) / total if total else 0.0
+        return {"entries": len(self._entries), "endpoints": dict(out), "versions": dict(self._versions)}
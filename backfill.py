@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+并发分页补齐历史K线
+把缺失的时间区间切成按页大小对齐的窗口，在请求权重预算内并发拉取；
+各页按时间顺序逐页写入数据库（每页一个事务），数据库中始终是连续的前缀，
+中断后重新运行会从 latest_kline_time 继续。
+
+用法:
+    python backfill.py                       # 补齐 config.SYMBOL / config.INTERVAL 到最新
+    python backfill.py --days 30             # 补齐最近30天
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+from db import init_db, insert_kline, latest_kline_time, log
+from rest_client import AsyncFuturesClient, aiohttp
+
+# 币安K线接口的请求权重：limit 越大权重越高，1000 条/页的单位权重获取量最高
+PAGE_LIMIT = 1000
+PAGE_WEIGHT = 5
+# 交易所每分钟权重上限（X-MBX-USED-WEIGHT-1M 超过其 90% 时暂停到下一分钟）
+EXCHANGE_WEIGHT_LIMIT = 2400
+
+
+def interval_to_ms(itv: str) -> int:
+    units = {"m": 60000, "h": 3600000, "d": 86400000}
+    return int(itv[:-1]) * units[itv[-1]]
+
+
+class WeightBudget:
+    """按分钟权重预算的令牌桶"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.used = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, weight: int):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    self.used += weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+
+def _windows(start_ms: int, end_ms: int, interval_ms: int, page_limit: int) -> List[Tuple[int, int]]:
+    """把 [start_ms, end_ms) 切成每页最多 page_limit 根K线的窗口"""
+    span = interval_ms * page_limit
+    return [(t, min(t + span, end_ms)) for t in range(start_ms, end_ms, span)]
+
+
+async def backfill(symbol: str, interval: str, start_ms: int, end_ms: int,
+                   client: Optional[AsyncFuturesClient] = None,
+                   concurrency: int = config.BACKFILL_CONCURRENCY,
+                   weight_per_minute: int = config.BACKFILL_WEIGHT_BUDGET,
+                   page_limit: int = PAGE_LIMIT,
+                   budget: Optional[WeightBudget] = None) -> Dict[str, Any]:
+    """
+    拉取 open_time 位于 [start_ms, end_ms) 的K线并写入数据库
+
+    多个交易对同时补齐时传入同一个 client 和 budget，共享连接池与权重预算。
+
+    Returns:
+        dict: pages、candles、seconds、rate（根/秒）、weight（消耗的请求权重）
+    """
+    interval_ms = interval_to_ms(interval)
+    windows = _windows(start_ms, end_ms, interval_ms, page_limit)
+    stats = {"pages": 0, "candles": 0, "seconds": 0.0, "rate": 0.0, "weight": 0}
+    if not windows:
+        return stats
+
+    own_client = client is None
+    if own_client:
+        client = AsyncFuturesClient(api_key="", api_secret="", base_url=config.MARKET_REST_URL)
+    budget = budget or WeightBudget(weight_per_minute)
+    used_before = budget.used
+    sem = asyncio.Semaphore(concurrency)
+    # 重排缓冲：页可能乱序完成，按窗口顺序写库保证数据库中是连续前缀（可续传）
+    done: Dict[int, List[Tuple]] = {}
+    next_idx = 0
+    t0 = time.perf_counter()
+
+    async def fetch(i: int, w_start: int, w_end: int):
+        nonlocal next_idx
+        async with sem:
+            await budget.acquire(PAGE_WEIGHT)
+            data = await client.klines(symbol, interval, startTime=w_start, endTime=w_end - 1, limit=page_limit)
+            if client.used_weight > EXCHANGE_WEIGHT_LIMIT * 0.9:
+                # 其他进程/接口也在消耗权重，暂停到下一分钟窗口
+                await asyncio.sleep(60 - time.time() % 60)
+        done[i] = [
+            (symbol, interval, int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6]))
+            for k in data if w_start <= int(k[0]) < w_end
+        ]
+        while next_idx in done:
+            rows = done.pop(next_idx)
+            if rows:
+                insert_kline(rows)
+            stats["pages"] += 1
+            stats["candles"] += len(rows)
+            next_idx += 1
+
+    try:
+        tasks = [asyncio.create_task(fetch(i, ws, we)) for i, (ws, we) in enumerate(windows)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            raise
+    finally:
+        if own_client:
+            await client.close()
+        stats["seconds"] = time.perf_counter() - t0
+        stats["rate"] = stats["candles"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        stats["weight"] = budget.used - used_before
+    return stats
+
+
+async def backfill_gap(symbol: str = config.SYMBOL, interval: str = config.INTERVAL,
+                       initial: int = config.INITIAL_KLINES, now_ms: Optional[int] = None,
+                       **kwargs) -> Dict[str, Any]:
+    """
+    补齐数据库中到上一根已收盘K线为止缺失的K线
+
+    数据库为空时从最近 initial 根开始；否则从最新一根之后继续。
+    """
+    interval_ms = interval_to_ms(interval)
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    # 只补齐已收盘的K线：结束于当前正在形成的K线的开盘时间
+    end_ms = now_ms // interval_ms * interval_ms
+    last_time = latest_kline_time(symbol, interval)
+    start_ms = last_time + interval_ms if last_time else end_ms - initial * interval_ms
+    return await backfill(symbol, interval, start_ms, end_ms, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发补齐历史K线")
+    parser.add_argument("--symbol", default=config.SYMBOL)
+    parser.add_argument("--interval", default=config.INTERVAL)
+    parser.add_argument("--days", type=float, help="数据库为空时补齐的天数（默认 INITIAL_KLINES 根）")
+    parser.add_argument("--concurrency", type=int, default=config.BACKFILL_CONCURRENCY)
+    args = parser.parse_args()
+
+    if aiohttp is None:
+        print("aiohttp 未安装，无法补齐K线")
+        return
+    init_db()
+    initial = config.INITIAL_KLINES
+    if args.days:
+        initial = int(args.days * 86400000 // interval_to_ms(args.interval))
+    s = asyncio.run(backfill_gap(args.symbol, args.interval, initial, concurrency=args.concurrency))
+    print(f"补齐 {s['candles']} 根K线（{s['pages']} 页），用时 {s['seconds']:.2f} 秒，"
+          f"{s['rate']:.0f} 根/秒，消耗权重 {s['weight']}")
+    if s["candles"]:
+        log("INFO", f"backfill 补齐 {s['candles']} 条 K 线: {args.symbol} {args.interval} ({s['rate']:.0f} 根/秒)")
+
+
+if __name__ == "__main__":
+    main()
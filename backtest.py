@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+事件驱动回测
+从数据库 klines 表（或 CSV/JSON 文件）读取历史K线，逐根回放给 Engine 的状态机，
+使用按K线价格成交的模拟 Trader（计入 config.FEE_RATE 与 config.LEVERAGE）。
+
+用法:
+    python backtest.py                          # 使用数据库中 config.SYMBOL / config.INTERVAL 的K线
+    python backtest.py --source klines.csv --period 21 --std 2.0
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from backfill import interval_to_ms
+from config import config
+from db import get_conn, insert_kline
+from engine import Engine
+from indicators import StreamingBoll
+
+# (open_time, open, high, low, close)
+Candle = Tuple[int, float, float, float, float]
+
+
+class SimTrader:
+    """模拟交易：按给定价格立即成交，接口与 Trader 一致"""
+
+    def __init__(self, initial_balance: float = config.DEFAULT_MARGIN, fee_rate: float = config.FEE_RATE,
+                 leverage: int = config.LEVERAGE, symbol: str = config.SYMBOL):
+        self.initial_balance = initial_balance
+        self.wallet = initial_balance
+        self.fee_rate = fee_rate
+        self.leverage = leverage
+        self.symbol = symbol
+        self.position: Optional[Dict[str, Any]] = None
+        self.trades: List[Dict[str, Any]] = []
+        self.now_ms = 0
+
+    def _margin(self) -> float:
+        if not self.position:
+            return 0.0
+        return self.position["qty"] * self.position["entry_price"] / self.leverage
+
+    def get_balance(self) -> float:
+        """可用余额 = 钱包余额 - 持仓占用保证金"""
+        return self.wallet - self._margin()
+
+    async def get_balance_async(self) -> float:
+        return self.get_balance()
+
+    def equity(self, price: float) -> float:
+        if not self.position:
+            return self.wallet
+        pos = self.position
+        if pos["side"] == "long":
+            return self.wallet + (price - pos["entry_price"]) * pos["qty"]
+        return self.wallet + (pos["entry_price"] - price) * pos["qty"]
+
+    def get_positions(self):
+        if not self.position:
+            return []
+        amt = self.position["qty"] if self.position["side"] == "long" else -self.position["qty"]
+        return [{"symbol": self.symbol, "positionAmt": amt, "entryPrice": self.position["entry_price"]}]
+
+    async def place_order(self, side: str, qty: float, price: Optional[float] = None, symbol: Optional[str] = None):
+        if not price or price <= 0 or qty <= 0:
+            return None
+        fee = qty * price * self.fee_rate
+        self.wallet -= fee
+        self.position = {"side": "long" if side == "BUY" else "short", "qty": qty, "entry_price": price, "ts": self.now_ms}
+        self.trades.append({"ts": self.now_ms, "symbol": self.symbol, "side": side, "qty": qty,
+                            "price": price, "pnl": 0.0, "fee": fee})
+        return {"avgPrice": price, "executedQty": qty}
+
+    async def close_all(self, current_price: Optional[float] = None, symbol: Optional[str] = None) -> float:
+        pos = self.position
+        if not pos or not current_price:
+            return 0.0
+        qty = pos["qty"]
+        pnl = (current_price - pos["entry_price"]) * qty if pos["side"] == "long" else (pos["entry_price"] - current_price) * qty
+        fee = qty * current_price * self.fee_rate
+        self.wallet += pnl - fee
+        self.position = None
+        self.trades.append({"ts": self.now_ms, "symbol": self.symbol, "side": f"CLOSE_{pos['side'].upper()}",
+                            "qty": qty, "price": current_price, "pnl": pnl, "fee": fee})
+        return current_price
+
+
+class BacktestEngine(Engine):
+    """复用 Engine 的状态机，行情与时间由回测驱动，不访问网络和数据库"""
+
+    def __init__(self, trader: SimTrader, period: int = config.BOLL_PERIOD, std: float = config.BOLL_STD):
+        self.trader = trader
+        self.symbol = trader.symbol
+        self.socketio = None
+        self.broadcaster = None
+        self.initial_balance = self.initial_capital = trader.get_balance()
+        self._init_state_machine()
+        self.boll_period = period
+        self.boll_std = std
+        self.boll = StreamingBoll(period, std)
+        self.events: List[Tuple[int, str, str]] = []
+
+    def _log(self, level: str, message: str):
+        self.events.append((self.trader.now_ms, level, message))
+
+    def _now_ms(self) -> int:
+        return self.trader.now_ms
+
+    def _seed_boll(self):
+        self.boll = StreamingBoll(self.boll_period, self.boll_std)
+
+    async def _evaluate_bands_fallback(self):
+        # 不回退到 REST/数据库计算，增量BOLL数据不足时跳过本次评估
+        return None
+
+    async def close_and_update_profit(self, price: float):
+        if not self.trader.position:
+            return True
+        return await self.trader.close_all(price) > 0
+
+    async def on_tick(self, open_time: int, high: float, low: float, price: float, is_closed: bool):
+        self.last_price = price
+        self.boll.update(open_time, high, low, price, is_closed)
+        if self.boll.ready:
+            await self.evaluate()
+
+
+class _CombinedDecoder:
+    """组合流录制的帧按 decode_combined 解码"""
+
+    def __init__(self, decoder):
+        self.decode = decoder.decode_combined
+
+
+class ReplayEngine(Engine):
+    """
+    回放录制的行情会话（ws_record.py replay 使用）
+
+    原始帧经 _consume 走与实盘相同的解码、行情更新与评估路径，成交由 SimTrader 模拟，
+    时间取各帧的录制接收时间；K线写入调用方指定的临时数据库。
+    """
+
+    def __init__(self, trader: SimTrader, symbol: Optional[str] = None, combined: bool = False,
+                 verbose: bool = False):
+        super().__init__(trader=trader, symbol=symbol or trader.symbol)
+        if combined:
+            self.decoder = _CombinedDecoder(self.decoder)
+        self._stream_tag = f'"{self.symbol.lower()}@'
+        self.verbose = verbose
+        self.clock = lambda: 0  # 当前帧的录制时间（毫秒），由回放源提供
+        self.events: List[Tuple[int, str, str]] = []
+
+    def _log(self, level: str, message: str):
+        self.events.append((self.trader.now_ms, level, message))
+        if self.verbose:
+            ts = time.strftime("%m-%d %H:%M:%S", time.localtime(self.trader.now_ms / 1000))
+            print(f"  {ts} [{level}] {message}")
+
+    def _now_ms(self) -> int:
+        return self.trader.now_ms
+
+    def _on_kline(self, ev, recv_ns: int = 0):
+        self.trader.now_ms = self.clock()
+        super()._on_kline(ev, recv_ns)
+
+    async def _evaluate_bands_fallback(self):
+        # 回放不访问 REST；增量BOLL数据不足时跳过评估
+        return None
+
+    async def close_and_update_profit(self, price: float):
+        if not self.trader.position:
+            return True
+        return await self.trader.close_all(price) > 0
+
+    def accepts(self, raw: str) -> bool:
+        """组合流录制中是否为本交易对的帧"""
+        return self._stream_tag in raw
+
+    def on_seed(self, seed: Dict[str, Dict[str, List[Dict[str, Any]]]]):
+        """录制时的(重)连接：写回当时的K线并重建增量状态"""
+        rows = seed.get(self.symbol)
+        if rows is None:
+            return
+        insert_kline([(self.symbol, itv, r["open_time"], r["open"], r["high"], r["low"], r["close"], r["volume"],
+                       r["open_time"] + 1) for itv, items in rows.items() for r in items])
+        self._on_connect()
+
+
+def _intrabar_path(o: float, h: float, l: float, c: float) -> List[float]:
+    """K线内的近似价格路径：阳线先探低再冲高，阴线先冲高再探低"""
+    return [o, l, h] if c >= o else [o, h, l]
+
+
+async def run_backtest(candles: List[Candle], period: int = config.BOLL_PERIOD, std: float = config.BOLL_STD,
+                       initial_balance: float = config.DEFAULT_MARGIN, intrabar: bool = True,
+                       interval_ms: int = 0) -> Dict[str, Any]:
+    """
+    回放K线驱动状态机
+
+    Args:
+        candles: 时间升序的 (open_time, open, high, low, close)
+        intrabar: 是否模拟K线内的价格路径（开/高/低），否则只在收盘时评估
+        interval_ms: K线周期毫秒数，用于推算K线内的模拟时间
+
+    Returns:
+        dict: trades（交易列表）、equity（权益曲线）、summary（与 /api/profits_summary 相同的统计）
+    """
+    trader = SimTrader(initial_balance)
+    eng = BacktestEngine(trader, period, std)
+    equity: List[Tuple[int, float]] = []
+    step = interval_ms // 4 if interval_ms else 0
+
+    for open_time, o, h, l, c in candles:
+        if intrabar:
+            hi = lo = o
+            for i, p in enumerate(_intrabar_path(o, h, l, c)):
+                hi, lo = max(hi, p), min(lo, p)
+                trader.now_ms = open_time + i * step
+                await eng.on_tick(open_time, hi, lo, p, False)
+        trader.now_ms = open_time + (interval_ms or 1) - 1
+        await eng.on_tick(open_time, h, l, c, True)
+        equity.append((open_time, trader.equity(c)))
+
+    return {
+        "trades": trader.trades,
+        "equity": equity,
+        "summary": summarize(trader.trades, initial_balance, equity),
+        "final_state": eng.state,
+        "events": eng.events,
+    }
+
+
+def summarize(trades: List[Dict[str, Any]], initial_balance: float,
+              equity: Optional[List[Tuple[int, float]]] = None) -> Dict[str, Any]:
+    """按 /api/profits_summary 的口径统计：次数只计平仓，手续费计所有交易，净利润 = 盈亏 - 手续费"""
+    closes = [t for t in trades if t["side"] in ("CLOSE_LONG", "CLOSE_SHORT")]
+    total_profit = sum(t["pnl"] for t in closes)
+    total_fees = sum(t["fee"] for t in trades)
+    net_profit = total_profit - total_fees
+    summary = {
+        "trade_count": len(closes),
+        "profit_count": sum(1 for t in closes if t["pnl"] > 0),
+        "loss_count": sum(1 for t in closes if t["pnl"] < 0),
+        "total_fees": total_fees,
+        "profit": net_profit,
+        "profit_rate": (net_profit / initial_balance * 100) if initial_balance > 0 else 0.0,
+        "initial_balance": initial_balance,
+    }
+    if equity:
+        peak, max_dd = equity[0][1], 0.0
+        for _, v in equity:
+            peak = max(peak, v)
+            if peak > 0:
+                max_dd = max(max_dd, (peak - v) / peak)
+        summary["final_equity"] = equity[-1][1]
+        summary["max_drawdown_pct"] = max_dd * 100
+    return summary
+
+
+def load_klines_from_db(symbol: str = config.SYMBOL, interval: str = config.INTERVAL) -> List[Candle]:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT open_time, open, high, low, close FROM klines WHERE symbol=? AND interval=? ORDER BY open_time ASC",
+        (symbol, interval),
+    )
+    rows = [tuple(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def load_klines_from_file(path: str) -> List[Candle]:
+    """读取 CSV（币安K线导出格式，可带表头）或 JSON（REST klines 返回格式）"""
+    if path.endswith(".json"):
+        with open(path) as f:
+            raw = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            raw = [r for r in csv.reader(f) if r and r[0].strip().lstrip("-").isdigit()]
+    return [(int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4])) for r in raw]
+
+
+def load_klines_from_store(symbol: str = config.SYMBOL, interval: str = config.INTERVAL) -> List[Candle]:
+    from kline_store import get_store
+
+    cols = get_store(symbol, interval).range()
+    return list(zip(cols["open_time"].tolist(), cols["open"].tolist(), cols["high"].tolist(),
+                    cols["low"].tolist(), cols["close"].tolist()))
+
+
+def load_history(source: str = "db", symbol: str = config.SYMBOL, interval: str = config.INTERVAL) -> List[Candle]:
+    if source == "db":
+        candles = load_klines_from_db(symbol, interval)
+    elif source == "store":
+        # 列存储已按时间排序去重
+        return load_klines_from_store(symbol, interval)
+    else:
+        candles = load_klines_from_file(source)
+    # 去重并保证时间升序（旧数据可能存在重复K线）
+    dedup = {c[0]: c for c in candles}
+    return [dedup[t] for t in sorted(dedup)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BOLL 状态机回测")
+    parser.add_argument("--source", default="db", help="db、store（列式存储）或 K线文件路径（.csv/.json）")
+    parser.add_argument("--symbol", default=config.SYMBOL)
+    parser.add_argument("--interval", default=config.INTERVAL)
+    parser.add_argument("--period", type=int, default=config.BOLL_PERIOD)
+    parser.add_argument("--std", type=float, default=config.BOLL_STD)
+    parser.add_argument("--balance", type=float, default=config.DEFAULT_MARGIN)
+    parser.add_argument("--close-only", action="store_true", help="只在K线收盘时评估")
+    parser.add_argument("--output", help="将交易列表和权益曲线写入 JSON 文件")
+    args = parser.parse_args()
+
+    candles = load_history(args.source, args.symbol, args.interval)
+    print(f"加载 {len(candles)} 根K线: {args.symbol} {args.interval}")
+    if len(candles) < args.period:
+        print("K线数据不足")
+        return
+
+    t0 = time.perf_counter()
+    result = asyncio.run(run_backtest(candles, args.period, args.std, args.balance,
+                                      intrabar=not args.close_only, interval_ms=interval_to_ms(args.interval)))
+    elapsed = time.perf_counter() - t0
+
+    s = result["summary"]
+    print(f"回测完成，用时 {elapsed:.2f} 秒 ({len(candles) / elapsed:.0f} 根K线/秒)")
+    print(f"  交易次数: {s['trade_count']}  盈利: {s['profit_count']}  亏损: {s['loss_count']}")
+    print(f"  手续费: {s['total_fees']:.4f}  净利润: {s['profit']:.4f}  利润率: {s['profit_rate']:.2f}%")
+    print(f"  最终权益: {s.get('final_equity', args.balance):.4f}  最大回撤: {s.get('max_drawdown_pct', 0):.2f}%")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": s, "trades": result["trades"], "equity": result["equity"]}, f, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
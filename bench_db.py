@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+数据库连接微基准
+对比旧方式（每次调用新建连接、执行、提交、关闭）与连接池方式（线程复用长连接 + WAL）的单次调用延迟。
+
+用法:
+    python bench_db.py [次数]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import db  # noqa: E402
+from config import config  # noqa: E402
+
+
+# 旧方式使用独立的数据库文件（默认 DELETE 日志模式）
+OLD_DB_PATH = config.DB_PATH + ".old"
+
+
+def old_insert(i: int):
+    conn = sqlite3.connect(OLD_DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute("INSERT INTO logs(ts, level, message) VALUES (?, ?, ?)", (i, "INFO", f"bench {i}"))
+    conn.commit()
+    conn.close()
+
+
+def new_insert(i: int):
+    conn = db.get_conn()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO logs(ts, level, message) VALUES (?, ?, ?)", (i, "INFO", f"bench {i}"))
+    conn.commit()
+    conn.close()
+
+
+def old_select(i: int):
+    conn = sqlite3.connect(OLD_DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute("SELECT symbol, side, qty, entry_price, ts FROM positions WHERE symbol=?", (config.SYMBOL,))
+    cur.fetchone()
+    conn.close()
+
+
+def new_select(i: int):
+    db.get_position(config.SYMBOL)
+
+
+def bench(name: str, fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    per_call = (time.perf_counter() - t0) / n * 1e6
+    print(f"  {name:<24} {per_call:>10.1f} µs/次")
+    return per_call
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    db.init_db()
+    db.set_position(config.SYMBOL, "long", 0.01, 60000.0, 0)
+    conn = sqlite3.connect(OLD_DB_PATH)
+    conn.executescript(db.SCHEMA)
+    conn.execute("INSERT INTO positions(symbol, side, qty, entry_price, ts) VALUES (?, 'long', 0.01, 60000.0, 0)", (config.SYMBOL,))
+    conn.commit()
+    conn.close()
+    print(f"数据库: {config.DB_PATH}，每项 {n} 次")
+
+    old_w = bench("旧: 写入(连接/提交/关闭)", old_insert, n)
+    old_r = bench("旧: 查询(连接/关闭)", old_select, n)
+    new_w = bench("新: 写入(连接池+WAL)", new_insert, n)
+    new_r = bench("新: 查询(连接池)", new_select, n)
+
+    print(f"写入加速 {old_w / new_w:.1f}x，查询加速 {old_r / new_r:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
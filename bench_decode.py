@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+行情帧解码基准
+对每个可用的解码后端（ws_decode）测量组合流帧的解码吞吐，以及解码 + 路由到各交易对 Engine 的
+行情处理吞吐（未收盘帧不触发评估；收盘帧写入临时数据库），并与原来的 json.loads + 字典取值对比。
+
+行情数据默认由模拟交易所的价格路径生成（--symbols 个交易对的组合流，每根K线 --ticks 帧，最后一帧收盘），
+也可以用 --feed 读取录制的原始帧（ws_record.py 录制的 .wsrec 文件，或每行一帧的文本；单流或组合流格式均可）。
+
+用法:
+    python bench_decode.py [--symbols 200] [--frames 200000] [--ticks 20] [--feed data/ws_record/xxx.wsrec]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+
+# 临时数据库（收盘帧会写库，必须在导入项目模块前设置）
+_tmp = tempfile.mkdtemp(prefix="bench_decode_")
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["KLINE_STORE_ENABLED"] = "false"
+
+import time
+from typing import List
+
+from fake_exchange import Market, _fmt
+import ws_decode
+import ws_record
+
+
+class _NullTrader:
+    def get_balance(self) -> float:
+        return 1000.0
+
+
+def synth_feed(symbols: List[str], frames: int, ticks: int, seed: int = 1) -> List[str]:
+    """组合流格式的原始帧：各交易对轮流推送，每根1m K线 ticks 帧（最后一帧收盘）"""
+    rng = random.Random(seed)
+    markets = [Market(s, rng.uniform(1, 50000), 0.004, rng=rng) for s in symbols]
+    out = []
+    open_time = 1_700_000_000_000
+    while len(out) < frames:
+        candles = [m.next_candle() for m in markets]
+        for i in range(ticks):
+            closed = i == ticks - 1
+            for m, (o, h, l, c, v) in zip(markets, candles):
+                frac = (i + 1) / ticks
+                price = o + (c - o) * frac
+                k = {"t": open_time, "T": open_time + 59999, "s": m.symbol, "i": "1m", "o": _fmt(o),
+                     "c": _fmt(c if closed else price), "h": _fmt(max(h * frac + o * (1 - frac), price)),
+                     "l": _fmt(min(l * frac + o * (1 - frac), price)), "v": _fmt(v * frac), "x": closed}
+                data = {"e": "kline", "E": open_time + int(frac * 60000), "s": m.symbol, "k": k}
+                out.append(json.dumps({"stream": f"{m.symbol.lower()}@kline_1m", "data": data},
+                                      separators=(",", ":")))
+        open_time += 60000
+    return out[:frames]
+
+
+def _legacy(raw: str):
+    """原实现：json.loads 后逐个字段 get + float"""
+    data = json.loads(raw)
+    data = data.get("data", data)
+    k = data.get("k", {})
+    return (k.get("x", False), float(k.get("c", 0)), int(k.get("t", 0)), float(k.get("h", 0)),
+            float(k.get("l", 0)), float(k.get("o", 0)), float(k.get("v", 0)))
+
+
+def _rate(fn, frames: List[str]) -> float:
+    t0 = time.perf_counter()
+    for raw in frames:
+        fn(raw)
+    return len(frames) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情帧解码基准")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=200_000)
+    parser.add_argument("--ticks", type=int, default=20, help="每根K线的推送帧数（最后一帧收盘）")
+    parser.add_argument("--feed", help="录制的原始帧（.wsrec 或每行一帧的文本文件）")
+    args = parser.parse_args()
+
+    if args.feed:
+        if args.feed.endswith(".wsrec"):
+            frames = [raw for _, raw in ws_record.iter_frames(args.feed)][:args.frames]
+        else:
+            with open(args.feed) as f:
+                frames = [line.strip() for line in f if line.strip()][:args.frames]
+        symbols = sorted({ws_decode.KlineEvent.from_dict(json.loads(r).get("data") or json.loads(r)).symbol
+                          for r in frames[:10000]})
+        print(f"回放 {args.feed}: {len(frames)} 帧，{len(symbols)} 个交易对")
+    else:
+        symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+        frames = synth_feed(symbols, args.frames, args.ticks)
+        print(f"生成 {len(frames)} 帧组合流行情: {len(symbols)} 个交易对，每根K线 {args.ticks} 帧")
+    combined = frames[0].startswith('{"stream"')
+
+    from multi_engine import MultiEngine
+
+    print(f"{'后端':<10}{'解码(帧/秒)':>14}{'解码+路由(帧/秒)':>20}")
+    print(f"{'legacy':<10}{_rate(_legacy, frames):>14.0f}{'':>20}")
+    for name, ok in ws_decode.available().items():
+        if not ok:
+            print(f"{name:<10}{'未安装':>14}")
+            continue
+        decoder = ws_decode.get_decoder(name)
+        decode = decoder.decode_combined if combined else decoder.decode
+        decode_rate = _rate(decode, frames)
+
+        me = MultiEngine(symbols, trader=_NullTrader())
+        for eng in me.engines.values():
+            eng._last_eval_ts = float("inf")  # 只测行情处理，未收盘帧不触发评估
+            eng._request_evaluate = lambda: None
+        route = me.route_event
+        route_rate = _rate(lambda raw: route(decode(raw)), frames)
+        print(f"{name:<10}{decode_rate:>14.0f}{route_rate:>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+端到端基准（本地模拟交易所，无需网络）
+在同一进程中启动 fake_exchange，Engine/Trader 通过 FAKE_EXCHANGE 指向它，测量：
+  1. 行情吞吐：模拟交易所全速推送时引擎每秒处理的K线帧数
+  2. 下单往返：Trader.place_order / close_all 的延迟（含等待用户数据流成交推送）
+  3. tick 到下单：策略触发的订单到达交易所时距最近一帧行情推送的时间
+
+用法:
+    python bench_e2e.py [--seconds 10] [--orders 200] [--latency-ms 0]
+"""
+
+import argparse
+import os
+import socket
+import tempfile
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# 临时数据库与缓存，地址指向模拟交易所（必须在导入项目模块前设置）
+_tmp = tempfile.mkdtemp(prefix="bench_e2e_")
+_port = _free_port()
+os.environ.update({
+    "FAKE_EXCHANGE": f"127.0.0.1:{_port}",
+    "DB_PATH": os.path.join(_tmp, "bench.db"),
+    "KLINE_STORE_DIR": os.path.join(_tmp, "klines"),
+    "EXCHANGE_INFO_PATH": os.path.join(_tmp, "exchange_info.json"),
+    "INTERVAL": "1m",
+    "BOLL_PERIOD": os.environ.get("BOLL_PERIOD", "10"),
+    "BOLL_STD": os.environ.get("BOLL_STD", "1"),
+})
+
+import asyncio
+import time
+
+from config import config
+from fake_exchange import FakeExchange, _percentile
+
+
+def _summary(samples) -> str:
+    if not samples:
+        return "无样本"
+    return (f"n={len(samples)} p50={_percentile(samples, 0.5):.2f}ms p99={_percentile(samples, 0.99):.2f}ms "
+            f"max={max(samples):.2f}ms")
+
+
+async def run(args):
+    ex = FakeExchange([config.SYMBOL], speed=1e9, vol=0.004, latency_ms=args.latency_ms, seed=1)
+    runner = await ex.start("127.0.0.1", _port)
+    from engine import Engine
+
+    # Trader 初始化使用同步客户端（持仓模式、余额），放到线程中避免阻塞运行模拟交易所的事件循环
+    eng = await asyncio.to_thread(Engine)
+    await eng.bootstrap()
+    ws_task = asyncio.create_task(eng.run_ws())
+    while eng.trader.stream is not None and not eng.trader.stream.connected:
+        await asyncio.sleep(0.05)
+
+    # 1. 行情吞吐（模拟交易所全速推送，引擎同时运行策略并可能下单）
+    t0, ticks0 = time.perf_counter(), ex.frames_sent
+    await asyncio.sleep(args.seconds)
+    dt = time.perf_counter() - t0
+    frames = ex.frames_sent - ticks0
+    print(f"行情吞吐: {frames / dt:.0f} 帧/秒（{frames} 帧 / {dt:.1f} 秒），策略下单 {ex.orders} 笔")
+    print(f"tick 到下单: {_summary(list(ex.tick_to_order))}")
+    import metrics
+    print("各阶段延迟（引擎内打点）:")
+    for name, s in metrics.snapshot().items():
+        if s["count"]:
+            print(f"  {name:<14} n={s['count']:<7} p50={s['p50']:.3f}ms p99={s['p99']:.3f}ms max={s['max']:.3f}ms")
+    ws_task.cancel()
+    await asyncio.sleep(0.1)
+
+    # 2. 下单往返（停止策略后直接调用 Trader）
+    trader = eng.trader
+    opens, closes = [], []
+    t0 = time.perf_counter()
+    for i in range(args.orders):
+        s = time.perf_counter()
+        await trader.place_order("BUY" if i % 2 else "SELL", 0.01, ex.markets[config.SYMBOL].price)
+        opens.append((time.perf_counter() - s) * 1000)
+        s = time.perf_counter()
+        await trader.close_all(ex.markets[config.SYMBOL].price)
+        closes.append((time.perf_counter() - s) * 1000)
+    dt = time.perf_counter() - t0
+    print(f"开仓往返: {_summary(opens)}")
+    print(f"平仓往返: {_summary(closes)}")
+    print(f"下单吞吐: {2 * args.orders / dt:.0f} 笔/秒（串行，注入延迟 {args.latency_ms}ms）")
+
+    eng._user_stream_task.cancel()
+    await trader.close()
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准（本地模拟交易所）")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="模拟交易所 REST 注入延迟")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
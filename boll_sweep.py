@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+BOLL 参数网格扫描
+对 (period, std) 网格一次性计算布林带：每个 period 的滚动均值/标准差只算一次，
+所有 std 倍数通过广播共享；策略信号用查表方式对整个网格向量化执行（只在K线收盘时评估，
+与 `backtest.py --close-only` 口径一致），按扣除手续费后的净盈亏排序。
+不同 period 分块交给进程池并行。
+
+用法:
+    python boll_sweep.py --periods 10:50 --stds 1.0:3.5:0.1 --top 20
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import config
+
+# 状态编码（与 Engine 的状态机一一对应）
+(W, BUW, HS, SSL, SBM, SWP, SPT, BDW, HL, LSL, LAM, LWP, LPT) = range(13)
+STATE_NAMES = [
+    "waiting", "breakout_up_wait_fall", "holding_short", "short_stop_loss_wait_fall", "short_below_mid_wait",
+    "short_wait_profit", "short_profit_taken", "breakdown_dn_wait_bounce", "holding_long",
+    "long_stop_loss_wait_bounce", "long_above_mid_wait", "long_wait_profit", "long_profit_taken",
+]
+
+# 条件位（顺序与 condition_codes 中的移位一致）
+GT_UP, LT_MID, GT_MID, LT_DN, GT_DN, LT_UP = (1 << i for i in range(6))
+
+# 动作
+ACT_NONE, ACT_OPEN_SHORT, ACT_OPEN_LONG, ACT_CLOSE = range(4)
+
+
+def _transition(state: int, code: int):
+    """单次评估的状态转换（收盘价 == 实时价格），与 Engine._handle_state_transitions 保持一致"""
+    gt_up, lt_mid, gt_mid = code & GT_UP, code & LT_MID, code & GT_MID
+    lt_dn, gt_dn, lt_up = code & LT_DN, code & GT_DN, code & LT_UP
+
+    if state == W:
+        if gt_up:
+            return BUW, ACT_NONE
+        if lt_dn:
+            return BDW, ACT_NONE
+    elif state in (BUW, SSL):
+        if not gt_up and not lt_mid:
+            return HS, ACT_OPEN_SHORT
+    elif state == HS:
+        if gt_up:
+            return SSL, ACT_CLOSE
+        if lt_mid:
+            return SBM, ACT_NONE
+    elif state == SBM:
+        if gt_mid:
+            return SPT, ACT_CLOSE
+        if lt_dn:
+            return SWP, ACT_NONE
+    elif state in (BDW, LSL):
+        if gt_dn and not gt_mid:
+            return HL, ACT_OPEN_LONG
+    elif state == HL:
+        if lt_dn:
+            return LSL, ACT_CLOSE
+        if gt_mid:
+            return LAM, ACT_NONE
+    elif state == LAM:
+        if gt_up:
+            return LWP, ACT_NONE
+        if lt_mid:
+            return LPT, ACT_CLOSE
+    elif state == SWP:
+        if gt_dn:
+            return W, ACT_CLOSE
+    elif state == LWP:
+        if lt_up:
+            return W, ACT_CLOSE
+    elif state in (SPT, LPT):
+        return W, ACT_NONE
+    return state, ACT_NONE
+
+
+def _build_tables():
+    next_state = np.zeros(13 * 64, dtype=np.int8)
+    action = np.zeros(13 * 64, dtype=np.int8)
+    for s in range(13):
+        for code in range(64):
+            next_state[s * 64 + code], action[s * 64 + code] = _transition(s, code)
+    return next_state, action
+
+
+NEXT_STATE, ACTION = _build_tables()
+
+
+def rolling_mid_std(closes: np.ndarray, period: int):
+    """滚动均值与样本标准差（ddof=1），前 period-1 个位置为 NaN"""
+    n = len(closes)
+    mid = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    if n >= period:
+        win = sliding_window_view(closes, period)
+        mid[period - 1:] = win.mean(axis=1)
+        std[period - 1:] = win.std(axis=1, ddof=1)
+    return mid, std
+
+
+def condition_codes(closes: np.ndarray, periods: Sequence[int], stds: np.ndarray) -> np.ndarray:
+    """计算所有组合每根K线的条件位，返回 (n, len(periods) * len(stds)) 的 uint8 矩阵"""
+    blocks = []
+    for period in periods:
+        mid, std = rolling_mid_std(closes, period)
+        up = mid[None, :] + stds[:, None] * std[None, :]
+        dn = mid[None, :] - stds[:, None] * std[None, :]
+        c = closes[None, :]
+        code = (c > up).view(np.uint8)
+        code |= (c < mid).view(np.uint8) << 1
+        code |= (c > mid).view(np.uint8) << 2
+        code |= (c < dn).view(np.uint8) << 3
+        code |= (c > dn).view(np.uint8) << 4
+        code |= (c < up).view(np.uint8) << 5
+        blocks.append(code)
+    return np.ascontiguousarray(np.vstack(blocks).T)
+
+
+def simulate(closes: np.ndarray, codes: np.ndarray, initial_balance: float = config.DEFAULT_MARGIN,
+             fee_rate: float = config.FEE_RATE, leverage: int = config.LEVERAGE,
+             trade_percent: float = config.TRADE_PERCENT) -> Dict[str, np.ndarray]:
+    """对所有参数组合同时执行状态机，逐根K线推进"""
+    n, m = codes.shape
+    state = np.zeros(m, dtype=np.int16)
+    wallet = np.full(m, float(initial_balance))
+    direction = np.zeros(m)  # 1 多 / -1 空 / 0 空仓
+    qty = np.zeros(m)
+    entry = np.zeros(m)
+    fees = np.zeros(m)
+    closes_n = np.zeros(m, dtype=np.int64)
+    wins = np.zeros(m, dtype=np.int64)
+    losses = np.zeros(m, dtype=np.int64)
+    peak = wallet.copy()
+    max_dd = np.zeros(m)
+
+    for t in range(n):
+        c = closes[t]
+        idx = state * 64 + codes[t]
+        act = ACTION[idx]
+        new_state = NEXT_STATE[idx].astype(np.int16)
+        hit = np.flatnonzero(act)
+        if hit.size:
+            a = act[hit]
+            cl = hit[a == ACT_CLOSE]
+            if cl.size:
+                pnl = direction[cl] * (c - entry[cl]) * qty[cl]
+                fee = qty[cl] * c * fee_rate
+                wallet[cl] += pnl - fee
+                fees[cl] += fee
+                closes_n[cl] += 1
+                wins[cl] += pnl > 0
+                losses[cl] += pnl < 0
+                direction[cl] = 0.0
+                qty[cl] = 0.0
+            op = hit[a != ACT_CLOSE]
+            if op.size:
+                # 余额不足时下单失败，状态保持不变
+                bad = op[wallet[op] <= 0]
+                new_state[bad] = state[bad]
+                op = op[wallet[op] > 0]
+                q = wallet[op] * trade_percent * leverage / c
+                fee = q * c * fee_rate
+                wallet[op] -= fee
+                fees[op] += fee
+                qty[op] = q
+                entry[op] = c
+                direction[op] = np.where(act[op] == ACT_OPEN_LONG, 1.0, -1.0)
+        state = new_state
+        equity = wallet + direction * (c - entry) * qty
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_dd, (peak - equity) / np.where(peak > 0, peak, 1.0), out=max_dd)
+
+    final_equity = wallet + direction * (closes[-1] - entry) * qty if n else wallet
+    return {
+        "net_pnl": final_equity - initial_balance,
+        "final_equity": final_equity,
+        "trade_count": closes_n,
+        "profit_count": wins,
+        "loss_count": losses,
+        "total_fees": fees,
+        "max_drawdown_pct": max_dd * 100,
+        "final_state": state,
+    }
+
+
+def _sweep_chunk(closes: np.ndarray, periods: List[int], stds: np.ndarray, initial_balance: float) -> List[Dict[str, Any]]:
+    codes = condition_codes(closes, periods, stds)
+    res = simulate(closes, codes, initial_balance)
+    out = []
+    for i, period in enumerate(periods):
+        for j, std in enumerate(stds):
+            k = i * len(stds) + j
+            out.append({
+                "period": period,
+                "std": round(float(std), 6),
+                "net_pnl": float(res["net_pnl"][k]),
+                "profit_rate": float(res["net_pnl"][k] / initial_balance * 100) if initial_balance > 0 else 0.0,
+                "trade_count": int(res["trade_count"][k]),
+                "profit_count": int(res["profit_count"][k]),
+                "loss_count": int(res["loss_count"][k]),
+                "total_fees": float(res["total_fees"][k]),
+                "max_drawdown_pct": float(res["max_drawdown_pct"][k]),
+                "final_state": STATE_NAMES[int(res["final_state"][k])],
+            })
+    return out
+
+
+def sweep(closes: Sequence[float], periods: Sequence[int], stds: Sequence[float],
+          initial_balance: float = config.DEFAULT_MARGIN, workers: int = 0) -> List[Dict[str, Any]]:
+    """
+    扫描参数网格并按净盈亏降序返回
+
+    Args:
+        closes: 时间升序的收盘价
+        workers: 进程数，0 表示使用全部CPU核心，1 表示在当前进程内计算
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    stds = np.asarray(stds, dtype=np.float64)
+    periods = sorted(set(int(p) for p in periods))
+    workers = workers or os.cpu_count() or 1
+    chunks = [periods[i::workers] for i in range(min(workers, len(periods)))]
+
+    if workers == 1 or len(chunks) == 1:
+        results = _sweep_chunk(closes, periods, stds, initial_balance)
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            futures = [pool.submit(_sweep_chunk, closes, chunk, stds, initial_balance) for chunk in chunks]
+            for fut in futures:
+                results.extend(fut.result())
+    results.sort(key=lambda r: r["net_pnl"], reverse=True)
+    return results
+
+
+def _parse_range(spec: str, cast=float) -> List:
+    """解析 "start:stop[:step]"（含 stop）或逗号分隔列表"""
+    if ":" not in spec:
+        return [cast(x) for x in spec.split(",") if x]
+    parts = [float(x) for x in spec.split(":")]
+    start, stop = parts[0], parts[1]
+    step = parts[2] if len(parts) > 2 else 1
+    count = int(round((stop - start) / step)) + 1
+    return [cast(round(start + i * step, 10)) for i in range(count)]
+
+
+def main():
+    from backtest import load_history
+
+    parser = argparse.ArgumentParser(description="BOLL 参数网格扫描")
+    parser.add_argument("--source", default="db", help="db、store（列式存储）或 K线文件路径（.csv/.json）")
+    parser.add_argument("--symbol", default=config.SYMBOL)
+    parser.add_argument("--interval", default=config.INTERVAL)
+    parser.add_argument("--periods", default="10:50", help="例如 10:50 或 20,26,30")
+    parser.add_argument("--stds", default="1.0:3.5:0.1", help="例如 1.0:3.5:0.1 或 2.0,2.5")
+    parser.add_argument("--balance", type=float, default=config.DEFAULT_MARGIN)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="将全部结果写入 CSV 文件")
+    args = parser.parse_args()
+
+    candles = load_history(args.source, args.symbol, args.interval)
+    closes = np.array([c[4] for c in candles], dtype=np.float64)
+    periods = _parse_range(args.periods, int)
+    stds = _parse_range(args.stds, float)
+    print(f"加载 {len(closes)} 根K线，扫描 {len(periods)} x {len(stds)} = {len(periods) * len(stds)} 组参数")
+
+    t0 = time.perf_counter()
+    results = sweep(closes, periods, stds, args.balance, args.workers)
+    print(f"扫描完成，用时 {time.perf_counter() - t0:.2f} 秒")
+
+    print(f"{'period':>6} {'std':>5} {'净盈亏':>12} {'利润率%':>9} {'交易':>5} {'盈利':>5} {'亏损':>5} {'手续费':>10} {'回撤%':>7}")
+    for r in results[:args.top]:
+        print(f"{r['period']:>6} {r['std']:>5.2f} {r['net_pnl']:>12.4f} {r['profit_rate']:>9.2f} {r['trade_count']:>5} "
+              f"{r['profit_count']:>5} {r['loss_count']:>5} {r['total_fees']:>10.4f} {r['max_drawdown_pct']:>7.2f}")
+
+    if args.output:
+        import csv
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
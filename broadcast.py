@@ -0,0 +1,87 @@
+"""
+行情广播
+引擎每收到一帧行情只把最新字段写入该交易对的待发送帧（新值覆盖旧值），由独立的后台任务
+按固定帧率为每个有更新的交易对合并发送一条 'price_update'（带 symbol 字段），
+推送给页面的开销与行情频率、在线页面数量都无关，不会拖慢交易循环。
+"""
+
+import threading
+import time
+from typing import Any, Dict
+
+from config import config
+import exporter
+
+
+class TickBroadcaster:
+    def __init__(self, socketio, hz: float = config.BROADCAST_HZ, event: str = "price_update"):
+        self.socketio = socketio
+        self.hz = hz
+        self.event = event
+        self._frames: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.submitted = 0   # 收到的更新次数
+        self.coalesced = 0   # 被同一帧内更新覆盖（合并）的次数
+        self.sent = 0        # 实际发送的帧数
+        self.dropped = 0     # 发送过慢错过的帧数与发送失败的帧数
+        self.last_emit_ms = 0.0
+
+    def publish(self, symbol: str, **fields):
+        """合并字段到该交易对的待发送帧（交易循环中调用，只做内存操作）"""
+        with self._lock:
+            frame = self._frames.get(symbol)
+            if frame is None:
+                self._frames[symbol] = dict(fields, symbol=symbol)
+            else:
+                self.coalesced += 1
+                frame.update(fields)
+        self.submitted += 1
+        if not self._started:
+            self._start()
+
+    def _start(self):
+        self._started = True
+        self.socketio.start_background_task(self._run)
+
+    def _take(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            frames, self._frames = self._frames, {}
+        return frames
+
+    def _run(self):
+        period = 1.0 / self.hz
+        next_t = time.monotonic()
+        while True:
+            next_t += period
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                self.socketio.sleep(delay)
+            else:
+                # 上一帧发送耗时超过帧间隔，跳过错过的帧位，不追赶
+                self.dropped += int(-delay / period)
+                next_t = time.monotonic()
+            frames = self._take()
+            if not frames:
+                continue
+            t0 = time.perf_counter()
+            for frame in frames.values():
+                try:
+                    self.socketio.emit(self.event, frame)
+                    self.sent += 1
+                    exporter.SOCKETIO_EMITS.inc(1, self.event)
+                except Exception as e:  # pragma: no cover
+                    self.dropped += 1
+                    print(f"广播失败: {e}")
+            self.last_emit_ms = (time.perf_counter() - t0) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hz": self.hz,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "pending": len(self._frames),
+            "last_emit_ms": self.last_emit_ms,
+        }
@@ -3,11 +3,21 @@ import os
 class Config:
     # 基本设置
     SYMBOL: str = os.getenv("SYMBOL", "BTCUSDT")
+    # 同时交易的交易对（逗号分隔），多于一个时用组合流在一个进程内运行；页面显示第一个
+    SYMBOLS: list = [s.strip().upper() for s in os.getenv("SYMBOLS", SYMBOL).split(",") if s.strip()] or [SYMBOL]
+    if SYMBOL not in SYMBOLS:
+        SYMBOL = SYMBOLS[0]
     INTERVAL: str = os.getenv("INTERVAL", "15m")  # K线时间周期
     BOLL_PERIOD: int = int(os.getenv("BOLL_PERIOD", 26))
     BOLL_STD: float = float(os.getenv("BOLL_STD", 2.5))
     INITIAL_KLINES: int = int(os.getenv("INITIAL_KLINES", 50))
 
+    # 多周期：只订阅基础周期K线流，内存中合成高周期K线（INTERVAL 必须包含在内）
+    MTF_ENABLED: bool = os.getenv("MTF_ENABLED", "false").lower() == "true"
+    MTF_BASE_INTERVAL: str = os.getenv("MTF_BASE_INTERVAL", "1m")
+    MTF_INTERVALS: list = [s.strip() for s in os.getenv("MTF_INTERVALS", "5m,15m,1h,4h").split(",") if s.strip()]
+    MTF_CONFIRM_INTERVAL: str = os.getenv("MTF_CONFIRM_INTERVAL", "")  # 开仓需该周期BOLL确认（如 1h），为空不确认
+
     # 交易相关
     DEFAULT_MARGIN: float = 1000.0  # 模拟默认保证金余额 USDT
     TRADE_PERCENT: float = 0.7  # 交易金额占保证金的百分比
@@ -20,9 +30,48 @@ class Config:
     API_KEY: str = os.getenv("BINANCE_API_KEY", "yHEbiLZVNTpX81Vc6UYPJpIsPFa6P461R1OVHHq7JcLs60B4GPcVSEq7Chw8OCGG")
     API_SECRET: str = os.getenv("BINANCE_API_SECRET", "gwbbkf4uCPTJbMH6M3QZFJ4qtkqqzasg28vVZb20nkWwe7kDCZsSRSMjidHCb3Th")
 
+    # REST 客户端（连接池、超时与重试）
+    FUTURES_REST_URL: str = os.getenv("FUTURES_REST_URL", "")  # 为空时按 USE_TESTNET 选择官方地址
+    REST_TIMEOUT: float = float(os.getenv("REST_TIMEOUT", 5))  # 单次请求超时（秒）
+    REST_MAX_RETRIES: int = int(os.getenv("REST_MAX_RETRIES", 2))
+    REST_POOL_SIZE: int = int(os.getenv("REST_POOL_SIZE", 10))  # keep-alive 连接池大小
+    RECV_WINDOW: int = int(os.getenv("RECV_WINDOW", 5000))
+    USER_WS_URL: str = os.getenv("USER_WS_URL", "")  # 用户数据流地址，为空时按 USE_TESTNET 选择
+    USER_STREAM_ENABLED: bool = os.getenv("USER_STREAM_ENABLED", "true").lower() == "true"
+    USER_STREAM_FILL_TIMEOUT: float = float(os.getenv("USER_STREAM_FILL_TIMEOUT", 3))  # 等待成交推送的秒数
+    MARKET_REST_URL: str = os.getenv("MARKET_REST_URL", "https://fapi.binance.com")  # 行情数据（与K线 websocket 一致）
+    COMBINED_WS_URL: str = os.getenv("COMBINED_WS_URL", "wss://fstream.binance.com/stream")  # 多交易对组合流
+    MARKET_WS_URL: str = os.getenv("MARKET_WS_URL", "wss://fstream.binance.com/ws")  # 单交易对K线流
+    WS_DECODER: str = os.getenv("WS_DECODER", "auto")  # 行情帧解码后端：auto / msgspec / orjson / json
+    STREAMS_PER_CONNECTION: int = int(os.getenv("STREAMS_PER_CONNECTION", 200))  # 每个组合流连接订阅的流数量（交易所上限200）
+    # 行情录制（ws_record.py）：原始 websocket 帧连同接收时间追加到压缩分块文件，用于复现与压测
+    WS_RECORD_ENABLED: bool = os.getenv("WS_RECORD_ENABLED", "false").lower() == "true"
+    WS_RECORD_DIR: str = os.getenv("WS_RECORD_DIR", "data/ws_record")
+    WS_RECORD_ROTATE_MB: int = int(os.getenv("WS_RECORD_ROTATE_MB", 256))  # 单个文件超过该大小后新建文件
+
+    # 本地模拟交易所（fake_exchange.py）地址，如 127.0.0.1:8765；设置后所有 REST 与 websocket 地址都指向它
+    FAKE_EXCHANGE: str = os.getenv("FAKE_EXCHANGE", "")
+    if FAKE_EXCHANGE:
+        FUTURES_REST_URL = MARKET_REST_URL = f"http://{FAKE_EXCHANGE}"
+        MARKET_WS_URL = USER_WS_URL = f"ws://{FAKE_EXCHANGE}/ws"
+        COMBINED_WS_URL = f"ws://{FAKE_EXCHANGE}/stream"
+
+    # 历史K线补齐
+    BACKFILL_CONCURRENCY: int = int(os.getenv("BACKFILL_CONCURRENCY", 4))  # 并发请求数
+    BACKFILL_WEIGHT_BUDGET: int = int(os.getenv("BACKFILL_WEIGHT_BUDGET", 1200))  # 每分钟可用请求权重（交易所上限2400）
+
     # 数据库与日志
     DB_PATH: str = os.getenv("DB_PATH", "data/trading.db")
     LOG_DIR: str = os.getenv("LOG_DIR", "logs")
+    EXCHANGE_INFO_PATH: str = os.getenv("EXCHANGE_INFO_PATH", "data/exchange_info.json")  # 交易规则磁盘缓存
+    EXCHANGE_INFO_TTL: float = float(os.getenv("EXCHANGE_INFO_TTL", 6 * 3600))  # 交易规则刷新间隔（秒）
+    KLINE_STORE_DIR: str = os.getenv("KLINE_STORE_DIR", "data/klines")  # 列式K线存储目录
+    KLINE_STORE_ENABLED: bool = os.getenv("KLINE_STORE_ENABLED", "true").lower() == "true"  # K线同步写入列存储
+
+    # 热路径延迟统计
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_PERSIST_SEC: float = float(os.getenv("METRICS_PERSIST_SEC", 300))  # 分位数落库间隔（秒），0 不落库
+    APP_VERSION: str = os.getenv("APP_VERSION", "")  # 延迟快照的版本标记，为空时取 git 提交号
 
     # 自动重启
     AUTO_RESTART: bool = os.getenv("AUTO_RESTART", "true").lower() == "true"
@@ -30,6 +79,19 @@ class Config:
     # Web 服务
     WEB_HOST: str = os.getenv("WEB_HOST", "0.0.0.0")
     WEB_PORT: int = int(os.getenv("WEB_PORT", 5000))
+    BROADCAST_HZ: float = float(os.getenv("BROADCAST_HZ", 4))  # 实时价格推送帧率（每秒最多推送次数）
+    # 生产模式：eventlet / gevent（异步 worker，需安装对应包，未安装时退回 threading）
+    WEB_SERVER: str = os.getenv("WEB_SERVER", "threading").lower()
+    # 引擎运行方式：thread（与 Web 同进程）或 process（独立进程，经本地 Unix 套接字与 Web 通信）
+    ENGINE_MODE: str = os.getenv("ENGINE_MODE", "thread").lower()
+    ENGINE_IPC_PATH: str = os.getenv("ENGINE_IPC_PATH", "data/engine.sock")
+    ENGINE_SPAWN: bool = os.getenv("ENGINE_SPAWN", "true").lower() == "true"  # process 模式下由 Web 启动引擎子进程
+    ENGINE_CPUS: str = os.getenv("ENGINE_CPUS", "")  # 引擎进程绑定的 CPU（如 "0" 或 "0,1"），为空不绑定
+    WEB_CPUS: str = os.getenv("WEB_CPUS", "")  # Web 进程绑定的 CPU（如 "1-3"）
+    WEB_NICE: int = int(os.getenv("WEB_NICE", 5))  # process 模式下 Web 进程降低的调度优先级
+    ENGINE_SHM_NAME: str = os.getenv("ENGINE_SHM_NAME", "boll_engine_state")  # 引擎状态共享内存段名，为空不发布
+    ENGINE_SHM_HZ: float = float(os.getenv("ENGINE_SHM_HZ", 20))  # 共享内存快照更新频率
+    SHUTDOWN_DRAIN_SEC: float = float(os.getenv("SHUTDOWN_DRAIN_SEC", 10))  # 退出时等待进行中订单完成的秒数
 
 
 config = Config()
\ No newline at end of file
@@ -1,8 +1,17 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
+import weakref
+import atexit
+import functools
+from collections import deque
 from typing import Optional, List, Tuple, Dict, Any
 
 from config import config
+import events
+import exporter
 
 os.makedirs(os.path.dirname(config.DB_PATH), exist_ok=True)
 
@@ -28,7 +37,9 @@ CREATE TABLE IF NOT EXISTS trades (
     qty REAL NOT NULL,
     price REAL NOT NULL,
     pnl REAL DEFAULT 0,
-    simulate INTEGER DEFAULT 1
+    simulate INTEGER DEFAULT 1,
+    fee REAL DEFAULT 0.0,
+    trade_date TEXT -- 成交日期（UTC+8，与页面一致），写入时计算
 );
 
 CREATE TABLE IF NOT EXISTS positions (
@@ -47,6 +58,21 @@ CREATE TABLE IF NOT EXISTS logs (
     message TEXT NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS latency_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER NOT NULL,
+    version TEXT NOT NULL, -- 部署版本（git 提交号或 APP_VERSION）
+    stage TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    mean_ms REAL,
+    p50_ms REAL,
+    p90_ms REAL,
+    p99_ms REAL,
+    p999_ms REAL,
+    max_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_latency_version_stage ON latency_snapshots(version, stage);
+
 CREATE TABLE IF NOT EXISTS daily_profits (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     date TEXT NOT NULL UNIQUE, -- e.g. '2024-09-22'
@@ -56,15 +82,103 @@ CREATE TABLE IF NOT EXISTS daily_profits (
     loss_count INTEGER DEFAULT 0,
     profit_count INTEGER DEFAULT 0
 );
+
+-- 按日（UTC+8）的成交汇总，与 trades 在同一事务中增量更新
+CREATE TABLE IF NOT EXISTS daily_stats (
+    date TEXT PRIMARY KEY,
+    trade_count INTEGER NOT NULL DEFAULT 0, -- 全部成交（开仓+平仓）
+    close_count INTEGER NOT NULL DEFAULT 0, -- 平仓次数
+    profit_count INTEGER NOT NULL DEFAULT 0,
+    loss_count INTEGER NOT NULL DEFAULT 0,
+    pnl REAL NOT NULL DEFAULT 0.0, -- 平仓盈亏（未扣手续费）
+    fees REAL NOT NULL DEFAULT 0.0, -- 全部成交手续费
+    first_ts INTEGER,
+    last_ts INTEGER
+);
+
+-- 按交易对的成交汇总，与 daily_stats 同时维护
+CREATE TABLE IF NOT EXISTS symbol_stats (
+    symbol TEXT PRIMARY KEY,
+    trade_count INTEGER NOT NULL DEFAULT 0,
+    close_count INTEGER NOT NULL DEFAULT 0,
+    profit_count INTEGER NOT NULL DEFAULT 0,
+    loss_count INTEGER NOT NULL DEFAULT 0,
+    pnl REAL NOT NULL DEFAULT 0.0,
+    fees REAL NOT NULL DEFAULT 0.0,
+    first_ts INTEGER,
+    last_ts INTEGER
+);
 """
 
+TRADE_DATE_OFFSET_MS = 8 * 3600 * 1000  # 交易日按 UTC+8 划分
+CLOSE_SIDES = ("CLOSE_LONG", "CLOSE_SHORT")
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(config.DB_PATH, check_same_thread=False)
+
+def trade_date(ts: int) -> str:
+    """毫秒时间戳对应的交易日（UTC+8，YYYY-MM-DD）"""
+    return time.strftime("%Y-%m-%d", time.gmtime((ts + TRADE_DATE_OFFSET_MS) // 1000))
+
+
+# 连接池：每个线程复用一个长连接，线程结束后连接归还到空闲池供新线程使用
+_POOL_SIZE = 8
+_STATEMENT_CACHE = 256  # 每个连接缓存的预编译语句数
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # WAL 下只在检查点时 fsync
+    "PRAGMA cache_size=-16000",  # 16MB 页缓存
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+_local = threading.local()
+_idle: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
+
+
+class PooledConnection(sqlite3.Connection):
+    """线程复用的长连接：调用方的 close() 只回滚未提交的事务，不真正关闭连接"""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+def _connect() -> PooledConnection:
+    conn = sqlite3.connect(
+        config.DB_PATH,
+        check_same_thread=False,
+        factory=PooledConnection,
+        cached_statements=_STATEMENT_CACHE,
+    )
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def _release(conn: PooledConnection):
+    conn.close()
+    try:
+        _idle.put_nowait(conn)
+    except queue.Full:
+        conn.really_close()
+
+
+def get_conn() -> sqlite3.Connection:
+    """获取当前线程的数据库连接（首次调用时创建或从空闲池取出）"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        try:
+            conn = _idle.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        _local.conn = conn
+        weakref.finalize(threading.current_thread(), _release, conn)
+    return conn
+
+
 def _migrate_schema(conn: sqlite3.Connection):
     cur = conn.cursor()
     # 确保基础表存在
@@ -76,7 +190,55 @@ def _migrate_schema(conn: sqlite3.Connection):
         cur.execute("ALTER TABLE klines ADD COLUMN interval TEXT")
     # 补建索引（此时 interval 一定存在）
     cur.execute("CREATE INDEX IF NOT EXISTS idx_klines_sym_itv_time ON klines(symbol, interval, open_time)")
+    # 迁移：旧库 trades 无 fee / trade_date 列时新增，并回填交易日与按日汇总
+    cur.execute("PRAGMA table_info(trades)")
+    cols = {r[1] for r in cur.fetchall()}
+    if "fee" not in cols:
+        cur.execute("ALTER TABLE trades ADD COLUMN fee REAL DEFAULT 0.0")
+    if "trade_date" not in cols:
+        cur.execute("ALTER TABLE trades ADD COLUMN trade_date TEXT")
+    backfilled = cur.execute(
+        "UPDATE trades SET trade_date = DATE(datetime(ts/1000 + ?, 'unixepoch')) WHERE trade_date IS NULL",
+        (TRADE_DATE_OFFSET_MS // 1000,),
+    ).rowcount
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_date_side ON trades(trade_date, side)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_ts ON trades(symbol, ts)")
+    if (backfilled > 0 or not cur.execute("SELECT 1 FROM daily_stats LIMIT 1").fetchone()
+            or not cur.execute("SELECT 1 FROM symbol_stats LIMIT 1").fetchone()):
+        _rebuild_trade_stats(cur)
+    conn.commit()
+
+
+# 汇总表与分组列：(表名, 主键列, trades 中的分组表达式)
+_STATS_TABLES = (("daily_stats", "date", "trade_date"), ("symbol_stats", "symbol", "symbol"))
+
+
+def _rebuild_trade_stats(cur: sqlite3.Cursor):
+    """由 trades 全量重建 daily_stats / symbol_stats（迁移或手工修改 trades 后调用）"""
+    for table, key, expr in _STATS_TABLES:
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(
+            f"""
+            INSERT INTO {table}({key}, trade_count, close_count, profit_count, loss_count, pnl, fees, first_ts, last_ts)
+            SELECT {expr},
+                   COUNT(*),
+                   SUM(side IN {CLOSE_SIDES}),
+                   SUM(side IN {CLOSE_SIDES} AND pnl > 0),
+                   SUM(side IN {CLOSE_SIDES} AND pnl < 0),
+                   COALESCE(SUM(CASE WHEN side IN {CLOSE_SIDES} THEN pnl END), 0),
+                   COALESCE(SUM(fee), 0),
+                   MIN(ts),
+                   MAX(ts)
+            FROM trades GROUP BY {expr}
+            """
+        )
+
+
+def rebuild_trade_stats():
+    conn = get_conn()
+    _rebuild_trade_stats(conn.cursor())
     conn.commit()
+    conn.close()
 
 
 def init_db():
@@ -102,20 +264,29 @@ def init_db():
         if 'initial_balance' not in daily_columns:
             cur.execute("ALTER TABLE daily_profits ADD COLUMN initial_balance REAL DEFAULT 0.0")
         
-        # 检查trades表字段
-        cur.execute("PRAGMA table_info(trades)")
-        trade_columns = [row[1] for row in cur.fetchall()]
-        
-        if 'fee' not in trade_columns:
-            cur.execute("ALTER TABLE trades ADD COLUMN fee REAL DEFAULT 0.0")
-            
         conn.commit()
     except Exception as e:
         print(f"数据库迁移警告: {e}")
     
     conn.close()
+    log_writer.seed()
+
+
+def _timed_write(fn):
+    """记录写库函数的耗时（sqlite_write_seconds{op=函数名}）"""
+    op = fn.__name__
 
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            exporter.SQLITE_WRITE_SECONDS.observe(time.perf_counter() - t0, op)
+    return wrapper
 
+
+@_timed_write
 def insert_kline(rows: List[Tuple]):
     """插入K线。
     兼容两种元组长度：
@@ -143,6 +314,8 @@ def insert_kline(rows: List[Tuple]):
     )
     conn.commit()
     conn.close()
+    if normalized:
+        events.publish(events.KLINE, normalized)
 
 
 def latest_kline_time(symbol: str, interval: Optional[str] = None) -> Optional[int]:
@@ -170,27 +343,190 @@ def fetch_klines(symbol: str, limit: int = 500, interval: Optional[str] = None)
     return ordered
 
 
+class LogWriter:
+    """
+    异步日志管道
+    记录先进入内存环形缓冲（/api/logs 直接读取），再排队由后台线程批量事务写入 logs 表。
+    队列满时丢弃落库（环形缓冲仍保留）并计数，交易路径上的 log() 永远不会等待磁盘。
+    """
+
+    RING_SIZE = 1000
+    QUEUE_SIZE = 20000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.5  # 秒
+    RETRY_BACKOFF_MAX = 10.0  # 写入失败后的最长重试间隔（秒）
+
+    def __init__(self):
+        self.ring: deque = deque(maxlen=self.RING_SIZE)
+        self._pending: deque = deque()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._seeded = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+        self.max_pending = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, ts: int, level: str, message: str):
+        rec = (ts, level, message)
+        self.ring.append(rec)
+        pending = len(self._pending)
+        if pending >= self.QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self._pending.append(rec)
+        self.enqueued += 1
+        if pending >= self.max_pending:
+            self.max_pending = pending + 1
+        if self._thread is None:
+            self._start()
+        elif pending + 1 >= self.BATCH_SIZE:
+            self._wake.set()
+
+    def remember(self, ts: int, level: str, message: str):
+        """只进入环形缓冲，不落库（引擎进程已写入数据库的日志）"""
+        self.ring.append((ts, level, message))
+
+    def _start(self):
+        # submit 来自 Flask 线程、引擎事件循环与状态线程，只允许启动一个写入线程
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        backoff = self.FLUSH_INTERVAL
+        while True:
+            self._wake.wait(backoff)
+            self._wake.clear()
+            try:
+                self.flush()
+                backoff = self.FLUSH_INTERVAL
+            except Exception as e:
+                # 批次已放回队列，退避后重试（如 database is locked 超过 busy_timeout）
+                self.failures += 1
+                backoff = min(backoff * 2, self.RETRY_BACKOFF_MAX)
+                print(f"日志落库失败（{backoff:.1f} 秒后重试）: {e}")
+
+    def flush(self):
+        """把排队中的日志分批写入数据库"""
+        with self._flush_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.BATCH_SIZE:
+                    batch.append(self._pending.popleft())
+                t0 = time.perf_counter()
+                conn = get_conn()
+                try:
+                    conn.executemany("INSERT INTO logs(ts, level, message) VALUES (?, ?, ?)", batch)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    self._pending.extendleft(reversed(batch))
+                    raise
+                self.last_flush_ms = (time.perf_counter() - t0) * 1000
+                exporter.SQLITE_WRITE_SECONDS.observe(self.last_flush_ms / 1000, "logs")
+                self.written += len(batch)
+                self.batches += 1
+
+    def seed(self):
+        """启动时用数据库中最近的日志填充环形缓冲"""
+        if self._seeded:
+            return
+        self._seeded = True
+        room = self.RING_SIZE - len(self.ring)
+        if room <= 0:
+            return
+        # 只取早于缓冲中最早一条的记录，避免与已落库的本进程日志重复
+        before = self.ring[0][0] if self.ring else int(time.time() * 1000) + 1
+        conn = get_conn()
+        cur = conn.execute("SELECT ts, level, message FROM logs WHERE ts < ? ORDER BY ts DESC LIMIT ?", (before, room))
+        self.ring.extendleft(tuple(r) for r in cur.fetchall())
+
+    def recent(self, limit: int = 200, exclude_level: Optional[str] = "DEBUG") -> List[Dict[str, Any]]:
+        """最近的日志（时间倒序）"""
+        self.seed()
+        out = []
+        for ts, level, message in reversed(self.ring):
+            if level == exclude_level:
+                continue
+            out.append({"ts": ts, "level": level, "message": message})
+            if len(out) >= limit:
+                break
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "queue_size": self.QUEUE_SIZE,
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_flush_ms": self.last_flush_ms,
+            "ring_size": len(self.ring),
+        }
+
+
+log_writer = LogWriter()
+
+
 def log(level: str, message: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    import time
+    ts = int(time.time() * 1000)
+    log_writer.submit(ts, level, message)
+    events.publish(events.LOG, {"ts": ts, "level": level, "message": message})
 
-    cur.execute("INSERT INTO logs(ts, level, message) VALUES (?, ?, ?)", (int(time.time() * 1000), level, message))
-    conn.commit()
-    conn.close()
 
+def recent_logs(limit: int = 200) -> List[Dict[str, Any]]:
+    return log_writer.recent(limit)
 
+
+@_timed_write
 def add_trade(ts: int, symbol: str, side: str, qty: float, price: float, pnl: float = 0.0, simulate: bool = True, fee: float = 0.0):
+    date = trade_date(ts)
+    is_close = side in CLOSE_SIDES
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO trades(ts, symbol, side, qty, price, pnl, simulate, fee) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (ts, symbol, side, qty, price, pnl, 1 if simulate else 0, fee),
+        "INSERT INTO trades(ts, symbol, side, qty, price, pnl, simulate, fee, trade_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (ts, symbol, side, qty, price, pnl, 1 if simulate else 0, fee, date),
     )
+    # 按日、按交易对汇总与成交记录同一事务提交
+    figures = (int(is_close), int(is_close and pnl > 0), int(is_close and pnl < 0), pnl if is_close else 0.0,
+               fee or 0.0, ts, ts)
+    for (table, key, _), value in zip(_STATS_TABLES, (date, symbol)):
+        cur.execute(
+            f"""
+            INSERT INTO {table}({key}, trade_count, close_count, profit_count, loss_count, pnl, fees, first_ts, last_ts)
+            VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT({key}) DO UPDATE SET
+                trade_count = trade_count + 1,
+                close_count = close_count + excluded.close_count,
+                profit_count = profit_count + excluded.profit_count,
+                loss_count = loss_count + excluded.loss_count,
+                pnl = pnl + excluded.pnl,
+                fees = fees + excluded.fees,
+                first_ts = MIN(first_ts, excluded.first_ts),
+                last_ts = MAX(last_ts, excluded.last_ts)
+            """,
+            (value,) + figures,
+        )
     conn.commit()
     conn.close()
+    events.publish(events.TRADE, {"ts": ts, "symbol": symbol, "side": side, "qty": qty, "price": price,
+                                  "pnl": pnl, "simulate": 1 if simulate else 0, "fee": fee})
 
 
+@_timed_write
 def set_position(symbol: str, side: str, qty: float, entry_price: float, ts: int):
     conn = get_conn()
     cur = conn.cursor()
@@ -201,6 +537,7 @@ def set_position(symbol: str, side: str, qty: float, entry_price: float, ts: int
     )
     conn.commit()
     conn.close()
+    events.publish(events.POSITION, {"symbol": symbol, "side": side, "qty": qty, "entry_price": entry_price})
 
 
 def get_position(symbol: str) -> Optional[Dict[str, Any]]:
@@ -212,12 +549,14 @@ def get_position(symbol: str) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
+@_timed_write
 def close_position(symbol: str):
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("DELETE FROM positions WHERE symbol=?", (symbol,))
     conn.commit()
     conn.close()
+    events.publish(events.POSITION, {"symbol": symbol, "side": None})
 
 
 def get_daily_profit(date: str) -> Optional[Dict[str, Any]]:
@@ -230,6 +569,14 @@ def get_daily_profit(date: str) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
+def get_daily_stats(date: str) -> Optional[Dict[str, Any]]:
+    """指定交易日（UTC+8）的成交汇总"""
+    conn = get_conn()
+    row = conn.execute("SELECT * FROM daily_stats WHERE date=?", (date,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
 def get_daily_profits(limit: int = 30) -> List[Dict[str, Any]]:
     """获取最近的盈利记录，按日期降序排列"""
     conn = get_conn()
@@ -240,6 +587,7 @@ def get_daily_profits(limit: int = 30) -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+@_timed_write
 def update_daily_profit(date: str, trade_count: int, profit: float, profit_rate: float, loss_count: int = 0, profit_count: int = 0, total_fees: float = 0.0, initial_balance: float = 0.0):
     """更新或创建指定日期的盈利记录"""
     conn = get_conn()
@@ -259,4 +607,5 @@ def update_daily_profit(date: str, trade_count: int, profit: float, profit_rate:
         )
     
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    events.publish(events.PROFIT, {"date": date})
\ No newline at end of file
@@ -1,5 +1,4 @@
 import asyncio
-import json
 import time
 from typing import Deque, Dict, Any, List, Tuple
 from collections import deque
@@ -8,58 +7,99 @@ import pandas as pd
 import websockets
 
 from config import config
-from db import init_db, latest_kline_time, insert_kline, fetch_klines, log, get_position, get_daily_profit, update_daily_profit
-from indicators import bollinger_bands, calculate_boll_binance_compatible, calculate_boll_dynamic
+from db import (init_db, insert_kline, fetch_klines, log, get_position, get_daily_profit, update_daily_profit,
+                get_daily_stats, trade_date)
+from indicators import bollinger_bands, calculate_boll_binance_compatible, calculate_boll_dynamic, StreamingBoll
 from trader import Trader
-from datetime import datetime
+from broadcast import TickBroadcaster
+import kline_store
+from backfill import backfill_gap, interval_to_ms
+from aggregator import CandleAggregator, resample
+import metrics
+import exporter
+import ws_decode
+from ws_decode import KlineEvent
+import ws_record
+from rest_client import aiohttp
 
-KLINE_WS_URL = "wss://fstream.binance.com/ws"  # futures stream
-
-try:
-    from binance.client import Client as UMFutures  # type: ignore
-except ImportError:
-    try:
-        from binance.um_futures import UMFutures  # type: ignore
-    except ImportError:  # pragma: no cover
-        UMFutures = None  # type: ignore
+KLINE_WS_URL = config.MARKET_WS_URL  # futures stream
 
 
 class Engine:
-    def __init__(self, socketio=None):
+    # 状态机枚举（类属性，多交易对时各实例共享）
+    # 等待开仓状态
+    STATE_WAITING = "waiting"  # 等待开仓
+
+    # 开空相关状态
+    STATE_BREAKOUT_UP_WAIT_FALL = "breakout_up_wait_fall"  # 突破UP，等待跌破UP
+    STATE_HOLDING_SHORT = "holding_short"  # 持仓SHORT
+    STATE_SHORT_STOP_LOSS_WAIT_FALL = "short_stop_loss_wait_fall"  # 已止损SHORT，等待跌破UP
+    STATE_SHORT_BELOW_MID_WAIT = "short_below_mid_wait"  # 跌破中轨，等待突破中轨或跌破DN
+    STATE_SHORT_WAIT_PROFIT = "short_wait_profit"  # 等待止盈SHORT（收盘价跌破DN后等待实时价格>DN）
+    STATE_SHORT_PROFIT_TAKEN = "short_profit_taken"  # 已止盈SHORT，等待开仓
+
+    # 开多相关状态
+    STATE_BREAKDOWN_DN_WAIT_BOUNCE = "breakdown_dn_wait_bounce"  # 跌破DN，等待反弹到DN
+    STATE_HOLDING_LONG = "holding_long"  # 持仓LONG
+    STATE_LONG_STOP_LOSS_WAIT_BOUNCE = "long_stop_loss_wait_bounce"  # 已止损LONG，等待收盘价>DN
+    STATE_LONG_ABOVE_MID_WAIT = "long_above_mid_wait"  # 突破中轨，等待突破UP或跌破中轨
+    STATE_LONG_WAIT_PROFIT = "long_wait_profit"  # 等待止盈LONG（收盘价突破UP后等待实时价格<UP）
+    STATE_LONG_PROFIT_TAKEN = "long_profit_taken"  # 已止盈LONG，等待开仓
+
+    def __init__(self, socketio=None, trader=None, symbol=None, broadcaster=None, initial_balance=None):
         init_db()
-        self.trader = Trader()
-        self.initial_balance = self.trader.get_balance()
-        pos = get_position(config.SYMBOL)
+        self.symbol = symbol or config.SYMBOL
+        if config.KLINE_STORE_ENABLED:
+            # 补齐列存储落后于 SQLite 的部分，之后由 insert_kline 事件同步
+            kline_store.import_from_sqlite(self.symbol, config.INTERVAL)
+        self.trader = trader or Trader()
+        self.decoder = ws_decode.get_decoder()
+        # 多交易对共享一个 Trader 时由调用方传入余额，避免每个交易对各查询一次
+        self.initial_balance = initial_balance if initial_balance is not None else self.trader.get_balance()
+        pos = get_position(self.symbol)
         self.initial_capital = self.initial_balance
         self.socketio = socketio  # 添加socketio支持
-        
-        # 新的状态机枚举
-        # 等待开仓状态
-        self.STATE_WAITING = "waiting"  # 等待开仓
-        
-        # 开空相关状态
-        self.STATE_BREAKOUT_UP_WAIT_FALL = "breakout_up_wait_fall"  # 突破UP，等待跌破UP
-        self.STATE_HOLDING_SHORT = "holding_short"  # 持仓SHORT
-        self.STATE_SHORT_STOP_LOSS_WAIT_FALL = "short_stop_loss_wait_fall"  # 已止损SHORT，等待跌破UP
-        self.STATE_SHORT_BELOW_MID_WAIT = "short_below_mid_wait"  # 跌破中轨，等待突破中轨或跌破DN
-        self.STATE_SHORT_WAIT_PROFIT = "short_wait_profit"  # 等待止盈SHORT（收盘价跌破DN后等待实时价格>DN）
-        self.STATE_SHORT_PROFIT_TAKEN = "short_profit_taken"  # 已止盈SHORT，等待开仓
-        
-        # 开多相关状态  
-        self.STATE_BREAKDOWN_DN_WAIT_BOUNCE = "breakdown_dn_wait_bounce"  # 跌破DN，等待反弹到DN
-        self.STATE_HOLDING_LONG = "holding_long"  # 持仓LONG
-        self.STATE_LONG_STOP_LOSS_WAIT_BOUNCE = "long_stop_loss_wait_bounce"  # 已止损LONG，等待收盘价>DN
-        self.STATE_LONG_ABOVE_MID_WAIT = "long_above_mid_wait"  # 突破中轨，等待突破UP或跌破中轨
-        self.STATE_LONG_WAIT_PROFIT = "long_wait_profit"  # 等待止盈LONG（收盘价突破UP后等待实时价格<UP）
-        self.STATE_LONG_PROFIT_TAKEN = "long_profit_taken"  # 已止盈LONG，等待开仓
-        
+        # 行情按固定帧率合并推送，页面数量和行情频率不影响交易循环
+        self.broadcaster = broadcaster or (TickBroadcaster(socketio) if socketio else None)
+        self._init_state_machine()
+        if config.MTF_ENABLED:
+            # 多周期：只订阅基础周期K线，合成 INTERVAL 与其他周期，各周期独立维护增量BOLL
+            self.aggregator = CandleAggregator(config.MTF_BASE_INTERVAL,
+                                               dict.fromkeys(config.MTF_INTERVALS + [config.INTERVAL]))
+            self.mtf_boll = {itv: StreamingBoll(self.boll_period, self.boll_std)
+                             for itv in self.aggregator.frames if itv != config.INTERVAL}
+
+        # 根据现有持仓恢复状态
+        if pos and pos.get("side") == "long":
+            self.state = self.STATE_HOLDING_LONG
+            log("INFO", f"恢复状态为 {self.state}（检测到多仓持仓）")
+        elif pos and pos.get("side") == "short":
+            self.state = self.STATE_HOLDING_SHORT
+            log("INFO", f"恢复状态为 {self.state}（检测到空仓持仓）")
+
+    def _init_state_machine(self):
+        """初始化状态机与行情相关字段（回测引擎复用）"""
         # 初始化状态
         self.state = self.STATE_WAITING
         
-        self.prices: Deque[float] = deque(maxlen=1000)
+        # 最近成交价只用于状态页展示；保持较短，多交易对时每个交易对的常驻内存很小
+        self.prices: Deque[float] = deque(maxlen=100)
         self.last_price: float = 0.0
+        # 由 websocket K线帧驱动的增量BOLL（run_ws 连接前用数据库K线初始化）
+        self.boll_period: int = config.BOLL_PERIOD
+        self.boll_std: float = config.BOLL_STD
+        self.boll = StreamingBoll(self.boll_period, self.boll_std)
+        self.last_bands: Tuple[float, float, float] = (0.0, 0.0, 0.0)  # 最近一次评估的 UP/MID/DN
+        # 多周期聚合器与各周期BOLL（MTF_ENABLED 时在构造函数中创建）
+        self.aggregator = None
+        self.mtf_boll: Dict[str, StreamingBoll] = {}
         # 评估频率节流（用于未收盘K线内的即时评估）
         self._last_eval_ts: float = 0.0
+        self._eval_task = None
+        self._eval_pending = False
+        self.halted = False  # 退出前停止评估，不再下新单
+        self._frame_ns = 0  # 最新一帧行情的到达时间（延迟统计起点）
+        self.recorder = None  # 行情录制（WS_RECORD_ENABLED 时在 run_ws 中创建）
         # self.socketio 已在构造函数中设置，不要在这里重置
         self.last_trade_time = 0  # 上次交易时间戳
         self.trade_cooldown = 60000  # 交易冷却时间60秒(毫秒)
@@ -69,24 +109,81 @@ class Engine:
         # 用于跟踪状态变化，避免重复日志
         self._last_logged_state = None
 
-        # 根据现有持仓恢复状态
-        if pos and pos.get("side") == "long":
-            self.state = self.STATE_HOLDING_LONG
-            log("INFO", f"恢复状态为 {self.state}（检测到多仓持仓）")
-        elif pos and pos.get("side") == "short":
-            self.state = self.STATE_HOLDING_SHORT
-            log("INFO", f"恢复状态为 {self.state}（检测到空仓持仓）")
+    def _log(self, level: str, message: str):
+        """状态机日志（回测时重定向，不写数据库）"""
+        log(level, message)
+
+    def _now_ms(self) -> int:
+        """当前时间戳（毫秒），回测时使用K线时间"""
+        return int(time.time() * 1000)
     
-    def get_daily_initial_balance(self, date: str) -> float:
+    async def get_daily_initial_balance(self, date: str) -> float:
         """获取指定日期的初始余额，如果不存在则记录当前余额作为初始余额"""
         daily = get_daily_profit(date)
         if daily and daily.get('initial_balance', 0) > 0:
             return daily['initial_balance']
         else:
             # 如果没有记录初始余额，使用当前余额作为初始余额
-            current_balance = self.trader.get_balance()
+            current_balance = await self.trader.get_balance_async()
             return current_balance
 
+    def _seed_boll(self):
+        """用数据库中最近的已收盘K线重建增量BOLL（启动、重连、BOLL参数变更时调用）"""
+        boll = StreamingBoll(self.boll_period, self.boll_std)
+        boll.seed(fetch_klines(self.symbol, limit=self.boll_period))
+        self.boll = boll
+
+    def _seed_mtf(self):
+        """回放当前各周期桶内的基础K线，并重建高周期BOLL"""
+        agg = self.aggregator
+        agg.seed(fetch_klines(self.symbol, limit=agg.span_ms // agg.base_ms, interval=agg.base))
+        interval_ms = interval_to_ms(config.INTERVAL)
+        for itv in list(self.mtf_boll):
+            ms = agg.frames[itv]
+            rows = fetch_klines(self.symbol, limit=self.boll_period, interval=itv)
+            if len(rows) < self.boll_period:
+                # 该周期K线尚未积累够时由已存储的低周期K线合成，不单独下载历史
+                src, src_ms = (config.INTERVAL, interval_ms) if ms % interval_ms == 0 else (agg.base, agg.base_ms)
+                src_rows = fetch_klines(self.symbol, limit=(self.boll_period + 1) * (ms // src_ms), interval=src)
+                derived = resample(src_rows, src_ms, ms)
+                if len(derived) > len(rows):
+                    rows = derived
+            boll = StreamingBoll(self.boll_period, self.boll_std)
+            boll.seed(rows)
+            self.mtf_boll[itv] = boll
+
+    def _on_connect(self):
+        """(重)连接前用数据库补齐的K线重建增量状态，避免断线期间漏掉收盘K线"""
+        self._seed_boll()
+        if self.aggregator is not None:
+            self._seed_mtf()
+
+    def seed_rows(self) -> Dict[str, List[Dict[str, Any]]]:
+        """_on_connect 重建增量状态所读取的K线 {周期: rows}，录制时随连接一起保存，回放时写回数据库"""
+        if self.aggregator is None:
+            return {config.INTERVAL: fetch_klines(self.symbol, limit=self.boll_period)}
+        plan = dict(self.backfill_plan())
+        for itv in self.mtf_boll:
+            plan.setdefault(itv, self.boll_period)
+        return {itv: fetch_klines(self.symbol, limit=n, interval=itv) for itv, n in plan.items()}
+
+    def stream_name(self) -> str:
+        interval = self.aggregator.base if self.aggregator is not None else config.INTERVAL
+        return f"{self.symbol.lower()}@kline_{interval}"
+
+    def backfill_plan(self) -> List[Tuple[str, int]]:
+        """启动时需要补齐的 (周期, 最少根数)"""
+        if self.aggregator is None:
+            return [(config.INTERVAL, config.INITIAL_KLINES)]
+        agg = self.aggregator
+        interval_ms = interval_to_ms(config.INTERVAL)
+        # INTERVAL 的历史足够合成最长周期的BOLL；基础周期只需回放当前桶和合成低于 INTERVAL 的周期
+        longest = max(agg.frames.values(), default=interval_ms)
+        interval_n = max(config.INITIAL_KLINES, (self.boll_period + 1) * longest // interval_ms)
+        below = [ms for ms in agg.frames.values() if ms % interval_ms]
+        base_n = max([agg.span_ms] + [(self.boll_period + 1) * ms for ms in below]) // agg.base_ms
+        return [(config.INTERVAL, interval_n), (agg.base, base_n)]
+
     async def bootstrap(self):
         """
         初始化系统，确保数据库表结构存在并获取初始K线数据
@@ -96,73 +193,20 @@ class Engine:
             init_db()
             print("数据库表结构初始化完成")
             
-            if UMFutures is None:
-                print("UMFutures 未导入，无法获取历史 K 线。")
+            if aiohttp is None:
+                print("aiohttp 未安装，无法获取历史 K 线。")
                 return
-        
-            client = UMFutures()  # 公共端点无需密钥
-        
-            def get_interval_ms(itv: str) -> int:
-                num = int(itv[:-1])
-                unit = itv[-1]
-                if unit == 'm':
-                    return num * 60000
-                elif unit == 'h':
-                    return num * 3600000
-                elif unit == 'd':
-                    return num * 86400000
+
+            # 并发分页拉取缺失区间，逐页写库（中断后下次启动从最新K线继续）
+            for interval, initial in self.backfill_plan():
+                stats = await backfill_gap(self.symbol, interval, initial, now_ms=self._now_ms())
+                if stats["candles"]:
+                    log("INFO", f"bootstrap 插入/补齐 {stats['candles']} 条 K 线: {self.symbol} {interval} "
+                                f"({stats['pages']} 页, {stats['seconds']:.2f} 秒, {stats['rate']:.0f} 根/秒)")
+                    print(f"插入/补齐 {stats['candles']} 条 {interval} K 线，用时 {stats['seconds']:.2f} 秒（{stats['rate']:.0f} 根/秒）。")
                 else:
-                    raise ValueError(f"Unsupported interval: {itv}")
-        
-            interval_ms = get_interval_ms(config.INTERVAL)
-            last_time = latest_kline_time(config.SYMBOL, config.INTERVAL) or 0
-            current_time = int(time.time() * 1000)
-        
-            if last_time >= current_time - interval_ms:
-                print("K 线数据已是最新，无需补齐。")
-                return
-        
-            # 如果数据库为空，先获取初始 K 线
-            all_inserts: List[Tuple] = []
-            if last_time == 0:
-                data = await asyncio.to_thread(
-                    client.futures_klines, symbol=config.SYMBOL, interval=config.INTERVAL, limit=config.INITIAL_KLINES
-                )
-                print(f"从 API 获取到 {len(data)} 条初始 K 线数据。")
-                for k in data:
-                    ot = int(k[0])
-                    o, h, l, c, v, ct = float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6])
-                    all_inserts.append((config.SYMBOL, config.INTERVAL, ot, o, h, l, c, v, ct))
-                if data:
-                    last_time = max(int(d[0]) for d in data)
-        
-            # 补齐缺失 K 线
-            start_time = last_time + 1
-            while start_time < current_time - interval_ms:  # 只补齐到上一个已收盘 K 线
-                data = await asyncio.to_thread(
-                    client.futures_klines, symbol=config.SYMBOL, interval=config.INTERVAL, startTime=start_time, limit=500
-                )
-                if not data:
-                    break
-                print(f"从 API 获取到 {len(data)} 条补齐 K 线数据（从 {start_time} 开始）。")
-                for k in data:
-                    ot = int(k[0])
-                    if ot <= last_time:
-                        continue
-                    o, h, l, c, v, ct = float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6])
-                    all_inserts.append((config.SYMBOL, config.INTERVAL, ot, o, h, l, c, v, ct))
-                    last_time = ot
-                start_time = last_time + 1
-                if len(data) < 500:
-                    break
-        
-            if all_inserts:
-                insert_kline(all_inserts)
-                log("INFO", f"bootstrap 插入/补齐 {len(all_inserts)} 条 K 线: {config.SYMBOL} {config.INTERVAL}")
-                print(f"插入/补齐 {len(all_inserts)} 条 K 线。")
-            else:
-                log("INFO", "bootstrap 无需插入K线（已最新）")
-                print("无需插入 K 线。")
+                    log("INFO", f"bootstrap 无需插入{interval} K线（已最新）")
+                    print(f"{interval} K 线数据已是最新，无需补齐。")
         except Exception as e:  # pragma: no cover
             log("ERROR", f"bootstrap失败: {e}")
             print(f"bootstrap 失败: {e}")
@@ -170,69 +214,228 @@ class Engine:
     async def run_ws(self):
         # 不需要重复调用bootstrap，因为在run_web中已经调用过了
         # await self.bootstrap()
-        stream = f"{config.SYMBOL.lower()}@kline_{config.INTERVAL}"
-        url = f"{KLINE_WS_URL}/{stream}"
+        url = f"{KLINE_WS_URL}/{self.stream_name()}"
         print(f"正在连接WebSocket: {url}")
+        # 用户数据流（余额、持仓、成交）与行情流在同一事件循环中运行
+        self._user_stream_task = asyncio.create_task(self.trader.run_user_stream())
+        await self.trader.refresh_exchange_info()
+        if self.recorder is not None:
+            self.recorder.close()  # 重新运行（自动重启）时结束上一个会话的录制
+        self.recorder = ws_record.open_recorder([self.symbol], combined=False)
         while True:
             try:
+                self._on_connect()
+                if self.recorder is not None:
+                    self.recorder.mark_connect({self.symbol: self.seed_rows()})
                 async with websockets.connect(url, ping_interval=15, ping_timeout=15, max_queue=1000) as ws:
                     print("WebSocket连接成功，开始接收数据...")
                     await self._consume(ws)
             except Exception as e:  # pragma: no cover
                 log("ERROR", f"ws error: {e}")
                 print(f"WebSocket连接错误: {e}")
+                exporter.WS_RECONNECTS.inc(1, "market")
                 await asyncio.sleep(3)
                 continue
 
     async def _consume(self, ws):
+        decode = self.decoder.decode
+        record = self.recorder.append if self.recorder is not None else None
         async for msg in ws:
-            data = json.loads(msg)
-            k = data.get("k", {})
-            is_closed = k.get("x", False)
-            price = float(k.get("c", 0))
-            open_time = int(k.get("t", 0))
-            close = float(k.get("c", 0))
-            high = float(k.get("h", 0))
-            low = float(k.get("l", 0))
-            open_ = float(k.get("o", 0))
-            volume = float(k.get("v", 0))
-
-            self.last_price = price
-            self.prices.append(price)
-            if self.socketio:
-                self.socketio.emit('price_update', {'price': price})
-                print(f"WebSocket价格更新: {price}, 已通过SocketIO推送")
-
-            # 在未收盘期间也进行节流评估，以便尽早产生“突破/跌破”信号
-            now = time.time()
-            if now - self._last_eval_ts >= 1.0:  # 每秒最多一次
-                self._last_eval_ts = now
-                await self.evaluate()
+            t0 = time.perf_counter_ns()
+            if record is not None:
+                record(msg, t0)
+            exporter.WS_MESSAGES.inc()
+            ev = decode(msg)
+            metrics.observe("decode", t0)
+            self._on_kline(ev, t0)
 
+    def _on_message(self, data: Dict[str, Any], recv_ns: int = 0):
+        """处理一条已解析为字典的K线推送"""
+        self._on_kline(KlineEvent.from_dict(data), recv_ns)
+
+    def _on_kline(self, ev: KlineEvent, recv_ns: int = 0):
+        """
+        处理一条K线推送（单交易对连接与组合流路由共用）
+
+        只做内存中的行情更新；评估在独立任务中进行，下单等待不会阻塞后续推送的处理。
+        开盘价与成交量只在K线收盘（或多周期聚合）时才转换。
+        recv_ns 为收到该帧的单调时钟时间，作为延迟统计的起点。
+        """
+        start = time.perf_counter_ns()
+        self._frame_ns = recv_ns or start
+        is_closed = ev.is_closed
+        price = close = ev.price
+        open_time = ev.open_time
+
+        self.last_price = price
+        self.prices.append(price)
+        if self.broadcaster:
+            self.broadcaster.publish(self.symbol, price=price)
+
+        if self.aggregator is not None:
+            is_closed = self._on_base_candle(open_time, ev.open, ev.high, ev.low, close, ev.volume, is_closed)
+        else:
+            high, low = ev.high, ev.low  # 未收盘K线的典型价格需要最高/最低价
+            self.boll.update(open_time, high, low, close, is_closed)
             if is_closed:
                 insert_kline([
                     (
-                        config.SYMBOL,
+                        self.symbol,
                         config.INTERVAL,
                         open_time,
-                        open_,
+                        ev.open,
                         high,
                         low,
                         close,
-                        volume,
+                        ev.volume,
                         open_time + 1,
                     )
                 ])
+        metrics.observe("frame", start)
+        self._after_update(is_closed)
+
+    def _on_base_candle(self, open_time: int, o: float, h: float, l: float, c: float, v: float,
+                        is_closed: bool) -> bool:
+        """
+        多周期模式：一帧基础K线更新所有周期的K线与BOLL，本帧收盘的K线合并为一次写库
+
+        Returns:
+            bool: INTERVAL 周期的K线是否在本帧收盘
+        """
+        closed_rows = []
+        main_closed = False
+        for u in self.aggregator.update(open_time, o, h, l, c, v, is_closed):
+            if u.closed and u.complete:
+                closed_rows.append((self.symbol, u.interval, u.open_time, u.open, u.high, u.low, u.close,
+                                    u.volume, u.open_time + 1))
+            if u.interval == config.INTERVAL:
+                self.boll.update(u.open_time, u.high, u.low, u.close, u.closed)
+                main_closed = main_closed or u.closed
+            else:
+                boll = self.mtf_boll.get(u.interval)
+                if boll is not None:
+                    boll.update(u.open_time, u.high, u.low, u.close, u.closed)
+        if closed_rows:
+            insert_kline(closed_rows)
+        return main_closed
+
+    def _after_update(self, is_closed: bool):
+        if is_closed:
+            self._request_evaluate()
+            return
+
+        # 在未收盘期间也进行节流评估，以便尽早产生“突破/跌破”信号
+        now = self._now_ms() / 1000  # 回放时使用录制时间，节流结果与回放速度无关
+        if now - self._last_eval_ts >= 1.0:  # 每秒最多一次
+            self._last_eval_ts = now
+            self._request_evaluate()
+
+    def _request_evaluate(self):
+        """安排一次评估；评估进行中时只标记，结束后用最新行情再评估一次"""
+        if self.halted:
+            return
+        if self._eval_task is not None and not self._eval_task.done():
+            self._eval_pending = True
+            return
+        self._eval_task = asyncio.create_task(self._evaluate_loop())
+
+    async def _evaluate_loop(self):
+        while True:
+            self._eval_pending = False
+            # 以触发本次评估的最新一帧行情为起点打点
+            metrics.start_trace(self._frame_ns)
+            metrics.mark("queue")
+            t0 = time.perf_counter()
+            try:
                 await self.evaluate()
+            except Exception as e:  # pragma: no cover
+                self._log("ERROR", f"evaluate error: {e}")
+            exporter.EVALUATE.inc()
+            exporter.EVALUATE_SECONDS.observe(time.perf_counter() - t0)
+            if not self._eval_pending or self.halted:
+                break
+
+    async def drain(self, timeout: float = config.SHUTDOWN_DRAIN_SEC) -> bool:
+        """停止评估并等待进行中的评估（含下单与等待成交）完成；超时返回 False"""
+        self.halted = True
+        task = self._eval_task
+        if task is None or task.done():
+            return True
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        return bool(done)
 
     async def evaluate(self):
+        if self.boll.period != self.boll_period:
+            self._seed_boll()
+        self.boll.std_mult = self.boll_std
+
+        # 增量BOLL：纯内存计算，不阻塞事件循环
+        boll_result = None
+        if self.boll.ready:
+            try:
+                boll_result = self.boll.compute(self.last_price)
+            except ValueError:
+                pass
+
+        if boll_result is not None:
+            last_up = float(boll_result['up'])
+            last_mid = float(boll_result['mid'])
+            last_dn = float(boll_result['dn'])
+            if hasattr(self, '_last_boll_method') and self._last_boll_method != boll_result['method']:
+                self._log("INFO", f"BOLL计算方法切换: {boll_result['method']} (价格变化: {boll_result['price_change_pct']:.3f}%)")
+            self._last_boll_method = boll_result['method']
+            close_price = self.boll.last_close
+        else:
+            # 增量BOLL数据不足时回退到 REST/数据库计算
+            bands = await self._evaluate_bands_fallback()
+            if bands is None:
+                return
+            last_up, last_mid, last_dn, close_price = bands
+        metrics.mark("bands")
+        self.last_bands = (last_up, last_mid, last_dn)
+        current_price = float(self.last_price) if self.last_price != 0 else close_price
+        
+        if self.broadcaster:
+            # 与价格合并在同一帧 price_update 中推送
+            self.broadcaster.publish(
+                self.symbol,
+                boll_up=last_up,
+                boll_mid=last_mid,
+                boll_dn=last_dn,
+                close_price=close_price,
+                state=self.state,
+            )
+
+        # 只在状态发生变化时打印日志，避免重复输出
+        state_changed = self._last_logged_state != self.state
+        
+        if state_changed:
+            self._log("INFO", f"状态变化: {self.state}, 收盘价: {close_price:.2f}, UP: {last_up:.2f}, MID: {last_mid:.2f}, DN: {last_dn:.2f}")
+            self._last_logged_state = self.state
+
+        # 新的BOLL交易策略状态机
+        prev_state = self.state
+        await self._handle_state_transitions(close_price, current_price, last_up, last_mid, last_dn)
+        metrics.mark("state")
+        if self.state != prev_state:
+            exporter.STATE_TRANSITIONS.inc(1, self.state)
+
+    async def _evaluate_bands_fallback(self):
+        """
+        通过 REST/数据库计算BOLL，返回 (up, mid, dn, 收盘价)，数据不足时返回 None
+
+        含阻塞的 REST 请求与 pandas 计算，在线程中执行，不阻塞同一事件循环上其他交易对的行情与下单。
+        """
+        return await asyncio.to_thread(self._compute_bands_fallback, self.boll_period, self.boll_std)
+
+    def _compute_bands_fallback(self, period: int, std: float):
         try:
             # 使用动态BOLL计算策略
             boll_result = calculate_boll_dynamic(
-                config.SYMBOL, 
+                self.symbol, 
                 config.INTERVAL, 
-                config.BOLL_PERIOD, 
-                config.BOLL_STD
+                period, 
+                std
             )
             last_up = float(boll_result['up'])
             last_mid = float(boll_result['mid'])
@@ -244,65 +447,44 @@ class Engine:
             self._last_boll_method = boll_result['method']
             
             # 获取K线数据用于价格比较
-            rows = fetch_klines(config.SYMBOL, limit=max(60, config.BOLL_PERIOD + 5))
-            if len(rows) < config.BOLL_PERIOD:
-                return
+            rows = fetch_klines(self.symbol, limit=max(60, period + 5))
+            if len(rows) < period:
+                return None
             df = pd.DataFrame(rows)
         except Exception as e:
             log("ERROR", f"动态BOLL计算失败，回退到币安兼容方法: {e}")
             try:
                 # 回退到币安兼容方法
                 boll_result = calculate_boll_binance_compatible(
-                    config.SYMBOL, 
+                    self.symbol, 
                     config.INTERVAL, 
-                    config.BOLL_PERIOD, 
-                    config.BOLL_STD
+                    period, 
+                    std
                 )
                 last_up = float(boll_result['up'])
                 last_mid = float(boll_result['mid'])
                 last_dn = float(boll_result['dn'])
                 
-                rows = fetch_klines(config.SYMBOL, limit=max(60, config.BOLL_PERIOD + 5))
-                if len(rows) < config.BOLL_PERIOD:
-                    return
+                rows = fetch_klines(self.symbol, limit=max(60, period + 5))
+                if len(rows) < period:
+                    return None
                 df = pd.DataFrame(rows)
             except Exception as e2:
                 log("ERROR", f"币安兼容BOLL计算也失败，回退到原始方法: {e2}")
                 # 最后回退到原始方法
-                rows = fetch_klines(config.SYMBOL, limit=max(60, config.BOLL_PERIOD + 5))
-                if len(rows) < config.BOLL_PERIOD:
-                    return
+                rows = fetch_klines(self.symbol, limit=max(60, period + 5))
+                if len(rows) < period:
+                    return None
                 df = pd.DataFrame(rows)
                 # 计算基于闭合 K 线的 BOLL，以匹配 Binance 显示
-                mid, up, dn = bollinger_bands(df, config.BOLL_PERIOD, config.BOLL_STD, ddof=1)
+                mid, up, dn = bollinger_bands(df, period, std, ddof=1)
                 last_mid = float(mid.iloc[-1])
                 last_up = float(up.iloc[-1])
                 last_dn = float(dn.iloc[-1])
         
         # 使用K线收盘价而不是实时价格进行比较
         close_price = float(df["close"].iloc[-1])
-        current_price = float(self.last_price) if self.last_price != 0 else close_price
-        
-        if self.socketio:
-            boll_data = {
-                'boll_up': last_up, 
-                'boll_mid': last_mid, 
-                'boll_dn': last_dn,
-                'close_price': close_price,
-                'current_price': current_price,
-                'state': self.state
-            }
-            self.socketio.emit('boll_update', boll_data)
-
-        # 只在状态发生变化时打印日志，避免重复输出
-        state_changed = self._last_logged_state != self.state
-        
-        if state_changed:
-            log("INFO", f"状态变化: {self.state}, 收盘价: {close_price:.2f}, UP: {last_up:.2f}, MID: {last_mid:.2f}, DN: {last_dn:.2f}")
-            self._last_logged_state = self.state
-
-        # 新的BOLL交易策略状态机
-        await self._handle_state_transitions(close_price, current_price, last_up, last_mid, last_dn)
+        return last_up, last_mid, last_dn, close_price
 
     async def _handle_state_transitions(self, close_price: float, current_price: float, up: float, mid: float, dn: float):
         """处理状态转换的核心逻辑"""
@@ -312,29 +494,29 @@ class Engine:
         # 等待开仓状态：收盘价突破UP -> 突破UP等待跌破
         if self.state == self.STATE_WAITING and close_price > up:
             self.state = self.STATE_BREAKOUT_UP_WAIT_FALL
-            log("INFO", f"收盘价突破UP({up:.2f}) -> 标记状态：突破UP，等待跌破UP")
+            self._log("INFO", f"收盘价突破UP({up:.2f}) -> 标记状态：突破UP，等待跌破UP")
             return
             
         # 突破UP等待跌破：收盘价跌破UP -> 开空仓
         if self.state == self.STATE_BREAKOUT_UP_WAIT_FALL and close_price <= up:
             # 新增条件：如果收盘价小于中轨，则不开仓，继续等待
             if close_price < mid:
-                log("INFO", f"收盘价跌破UP({up:.2f})但小于中轨({mid:.2f}) -> 不开仓，继续等待")
+                self._log("INFO", f"收盘价跌破UP({up:.2f})但小于中轨({mid:.2f}) -> 不开仓，继续等待")
                 return
             if await self._place_short_order(current_price):
                 self.state = self.STATE_HOLDING_SHORT
-                log("INFO", f"收盘价跌破UP({up:.2f})且大于等于中轨({mid:.2f}) -> 开空仓，标记状态：持仓SHORT")
+                self._log("INFO", f"收盘价跌破UP({up:.2f})且大于等于中轨({mid:.2f}) -> 开空仓，标记状态：持仓SHORT")
             return
             
         # 已止损SHORT等待跌破：收盘价跌破UP -> 再次开空
         if self.state == self.STATE_SHORT_STOP_LOSS_WAIT_FALL and close_price <= up:
             # 新增条件：如果收盘价小于中轨，则不开仓，继续等待
             if close_price < mid:
-                log("INFO", f"收盘价跌破UP({up:.2f})但小于中轨({mid:.2f}) -> 不开仓，继续等待")
+                self._log("INFO", f"收盘价跌破UP({up:.2f})但小于中轨({mid:.2f}) -> 不开仓，继续等待")
                 return
             if await self._place_short_order(current_price):
                 self.state = self.STATE_HOLDING_SHORT
-                log("INFO", f"收盘价跌破UP({up:.2f})且大于等于中轨({mid:.2f}) -> 再次开空，标记状态：持仓SHORT")
+                self._log("INFO", f"收盘价跌破UP({up:.2f})且大于等于中轨({mid:.2f}) -> 再次开空，标记状态：持仓SHORT")
             return
             
         # 持仓SHORT的处理
@@ -343,13 +525,13 @@ class Engine:
             if close_price > up:
                 if await self.close_and_update_profit(current_price):
                     self.state = self.STATE_SHORT_STOP_LOSS_WAIT_FALL
-                    log("INFO", f"空仓止损：收盘价站上UP({up:.2f}) -> 平仓，标记状态：已止损SHORT，等待跌破UP")
+                    self._log("INFO", f"空仓止损：收盘价站上UP({up:.2f}) -> 平仓，标记状态：已止损SHORT，等待跌破UP")
                 return
                 
             # B. 止盈情况：收盘价跌破中轨
             if close_price < mid:
                 self.state = self.STATE_SHORT_BELOW_MID_WAIT
-                log("INFO", f"收盘价跌破中轨({mid:.2f}) -> 标记状态：跌破中轨，等待突破中轨或跌破DN")
+                self._log("INFO", f"收盘价跌破中轨({mid:.2f}) -> 标记状态：跌破中轨，等待突破中轨或跌破DN")
                 return
                 
         # 跌破中轨等待状态的处理
@@ -358,13 +540,13 @@ class Engine:
             if close_price > mid:
                 if await self.close_and_update_profit(current_price):
                     self.state = self.STATE_SHORT_PROFIT_TAKEN
-                    log("INFO", f"收盘价突破中轨({mid:.2f}) -> 止盈SHORT，标记状态：已止盈SHORT，等待开仓")
+                    self._log("INFO", f"收盘价突破中轨({mid:.2f}) -> 止盈SHORT，标记状态：已止盈SHORT，等待开仓")
                 return
                 
             # 收盘价跌破DN -> 标记为等待止盈状态
             if close_price < dn:
                 self.state = self.STATE_SHORT_WAIT_PROFIT
-                log("INFO", f"收盘价跌破DN({dn:.2f}) -> 标记状态：等待止盈SHORT（等待实时价格>DN）")
+                self._log("INFO", f"收盘价跌破DN({dn:.2f}) -> 标记状态：等待止盈SHORT（等待实时价格>DN）")
                 return
                 
 
@@ -374,29 +556,29 @@ class Engine:
         # 等待开仓状态：收盘价跌破DN -> 跌破DN等待反弹
         if self.state == self.STATE_WAITING and close_price < dn:
             self.state = self.STATE_BREAKDOWN_DN_WAIT_BOUNCE
-            log("INFO", f"收盘价跌破DN({dn:.2f}) -> 标记状态：跌破DN，等待反弹到DN")
+            self._log("INFO", f"收盘价跌破DN({dn:.2f}) -> 标记状态：跌破DN，等待反弹到DN")
             return
             
         # 跌破DN等待反弹：收盘价反弹至DN -> 开多仓
         if self.state == self.STATE_BREAKDOWN_DN_WAIT_BOUNCE and close_price > dn:
             # 新增条件：如果收盘价大于中轨，则不开仓，继续等待
             if close_price > mid:
-                log("INFO", f"收盘价反弹至DN({dn:.2f})但大于中轨({mid:.2f}) -> 不开仓，继续等待")
+                self._log("INFO", f"收盘价反弹至DN({dn:.2f})但大于中轨({mid:.2f}) -> 不开仓，继续等待")
                 return
             if await self._place_long_order(current_price):
                 self.state = self.STATE_HOLDING_LONG
-                log("INFO", f"收盘价反弹至DN({dn:.2f})且小于等于中轨({mid:.2f}) -> 开多仓，标记状态：持仓LONG")
+                self._log("INFO", f"收盘价反弹至DN({dn:.2f})且小于等于中轨({mid:.2f}) -> 开多仓，标记状态：持仓LONG")
             return
             
         # 已止损LONG等待反弹：收盘价反弹至DN -> 再次开多
         if self.state == self.STATE_LONG_STOP_LOSS_WAIT_BOUNCE and close_price > dn:
             # 新增条件：如果收盘价大于中轨，则不开仓，继续等待
             if close_price > mid:
-                log("INFO", f"收盘价反弹至DN({dn:.2f})但大于中轨({mid:.2f}) -> 不开仓，继续等待")
+                self._log("INFO", f"收盘价反弹至DN({dn:.2f})但大于中轨({mid:.2f}) -> 不开仓，继续等待")
                 return
             if await self._place_long_order(current_price):
                 self.state = self.STATE_HOLDING_LONG
-                log("INFO", f"收盘价反弹至DN({dn:.2f})且小于等于中轨({mid:.2f}) -> 再次开多，标记状态：持仓LONG")
+                self._log("INFO", f"收盘价反弹至DN({dn:.2f})且小于等于中轨({mid:.2f}) -> 再次开多，标记状态：持仓LONG")
             return
             
         # 持仓LONG的处理
@@ -405,13 +587,13 @@ class Engine:
             if close_price < dn:
                 if await self.close_and_update_profit(current_price):
                     self.state = self.STATE_LONG_STOP_LOSS_WAIT_BOUNCE
-                    log("INFO", f"多仓止损：收盘价跌破DN({dn:.2f}) -> 平仓，标记状态：已止损LONG，等待收盘价>DN")
+                    self._log("INFO", f"多仓止损：收盘价跌破DN({dn:.2f}) -> 平仓，标记状态：已止损LONG，等待收盘价>DN")
                 return
                 
             # B. 止盈情况：收盘价突破中轨
             if close_price > mid:
                 self.state = self.STATE_LONG_ABOVE_MID_WAIT
-                log("INFO", f"收盘价突破中轨({mid:.2f}) -> 标记状态：突破中轨，等待突破UP或跌破中轨")
+                self._log("INFO", f"收盘价突破中轨({mid:.2f}) -> 标记状态：突破中轨，等待突破UP或跌破中轨")
                 return
                 
         # 突破中轨等待状态的处理
@@ -419,14 +601,14 @@ class Engine:
             # 收盘价突破UP -> 标记为等待止盈状态
             if close_price > up:
                 self.state = self.STATE_LONG_WAIT_PROFIT
-                log("INFO", f"收盘价突破UP({up:.2f}) -> 标记状态：等待止盈LONG（等待实时价格<UP）")
+                self._log("INFO", f"收盘价突破UP({up:.2f}) -> 标记状态：等待止盈LONG（等待实时价格<UP）")
                 return
                 
             # 收盘价跌破中轨 -> 止盈LONG
             if close_price < mid:
                 if await self.close_and_update_profit(current_price):
                     self.state = self.STATE_LONG_PROFIT_TAKEN
-                    log("INFO", f"收盘价跌破中轨({mid:.2f}) -> 止盈LONG，标记状态：已止盈，等待开仓")
+                    self._log("INFO", f"收盘价跌破中轨({mid:.2f}) -> 止盈LONG，标记状态：已止盈，等待开仓")
                 return
                 
         # ==================== 等待止盈状态处理 ====================
@@ -436,7 +618,7 @@ class Engine:
             if current_price > dn:
                 if await self.close_and_update_profit(current_price):
                     self.state = self.STATE_WAITING
-                    log("INFO", f"实时价格({current_price:.2f})大于DN({dn:.2f}) -> 立即止盈SHORT，标记状态：等待开仓")
+                    self._log("INFO", f"实时价格({current_price:.2f})大于DN({dn:.2f}) -> 立即止盈SHORT，标记状态：等待开仓")
                 return
                 
         # 等待止盈LONG状态：实时价格小于UP时立即止盈
@@ -444,7 +626,7 @@ class Engine:
             if current_price < up:
                 if await self.close_and_update_profit(current_price):
                     self.state = self.STATE_WAITING
-                    log("INFO", f"实时价格({current_price:.2f})小于UP({up:.2f}) -> 立即止盈LONG，标记状态：等待开仓")
+                    self._log("INFO", f"实时价格({current_price:.2f})小于UP({up:.2f}) -> 立即止盈LONG，标记状态：等待开仓")
                 return
                 
         # ==================== 已止盈状态处理 ====================
@@ -452,80 +634,116 @@ class Engine:
         # 已止盈SHORT状态 -> 重新开始等待开仓
         if self.state == self.STATE_SHORT_PROFIT_TAKEN:
             self.state = self.STATE_WAITING
-            log("INFO", "已止盈SHORT -> 重新等待开仓机会")
+            self._log("INFO", "已止盈SHORT -> 重新等待开仓机会")
             return
             
         # 已止盈LONG状态 -> 重新开始等待开仓  
         if self.state == self.STATE_LONG_PROFIT_TAKEN:
             self.state = self.STATE_WAITING
-            log("INFO", "已止盈LONG -> 重新等待开仓机会")
+            self._log("INFO", "已止盈LONG -> 重新等待开仓机会")
             return
 
+    def _mtf_confirms(self, side: str, price: float) -> bool:
+        """
+        高周期BOLL确认开仓：开空要求价格不低于确认周期中轨，开多要求不高于
+        （未配置 MTF_CONFIRM_INTERVAL 或该周期BOLL数据不足时不限制）
+        """
+        itv = config.MTF_CONFIRM_INTERVAL
+        boll = self.mtf_boll.get(itv) if itv else None
+        if boll is None or not boll.ready:
+            return True
+        try:
+            mid = float(boll.compute(price)["mid"])
+        except ValueError:
+            return True
+        if (price >= mid) if side == "SELL" else (price <= mid):
+            return True
+        self._log("INFO", f"{itv} BOLL未确认{'开空' if side == 'SELL' else '开多'}：价格 {price:.2f}，{itv} 中轨 {mid:.2f}")
+        return False
+
     async def _place_short_order(self, current_price: float) -> bool:
         """下空单"""
-        current_time = int(time.time() * 1000)
+        metrics.mark("state")
+        current_time = self._now_ms()
         if current_time - self.last_trade_time < self.trade_cooldown:
-            log("INFO", f"交易冷却中，距离上次交易{(current_time - self.last_trade_time)/1000:.1f}秒")
+            self._log("INFO", f"交易冷却中，距离上次交易{(current_time - self.last_trade_time)/1000:.1f}秒")
+            return False
+        if not self._mtf_confirms("SELL", current_price):
             return False
             
-        balance = self.trader.get_balance()
+        balance = await self.trader.get_balance_async()
         if balance <= 0 or current_price <= 0 or config.LEVERAGE <= 0:
-            log("WARNING", "Insufficient balance, invalid price, or invalid leverage for short order")
+            self._log("WARNING", "Insufficient balance, invalid price, or invalid leverage for short order")
             return False
             
         margin = balance * config.TRADE_PERCENT
         qty = margin * config.LEVERAGE / current_price
         
         # 详细记录开仓计算过程
-        log("INFO", f"开空仓计算 - 余额: {balance:.2f}, 交易比例: {config.TRADE_PERCENT}, 杠杆: {config.LEVERAGE}X")
-        log("INFO", f"开空仓计算 - 分配保证金: {margin:.2f}, 价格: {current_price:.2f}, 数量: {qty:.6f}")
+        self._log("INFO", f"开空仓计算 - 余额: {balance:.2f}, 交易比例: {config.TRADE_PERCENT}, 杠杆: {config.LEVERAGE}X")
+        self._log("INFO", f"开空仓计算 - 分配保证金: {margin:.2f}, 价格: {current_price:.2f}, 数量: {qty:.6f}")
         
-        success = await self.trader.place_order("SELL", qty, current_price)
-        if success:
-            self.last_trade_time = current_time
-            log("INFO", f"开空仓成功: {qty:.6f} @ {current_price:.2f}")
-        return success
+        result = await self.trader.place_order("SELL", qty, current_price, symbol=self.symbol)
+        if isinstance(result, dict) and "error" in result:
+            # 本地规则校验或交易所拒单：不进入持仓状态，也不开始冷却
+            self._log("WARNING", f"开空仓失败: {result['error']}")
+            return False
+        if not result:
+            return False
+        self.last_trade_time = current_time
+        self._log("INFO", f"开空仓成功: {qty:.6f} @ {current_price:.2f}")
+        return True
 
     async def _place_long_order(self, current_price: float) -> bool:
         """下多单"""
-        current_time = int(time.time() * 1000)
+        metrics.mark("state")
+        current_time = self._now_ms()
         if current_time - self.last_trade_time < self.trade_cooldown:
-            log("INFO", f"交易冷却中，距离上次交易{(current_time - self.last_trade_time)/1000:.1f}秒")
+            self._log("INFO", f"交易冷却中，距离上次交易{(current_time - self.last_trade_time)/1000:.1f}秒")
+            return False
+        if not self._mtf_confirms("BUY", current_price):
             return False
             
-        balance = self.trader.get_balance()
+        balance = await self.trader.get_balance_async()
         if balance <= 0 or current_price <= 0 or config.LEVERAGE <= 0:
-            log("WARNING", "Insufficient balance, invalid price, or invalid leverage for long order")
+            self._log("WARNING", "Insufficient balance, invalid price, or invalid leverage for long order")
             return False
             
         margin = balance * config.TRADE_PERCENT
         qty = margin * config.LEVERAGE / current_price
         
         # 详细记录开仓计算过程
-        log("INFO", f"开多仓计算 - 余额: {balance:.2f}, 交易比例: {config.TRADE_PERCENT}, 杠杆: {config.LEVERAGE}X")
-        log("INFO", f"开多仓计算 - 分配保证金: {margin:.2f}, 价格: {current_price:.2f}, 数量: {qty:.6f}")
+        self._log("INFO", f"开多仓计算 - 余额: {balance:.2f}, 交易比例: {config.TRADE_PERCENT}, 杠杆: {config.LEVERAGE}X")
+        self._log("INFO", f"开多仓计算 - 分配保证金: {margin:.2f}, 价格: {current_price:.2f}, 数量: {qty:.6f}")
         
-        success = await self.trader.place_order("BUY", qty, current_price)
-        if success:
-            self.last_trade_time = current_time
-            log("INFO", f"开多仓成功: {qty:.6f} @ {current_price:.2f}")
-        return success
+        result = await self.trader.place_order("BUY", qty, current_price, symbol=self.symbol)
+        if isinstance(result, dict) and "error" in result:
+            # 本地规则校验或交易所拒单：不进入持仓状态，也不开始冷却
+            self._log("WARNING", f"开多仓失败: {result['error']}")
+            return False
+        if not result:
+            return False
+        self.last_trade_time = current_time
+        self._log("INFO", f"开多仓成功: {qty:.6f} @ {current_price:.2f}")
+        return True
 
 
 
     async def close_and_update_profit(self, price: float):
-        pos = get_position(config.SYMBOL)
+        metrics.mark("state")
+        pos = get_position(self.symbol)
         if not pos:
             return True  # 没有持仓，认为是成功的
         side = pos['side']
         entry_price = pos['entry_price']
         qty = pos['qty']
-        exit_price = await self.trader.close_all(price)
+        exit_price = await self.trader.close_all(price, symbol=self.symbol)
         if exit_price <= 0:
-            log("ERROR", f"平仓失败，exit_price={exit_price}")
+            self._log("ERROR", f"平仓失败，exit_price={exit_price}")
             return False  # 平仓失败
         this_profit = (exit_price - entry_price) * qty if side == 'long' else (entry_price - exit_price) * qty
-        date = datetime.now().date().isoformat()
+        # 交易日按 UTC+8 划分，与 trades.trade_date 和页面一致
+        date = trade_date(int(time.time() * 1000))
         daily = get_daily_profit(date)
         if daily is None:
             daily = {'trade_count': 0, 'profit': 0.0, 'profit_rate': 0.0, 'loss_count': 0, 'profit_count': 0}
@@ -534,14 +752,9 @@ class Engine:
         daily['trade_count'] += 1
         daily['profit'] += this_profit
         
-        # 计算当日手续费总和
-        from db import get_conn
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT SUM(fee) FROM trades WHERE date(datetime(ts/1000, 'unixepoch')) = ?", (date,))
-        total_fees_result = cur.fetchone()
-        total_fees = total_fees_result[0] if total_fees_result and total_fees_result[0] else 0.0
-        conn.close()
+        # 当日手续费总和（daily_stats 随成交增量更新，无需扫描 trades）
+        stats = get_daily_stats(date)
+        total_fees = stats['fees'] if stats else 0.0
         
         # 计算净利润（扣除手续费后的利润）
         net_profit = daily['profit'] - total_fees
@@ -553,14 +766,14 @@ class Engine:
             daily['loss_count'] = daily.get('loss_count', 0) + 1
         
         # 获取当日初始余额
-        daily_initial_balance = self.get_daily_initial_balance(date)
+        daily_initial_balance = await self.get_daily_initial_balance(date)
         
         # 如果是当日第一笔交易，记录初始余额
         if daily['trade_count'] == 1:
-            daily_initial_balance = self.trader.get_balance() - this_profit
+            daily_initial_balance = await self.trader.get_balance_async() - this_profit
         
         # 计算利润率：(当前余额 - 当日初始余额) / 当日初始余额
-        current_balance = self.trader.get_balance()
+        current_balance = await self.trader.get_balance_async()
         if daily_initial_balance > 0:
             daily['profit_rate'] = ((current_balance - daily_initial_balance) / daily_initial_balance) * 100
         else:
@@ -569,7 +782,7 @@ class Engine:
         update_daily_profit(date, daily['trade_count'], net_profit, daily['profit_rate'], 
                           daily.get('loss_count', 0), daily.get('profit_count', 0), total_fees, daily_initial_balance)
         
-        log("INFO", f"平仓成功，使用收盘价策略无需冷却期")
+        self._log("INFO", f"平仓成功，使用收盘价策略无需冷却期")
         
         return True  # 平仓成功
 
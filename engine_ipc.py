@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+引擎进程隔离（ENGINE_MODE=process）
+交易引擎在独立进程中运行（可用 ENGINE_CPUS 绑定 CPU），Web 进程只负责页面与接口（可降低优先级、
+使用 eventlet/gevent 异步 worker），页面负载不会抢占交易循环的 CPU 与 GIL。
+
+两个进程通过本地 Unix 套接字通信，每行一条 JSON：
+    引擎 -> Web   {"t": "event", "topic", "data"}   事件总线消息（新日志、成交、持仓、K线收盘、盈利）
+                  {"t": "emit", "event", "data"}    合并后的实时价格帧，Web 直接推送给页面
+                  {"t": "status", "data"}           状态快照（状态机、最新价格、BOLL参数等，每 0.5 秒）
+                  {"t": "reply", "id", "ok", ...}   请求的结果
+    Web -> 引擎   {"id", "op", "args"}              查询持仓/余额/延迟统计、修改BOLL参数
+引擎侧只做非阻塞写入，Web 进程读取过慢时丢弃消息（计数），不会反压交易循环。
+
+退出（SIGTERM/SIGINT）时先停止评估、等待进行中的下单与成交确认完成（最多 SHUTDOWN_DRAIN_SEC 秒），
+再关闭 REST 连接；日志与延迟统计由 atexit 落库。
+
+用法:
+    ENGINE_MODE=process python webapp.py                       # Web 进程自动启动引擎子进程
+    ENGINE_MODE=process ENGINE_SPAWN=false python webapp.py    # 引擎由进程管理器单独运行:
+    python engine_ipc.py
+多个 Web 进程（ENGINE_SPAWN=false）可以同时连接同一个引擎进程，并读取同一段共享内存快照（见 shm_state.py）。
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+from config import config
+from db import log, log_writer
+import events
+import exporter
+import metrics
+import shm_state
+
+STATUS_INTERVAL = 0.5  # 状态快照推送间隔（秒）
+MAX_BUFFER = 4 * 1024 * 1024  # 单个 Web 连接的写缓冲上限，超过即丢弃消息
+IPC_TIMEOUT = 5.0  # Web 侧请求超时（秒）
+RECONNECT_DELAY = 1.0
+
+TOPICS = (events.LOG, events.TRADE, events.POSITION, events.KLINE, events.PROFIT)
+
+
+def _default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    return str(o)
+
+
+def _encode(msg: Dict[str, Any]) -> bytes:
+    return (json.dumps(msg, default=_default, separators=(",", ":")) + "\n").encode()
+
+
+def _parse_cpus(spec: str) -> Set[int]:
+    """"0,2-3" -> {0, 2, 3}"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def apply_cpu_policy(cpus: str = "", nice: int = 0):
+    """绑定当前进程的 CPU 并降低调度优先级（平台不支持或无权限时忽略）"""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, _parse_cpus(cpus))
+            print(f"进程 {os.getpid()} 绑定 CPU: {cpus}")
+        except (OSError, ValueError) as e:
+            print(f"绑定 CPU 失败 {cpus}: {e}")
+    if nice > 0:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            print(f"调整优先级失败: {e}")
+
+
+async def shutdown(eng, timeout: float = config.SHUTDOWN_DRAIN_SEC):
+    """优雅退出：停止评估，等待进行中的订单完成后关闭用户数据流与 REST 连接"""
+    if await eng.drain(timeout):
+        log("INFO", "退出前进行中的订单已全部完成")
+    else:
+        log("WARNING", f"退出时仍有订单未完成（已等待 {timeout} 秒）")
+    task = getattr(eng, "_user_stream_task", None)
+    if task is not None:
+        task.cancel()
+    await eng.trader.close()
+
+
+# ==================== 引擎进程 ====================
+
+class _Emitter:
+    """TickBroadcaster 使用的 socketio 替身：合并后的价格帧转发给 Web 进程"""
+
+    def __init__(self, service: "EngineService"):
+        self.service = service
+
+    def emit(self, event: str, data: Any):
+        self.service.send({"t": "emit", "event": event, "data": data})
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def start_background_task(self, target, *args):
+        t = threading.Thread(target=target, args=args, name="ipc-broadcast", daemon=True)
+        t.start()
+        return t
+
+
+class EngineService:
+    def __init__(self, path: str = config.ENGINE_IPC_PATH):
+        self.path = path
+        self.eng = None
+        self.primary = None
+        self.engines: Dict[str, Any] = {}
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self.sent = 0
+        self.dropped = 0
+
+    # ---------- 发送 ----------
+
+    def send(self, msg: Dict[str, Any]):
+        """发给所有已连接的 Web 进程（任意线程可调用，不阻塞）"""
+        if not self._writers:
+            return
+        data = _encode(msg)
+        if threading.get_ident() == self._loop_thread:
+            self._broadcast(data)
+        else:
+            self._loop.call_soon_threadsafe(self._broadcast, data)
+
+    def _broadcast(self, data: bytes):
+        for writer in list(self._writers):
+            self._write(writer, data)
+
+    def _write(self, writer: asyncio.StreamWriter, data: bytes):
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.dropped += 1
+            return
+        writer.write(data)
+        self.sent += 1
+
+    def _subscribe(self):
+        for topic in TOPICS:
+            events.subscribe(topic, lambda payload, topic=topic: self.send({"t": "event", "topic": topic, "data": payload}))
+
+    # ---------- 状态与请求 ----------
+
+    def _status_payload(self) -> Dict[str, Any]:
+        p = self.primary
+        mtf = {}
+        for itv, boll in p.mtf_boll.items():
+            try:
+                r = boll.compute(p.last_price or None)
+                mtf[itv] = {"up": float(r["up"]), "mid": float(r["mid"]), "dn": float(r["dn"]), "ready": True}
+            except ValueError:
+                mtf[itv] = {"ready": False}
+        out = {
+            "pid": os.getpid(),
+            "symbol": p.symbol,
+            "state": p.state,
+            "last_price": p.last_price,
+            "prices": list(p.prices),
+            "boll_period": p.boll_period,
+            "boll_std": p.boll_std,
+            "halted": p.halted,
+            "mtf": mtf,
+            "engines": {s: [e.state, e.last_price] for s, e in self.engines.items()},
+            "broadcast": p.broadcaster.stats() if p.broadcaster else None,
+            "ipc": {"sent": self.sent, "dropped": self.dropped, "clients": len(self._writers)},
+        }
+        if self.eng is not p:
+            out["messages"] = self.eng.messages
+            out["unrouted"] = self.eng.unrouted
+        return out
+
+    async def _dispatch(self, op: str, args: Dict[str, Any]):
+        p = self.primary
+        if op == "status":
+            return self._status_payload()
+        if op == "positions":
+            return await p.trader.get_positions_async()
+        if op == "balance":
+            return await p.trader.get_balance_async()
+        if op == "set_boll":
+            # 组合流下所有交易对一起更新
+            for e in self.engines.values():
+                if "period" in args:
+                    config.BOLL_PERIOD = e.boll_period = int(args["period"])
+                if "std" in args:
+                    config.BOLL_STD = e.boll_std = float(args["std"])
+            return {"period": p.boll_period, "std": p.boll_std}
+        if op == "metrics":
+            version = metrics.persister.version or await asyncio.to_thread(metrics.app_version)
+            return {"version": version, "stages": metrics.snapshot()}
+        raise ValueError(f"未知请求: {op}")
+
+    async def _handle(self, writer: asyncio.StreamWriter, req: Dict[str, Any]):
+        try:
+            result = await self._dispatch(req.get("op"), req.get("args") or {})
+            reply = {"t": "reply", "id": req.get("id"), "ok": True, "result": result}
+        except Exception as e:
+            reply = {"t": "reply", "id": req.get("id"), "ok": False, "error": str(e)}
+        self._write(writer, _encode(reply))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        self._write(writer, _encode({"t": "status", "data": self._status_payload()}))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = json.loads(line)
+                except ValueError:
+                    continue
+                asyncio.create_task(self._handle(writer, req))
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _status_loop(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            if self._writers:
+                self.send({"t": "status", "data": self._status_payload()})
+
+    # ---------- 运行 ----------
+
+    async def run(self):
+        from engine import Engine
+        from multi_engine import MultiEngine
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        emitter = _Emitter(self)
+        if len(config.SYMBOLS) > 1:
+            self.eng = MultiEngine(config.SYMBOLS, socketio=emitter)
+            self.primary = self.eng.primary
+            self.engines = self.eng.engines
+        else:
+            self.eng = self.primary = Engine(socketio=emitter)
+            self.engines = {self.eng.symbol: self.eng}
+        await self.eng.bootstrap()
+        self._subscribe()
+        metrics.persister.start()
+        # 状态快照写入共享内存（主交易对在前），Web 进程无需请求即可读取
+        state_writer = None
+        if config.ENGINE_SHM_NAME:
+            ordered = [self.primary] + [e for e in self.engines.values() if e is not self.primary]
+            state_writer = shm_state.StateWriter(ordered, self.primary.trader)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 上次异常退出留下的套接字文件
+        server = await asyncio.start_unix_server(self._serve, path=self.path)
+        print(f"引擎进程 {os.getpid()} 已启动，IPC: {self.path}")
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self._loop.add_signal_handler(sig, stop.set)
+        tasks = [asyncio.create_task(self.eng.run_ws()), asyncio.create_task(self._status_loop())]
+        if state_writer is not None:
+            tasks.append(asyncio.create_task(state_writer.run()))
+        await stop.wait()
+
+        print("引擎进程收到退出信号，等待进行中的订单完成...")
+        await shutdown(self.eng)
+        for task in tasks:
+            task.cancel()
+        server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.sleep(0.1)  # 连接处理协程读到 EOF 后正常结束
+        if state_writer is not None:
+            state_writer.publish()  # 让读者看到 halted
+            state_writer.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# ==================== Web 进程 ====================
+
+class EngineUnavailable(ConnectionError):
+    """引擎进程未连接或请求超时"""
+
+
+class EngineStatus(NamedTuple):
+    state: str
+    last_price: float
+
+
+class _Bands:
+    """引擎进程按最新价格算好的某周期BOLL（接口与 StreamingBoll.compute 一致）"""
+
+    def __init__(self, values: Dict[str, Any]):
+        self.values = values
+
+    def compute(self, price: Optional[float] = None) -> Dict[str, float]:
+        if not self.values.get("ready"):
+            raise ValueError("K线数量不足")
+        return self.values
+
+
+class _TraderProxy:
+    def __init__(self, proxy: "EngineProxy"):
+        self.proxy = proxy
+
+    def get_positions(self) -> List[Dict[str, Any]]:
+        return self.proxy.call("positions")
+
+    def get_balance(self) -> float:
+        snap = self.proxy.snapshot()
+        return snap.balance if snap is not None else self.proxy.call("balance")
+
+
+class _BroadcasterProxy:
+    def __init__(self, proxy: "EngineProxy"):
+        self.proxy = proxy
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.proxy._status.get("broadcast") or {}, ipc=self.proxy._status.get("ipc"))
+
+
+class EngineProxy:
+    """
+    Web 进程中的引擎代理，提供 webapp 用到的 Engine/MultiEngine 属性：
+    价格、状态机、BOLL参数与余额优先读取共享内存快照（shm_state，无锁、不发请求），
+    其余状态读取引擎进程推送的快照，持仓等查询转为 IPC 请求；
+    引擎进程的事件重新发布到本进程事件总线（驱动页面增量推送与接口缓存失效），价格帧直接推送给页面。
+    """
+
+    def __init__(self, socketio, path: str = config.ENGINE_IPC_PATH):
+        self.socketio = socketio
+        self.path = path
+        self.child: Optional[subprocess.Popen] = None
+        self.trader = _TraderProxy(self)
+        self._broadcaster = _BroadcasterProxy(self)
+        self._status: Dict[str, Any] = {}
+        self.shm = shm_state.StateReader() if config.ENGINE_SHM_NAME else None
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, list] = {}
+        self._ids = itertools.count(1)
+
+    # ---------- 连接 ----------
+
+    def spawn(self):
+        """启动引擎子进程"""
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine_ipc.py")
+        self.child = subprocess.Popen([sys.executable, script])
+        print(f"引擎子进程已启动: pid={self.child.pid}")
+
+    def start(self):
+        threading.Thread(target=self._run, name="engine-ipc", daemon=True).start()
+
+    def stop(self, timeout: float = config.SHUTDOWN_DRAIN_SEC + 5):
+        """通知引擎子进程退出并等待其完成进行中的订单"""
+        if self.child is None or self.child.poll() is not None:
+            return
+        self.child.send_signal(signal.SIGTERM)
+        try:
+            self.child.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print("引擎子进程退出超时，强制结束")
+            self.child.kill()
+
+    def _run(self):
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                time.sleep(RECONNECT_DELAY)
+                continue
+            self._sock = sock
+            print(f"已连接引擎进程: {self.path}")
+            try:
+                for line in sock.makefile("rb"):
+                    self._on_message(json.loads(line))
+            except (OSError, ValueError) as e:
+                print(f"引擎进程连接异常: {e}")
+            finally:
+                self._sock = None
+                sock.close()
+                for slot in list(self._pending.values()):
+                    slot[0].set()
+            print("引擎进程连接断开，稍后重连")
+            time.sleep(RECONNECT_DELAY)
+
+    def _on_message(self, msg: Dict[str, Any]):
+        kind = msg.get("t")
+        if kind == "emit":
+            self.socketio.emit(msg["event"], msg["data"])
+            exporter.SOCKETIO_EMITS.inc(1, msg["event"])
+        elif kind == "event":
+            topic, data = msg["topic"], msg["data"]
+            if topic == events.LOG:
+                # 引擎进程已落库，这里只进入环形缓冲供 /api/logs 读取
+                log_writer.remember(data["ts"], data["level"], data["message"])
+            events.publish(topic, data)
+        elif kind == "status":
+            self._status = msg["data"]
+        elif kind == "reply":
+            slot = self._pending.get(msg.get("id"))
+            if slot is not None:
+                slot[1] = msg
+                slot[0].set()
+
+    def call(self, op: str, timeout: float = IPC_TIMEOUT, **args):
+        sock = self._sock
+        if sock is None:
+            raise EngineUnavailable("引擎进程未连接")
+        rid = next(self._ids)
+        slot = [threading.Event(), None]
+        self._pending[rid] = slot
+        try:
+            with self._send_lock:
+                sock.sendall(_encode({"id": rid, "op": op, "args": args}))
+            if not slot[0].wait(timeout):
+                raise EngineUnavailable(f"引擎进程响应超时: {op}")
+        except OSError as e:
+            raise EngineUnavailable(f"引擎进程连接断开: {e}")
+        finally:
+            self._pending.pop(rid, None)
+        reply = slot[1]
+        if reply is None:
+            raise EngineUnavailable("引擎进程连接断开")
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error"))
+        return reply.get("result")
+
+    # ---------- Engine 属性 ----------
+
+    def snapshot(self) -> Optional[shm_state.EngineSnapshot]:
+        """主交易对的共享内存快照（未启用或引擎进程未在更新时为 None）"""
+        return self.shm.read() if self.shm is not None else None
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    @property
+    def symbol(self) -> str:
+        snap = self.snapshot()
+        return snap.symbol if snap is not None else self._status.get("symbol", config.SYMBOL)
+
+    @property
+    def state(self) -> str:
+        snap = self.snapshot()
+        return snap.state if snap is not None else self._status.get("state", "unknown")
+
+    @property
+    def last_price(self) -> float:
+        snap = self.snapshot()
+        return snap.last_price if snap is not None else self._status.get("last_price", 0.0)
+
+    @property
+    def prices(self) -> List[float]:
+        return self._status.get("prices", [])
+
+    @property
+    def boll_period(self) -> int:
+        snap = self.snapshot()
+        return snap.boll_period if snap is not None else self._status.get("boll_period", config.BOLL_PERIOD)
+
+    @boll_period.setter
+    def boll_period(self, value: int):
+        self.call("set_boll", period=value)
+
+    @property
+    def boll_std(self) -> float:
+        snap = self.snapshot()
+        return snap.boll_std if snap is not None else self._status.get("boll_std", config.BOLL_STD)
+
+    @boll_std.setter
+    def boll_std(self, value: float):
+        self.call("set_boll", std=value)
+
+    def set_boll_params(self, period: int, std: float):
+        reply = self.call("set_boll", period=period, std=std)
+        return reply["period"], reply["std"]
+
+    @property
+    def mtf_boll(self) -> Dict[str, _Bands]:
+        return {itv: _Bands(v) for itv, v in self._status.get("mtf", {}).items()}
+
+    @property
+    def broadcaster(self) -> Optional[_BroadcasterProxy]:
+        return self._broadcaster if self._status.get("broadcast") is not None else None
+
+    # ---------- MultiEngine 属性 ----------
+
+    @property
+    def engines(self) -> Dict[str, EngineStatus]:
+        snaps = self.shm.all() if self.shm is not None else []
+        if snaps:
+            return {s.symbol: EngineStatus(s.state, s.last_price) for s in snaps}
+        return {s: EngineStatus(*v) for s, v in self._status.get("engines", {}).items()}
+
+    @property
+    def messages(self) -> int:
+        return self._status.get("messages", 0)
+
+    @property
+    def unrouted(self) -> int:
+        return self._status.get("unrouted", 0)
+
+    @property
+    def primary(self) -> "EngineProxy":
+        return self
+
+    def metrics(self) -> Dict[str, Any]:
+        return self.call("metrics")
+
+
+def main():
+    apply_cpu_policy(config.ENGINE_CPUS)
+    asyncio.run(EngineService().run())
+
+
+if __name__ == "__main__":
+    main()
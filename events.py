@@ -0,0 +1,36 @@
+"""
+进程内事件总线
+数据在发生变化的地方发布事件（新交易、新日志、持仓变化、K线收盘、盈利更新），
+Web 层订阅后通过 Socket.IO 向浏览器推送增量。
+处理函数在发布者线程中同步执行，必须足够轻量（耗时工作应转交后台线程）。
+"""
+
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+# 事件主题
+LOG = "log"
+TRADE = "trade"
+POSITION = "position"
+KLINE = "kline"
+PROFIT = "profit"
+
+_subscribers: Dict[str, List[Callable[[Any], None]]] = defaultdict(list)
+
+
+def subscribe(topic: str, handler: Callable[[Any], None]):
+    if handler not in _subscribers[topic]:
+        _subscribers[topic].append(handler)
+
+
+def unsubscribe(topic: str, handler: Callable[[Any], None]):
+    if handler in _subscribers.get(topic, []):
+        _subscribers[topic].remove(handler)
+
+
+def publish(topic: str, payload: Any = None):
+    for handler in list(_subscribers.get(topic, ())):
+        try:
+            handler(payload)
+        except Exception as e:  # pragma: no cover
+            print(f"事件处理失败 {topic}: {e}")
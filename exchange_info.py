@@ -0,0 +1,199 @@
+"""
+交易规则缓存
+启动时加载各交易对的 LOT_SIZE / MARKET_LOT_SIZE / PRICE_FILTER / MIN_NOTIONAL 与杠杆分层，
+持久化到磁盘供下次快速启动，后台按 TTL 刷新。
+下单数量与价格按交易对精度取整、下单前本地校验，避免因精度或最小下单量被交易所拒单。
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from config import config
+from db import log
+from rest_client import AsyncFuturesClient
+
+
+class SymbolRules:
+    """单个交易对的下单规则"""
+
+    __slots__ = ("symbol", "step", "min_qty", "max_qty", "market_step", "market_min_qty", "market_max_qty",
+                 "tick", "min_price", "max_price", "min_notional", "qty_decimals", "market_decimals",
+                 "price_decimals")
+
+    def __init__(self, symbol: str, step: float = 0.001, min_qty: float = 0.001, max_qty: float = math.inf,
+                 market_step: Optional[float] = None, market_min_qty: Optional[float] = None,
+                 market_max_qty: Optional[float] = None, tick: float = 0.1, min_price: float = 0.0,
+                 max_price: float = math.inf, min_notional: float = 0.0):
+        self.symbol = symbol
+        self.step = step
+        self.min_qty = min_qty
+        self.max_qty = max_qty
+        self.market_step = market_step or step
+        self.market_min_qty = market_min_qty if market_min_qty is not None else min_qty
+        self.market_max_qty = market_max_qty if market_max_qty is not None else max_qty
+        self.tick = tick
+        self.min_price = min_price
+        self.max_price = max_price
+        self.min_notional = min_notional
+        self.qty_decimals = _decimals(step)
+        self.market_decimals = _decimals(self.market_step)
+        self.price_decimals = _decimals(tick)
+
+    @classmethod
+    def from_exchange(cls, s: Dict[str, Any]) -> "SymbolRules":
+        f = {flt["filterType"]: flt for flt in s.get("filters", [])}
+        lot = f.get("LOT_SIZE", {})
+        market = f.get("MARKET_LOT_SIZE", {})
+        price = f.get("PRICE_FILTER", {})
+        notional = f.get("MIN_NOTIONAL", {})
+        return cls(
+            s["symbol"],
+            step=float(lot.get("stepSize", 0.001)),
+            min_qty=float(lot.get("minQty", 0.001)),
+            max_qty=float(lot.get("maxQty", math.inf)),
+            market_step=float(market["stepSize"]) if market.get("stepSize") else None,
+            market_min_qty=float(market["minQty"]) if market.get("minQty") else None,
+            market_max_qty=float(market["maxQty"]) if market.get("maxQty") else None,
+            tick=float(price.get("tickSize", 0.1)),
+            min_price=float(price.get("minPrice", 0)),
+            max_price=float(price.get("maxPrice", 0)) or math.inf,
+            min_notional=float(notional.get("notional", notional.get("minNotional", 0))),
+        )
+
+
+def _decimals(step: float) -> int:
+    """步长对应的小数位数（0.001 -> 3）"""
+    return max(0, -int(math.floor(math.log10(step) + 1e-9))) if 0 < step < 1 else 0
+
+
+def _floor_to(value: float, step: float, decimals: int) -> float:
+    # 加一个极小量抵消二进制浮点误差（如 0.3/0.1 = 2.9999999999999996）
+    return round(math.floor(value / step + 1e-9) * step, decimals)
+
+
+class ExchangeInfo:
+    def __init__(self, path: str = config.EXCHANGE_INFO_PATH, ttl: float = config.EXCHANGE_INFO_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.rules: Dict[str, SymbolRules] = {}
+        self.brackets: Dict[str, List[Dict[str, Any]]] = {}
+        self.updated = 0.0
+        self._raw: Dict[str, Any] = {}
+        self.load()
+
+    # ==================== 加载与刷新 ====================
+
+    def load(self) -> bool:
+        """从磁盘缓存加载（快速启动），不检查是否过期"""
+        try:
+            with open(self.path) as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self._apply(raw)
+        return True
+
+    def _apply(self, raw: Dict[str, Any]):
+        self._raw = raw
+        self.rules = {s["symbol"]: SymbolRules.from_exchange(s) for s in raw.get("symbols", [])}
+        self.brackets = {b["symbol"]: b.get("brackets", []) for b in raw.get("brackets", [])}
+        self.updated = raw.get("updated", 0.0)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._raw, f)
+        os.replace(tmp, self.path)
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.updated > self.ttl
+
+    async def refresh(self, rest: Optional[AsyncFuturesClient] = None):
+        """从交易所拉取交易规则与杠杆分层并写入磁盘缓存"""
+        own = rest is None
+        if own:
+            rest = AsyncFuturesClient(api_key=config.API_KEY, api_secret=config.API_SECRET)
+        try:
+            info = await rest.request("GET", "/fapi/v1/exchangeInfo")
+            raw = {
+                "updated": time.time(),
+                "symbols": [{"symbol": s["symbol"], "filters": s.get("filters", [])} for s in info.get("symbols", [])],
+                "brackets": self._raw.get("brackets", []),
+            }
+            if rest.api_key:
+                try:
+                    raw["brackets"] = await rest.request("GET", "/fapi/v1/leverageBracket", signed=True)
+                except Exception as e:
+                    log("WARNING", f"获取杠杆分层失败: {e}")
+            self._apply(raw)
+            self._save()
+        finally:
+            if own:
+                await rest.close()
+
+    async def ensure_fresh(self, rest: Optional[AsyncFuturesClient] = None):
+        """缓存缺失或过期时刷新，失败时继续使用旧缓存"""
+        if not self.stale:
+            return
+        try:
+            await self.refresh(rest)
+            log("INFO", f"交易规则已更新: {len(self.rules)} 个交易对")
+        except Exception as e:
+            log("WARNING", f"交易规则刷新失败，使用{'磁盘缓存' if self.rules else '默认规则'}: {e}")
+
+    async def run_refresh_loop(self, rest: Optional[AsyncFuturesClient] = None):
+        """后台按 TTL 刷新"""
+        while True:
+            await asyncio.sleep(max(60.0, self.updated + self.ttl - time.time()))
+            await self.ensure_fresh(rest)
+
+    # ==================== 取整与校验（O(1)） ====================
+
+    def get(self, symbol: str) -> SymbolRules:
+        rules = self.rules.get(symbol)
+        if rules is None:
+            # 没有缓存时的默认规则与原先 BTCUSDT 的硬编码一致（3位小数，最小0.001）
+            rules = self.rules[symbol] = SymbolRules(symbol)
+        return rules
+
+    def quantize_qty(self, symbol: str, qty: float, market: bool = True) -> float:
+        r = self.get(symbol)
+        if market:
+            return _floor_to(qty, r.market_step, r.market_decimals)
+        return _floor_to(qty, r.step, r.qty_decimals)
+
+    def quantize_price(self, symbol: str, price: float) -> float:
+        r = self.get(symbol)
+        return round(round(price / r.tick) * r.tick, r.price_decimals)
+
+    def max_notional(self, symbol: str, leverage: int = config.LEVERAGE) -> float:
+        """当前杠杆下允许的最大持仓名义价值（无分层数据时不限制）"""
+        caps = [b["notionalCap"] for b in self.brackets.get(symbol, []) if b.get("initialLeverage", 0) >= leverage]
+        return float(max(caps)) if caps else math.inf
+
+    def validate(self, symbol: str, qty: float, price: Optional[float] = None, market: bool = True,
+                 reduce_only: bool = False) -> Optional[str]:
+        """本地校验下单参数，通过返回 None，否则返回原因"""
+        r = self.get(symbol)
+        min_qty, max_qty = (r.market_min_qty, r.market_max_qty) if market else (r.min_qty, r.max_qty)
+        if qty < min_qty:
+            return f"Order quantity {qty} is too small, minimum is {min_qty}"
+        if qty > max_qty:
+            return f"Order quantity {qty} exceeds maximum {max_qty}"
+        if price and not reduce_only:
+            notional = qty * price
+            if notional < r.min_notional:
+                return f"Order notional {notional:.2f} is below minimum {r.min_notional}"
+            cap = self.max_notional(symbol)
+            if notional > cap:
+                return f"Order notional {notional:.2f} exceeds {cap} allowed at {config.LEVERAGE}x"
+        return None
+
+
+exchange_info = ExchangeInfo()
@@ -0,0 +1,217 @@
+"""
+Prometheus 指标导出（文本格式 0.0.4，/metrics）
+计数器与直方图按线程分片：每个线程只写自己的分片（threading.local），热路径上没有锁，
+抓取时再把各分片相加；仪表盘指标直接赋值或在抓取时回调取值。
+速率类指标（每秒消息数、推送频率）导出为计数器，由 Prometheus 用 rate() 计算。
+
+    ws_messages_total                 行情推送帧数
+    ws_reconnects_total{stream}       行情/用户数据流断线重连次数
+    evaluate_total / evaluate_duration_seconds
+    state_transitions_total{state}    进入各状态的次数
+    orders_total{side} / order_failures_total{side} / order_latency_seconds
+    rest_used_weight                  最近一次响应的 X-MBX-USED-WEIGHT-1M
+    sqlite_write_seconds{op}          各写库操作耗时
+    socketio_clients / socketio_emits_total{event}
+    http_requests_total{endpoint,method,status} / http_request_duration_seconds{endpoint,method}
+    tick_stage_latency_seconds{stage} 热路径各阶段延迟（见 metrics.py）
+
+延迟类指标以 summary 导出（0.5/0.9/0.99 分位数，基于 metrics.Histogram，相对误差 < 2%）。
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from metrics import Histogram
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Sharded:
+    """按线程分片的 {标签值: 数据}；只有线程第一次写入时需要加锁登记分片"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Dict:
+        shard = getattr(self._local, "d", None)
+        if shard is None:
+            shard = self._local.d = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _collect_shards(self) -> List[Dict]:
+        with self._lock:
+            shards = list(self._shards)
+        return [dict(s) for s in shards]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Iterable[str] = ()):
+        super().__init__()
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+
+    def inc(self, amount: float = 1, *labels):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[Tuple, float]:
+        out: Dict[Tuple, float] = {}
+        for shard in self._collect_shards():
+            for k, v in shard.items():
+                out[k] = out.get(k, 0) + v
+        return out
+
+    def expose(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(self.values().items())]
+
+
+class Gauge:
+    """当前值；fn 给出时在抓取时调用（返回数值，或 {标签值元组: 数值}）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Iterable[str] = (), fn: Optional[Callable] = None):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.fn = fn
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def values(self) -> Dict[Tuple, float]:
+        if self.fn is None:
+            return dict(self._values)
+        v = self.fn()
+        return v if isinstance(v, dict) else {(): v}
+
+    def expose(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(self.values().items())]
+
+
+class Summary(_Sharded):
+    """耗时分布（秒），每个分片每组标签一个 Histogram"""
+
+    kind = "summary"
+
+    def __init__(self, name: str, doc: str, labelnames: Iterable[str] = ()):
+        super().__init__()
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+
+    def observe(self, seconds: float, *labels):
+        shard = self._shard()
+        h = shard.get(labels)
+        if h is None:
+            h = shard[labels] = Histogram()
+        h.record(int(seconds * 1e6))
+
+    def histograms(self) -> Dict[Tuple, Histogram]:
+        out: Dict[Tuple, Histogram] = {}
+        for shard in self._collect_shards():
+            for k, h in shard.items():
+                if k in out:
+                    out[k].merge(h)
+                else:
+                    out[k] = h.copy()
+        return out
+
+    def expose(self) -> List[str]:
+        return _expose_histograms(self.name, self.labelnames, self.histograms())
+
+
+def _expose_histograms(name: str, labelnames: Tuple[str, ...], hists: Dict[Tuple, Histogram]) -> List[str]:
+    lines = []
+    for k, h in sorted(hists.items(), key=lambda kv: kv[0]):
+        for q in QUANTILES:
+            quantile = 'quantile="%s"' % q
+            lines.append(f"{name}{_labels(labelnames, k, quantile)} {_num(h.percentile(q) / 1e6)}")
+        lines.append(f"{name}_sum{_labels(labelnames, k)} {_num(h.total / 1e6)}")
+        lines.append(f"{name}_count{_labels(labelnames, k)} {h.count}")
+    return lines
+
+
+class _StageLatency:
+    """把 metrics.py 的热路径阶段直方图导出为 summary（只读，不另外记录）"""
+
+    kind = "summary"
+    name = "tick_stage_latency_seconds"
+    doc = "Hot path latency per stage, from kline receipt to order fill"
+
+    def expose(self) -> List[str]:
+        hists = {(stage,): h.copy() for stage, h in metrics.histograms.items() if h.count}
+        return _expose_histograms(self.name, ("stage",), hists)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._names = set()
+
+    def register(self, metric):
+        if metric.name in self._names:
+            raise ValueError(f"指标重复注册: {metric.name}")
+        self._names.add(metric.name)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, doc: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, doc, labelnames))
+
+    def gauge(self, name: str, doc: str, labelnames: Iterable[str] = (), fn: Optional[Callable] = None) -> Gauge:
+        return self.register(Gauge(name, doc, labelnames, fn))
+
+    def summary(self, name: str, doc: str, labelnames: Iterable[str] = ()) -> Summary:
+        return self.register(Summary(name, doc, labelnames))
+
+    def expose(self) -> str:
+        """生成文本格式的全部指标"""
+        out = []
+        for m in self._metrics:
+            try:
+                lines = m.expose()
+            except Exception as e:  # 回调取值失败不影响其他指标
+                out.append(f"# {m.name} 取值失败: {_escape(e)}")
+                continue
+            out.append(f"# HELP {m.name} {m.doc}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+WS_MESSAGES = registry.counter("ws_messages_total", "Kline websocket frames received")
+WS_RECONNECTS = registry.counter("ws_reconnects_total", "Websocket disconnects followed by a reconnect", ["stream"])
+EVALUATE = registry.counter("evaluate_total", "Strategy evaluations")
+EVALUATE_SECONDS = registry.summary("evaluate_duration_seconds", "Strategy evaluation duration")
+STATE_TRANSITIONS = registry.counter("state_transitions_total", "State machine transitions by new state", ["state"])
+ORDERS = registry.counter("orders_total", "Orders sent to the exchange", ["side"])
+ORDER_FAILURES = registry.counter("order_failures_total", "Orders rejected or failed", ["side"])
+ORDER_SECONDS = registry.summary("order_latency_seconds", "Order request round trip")
+REST_WEIGHT = registry.gauge("rest_used_weight", "X-MBX-USED-WEIGHT-1M from the latest REST response")
+SQLITE_WRITE_SECONDS = registry.summary("sqlite_write_seconds", "SQLite write duration", ["op"])
+SOCKETIO_EMITS = registry.counter("socketio_emits_total", "Socket.IO events emitted", ["event"])
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests", ["endpoint", "method", "status"])
+HTTP_SECONDS = registry.summary("http_request_duration_seconds", "HTTP request duration", ["endpoint", "method"])
+registry.register(_StageLatency())
@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+"""
+本地模拟币安 U 本位合约交易所
+在一个端口上提供项目用到的 REST 接口（K线、最新价、交易规则、账户、持仓模式、下单、持仓、listenKey）
+和 websocket（单流 /ws/<stream>、组合流 /stream?streams=...、用户数据流 /ws/<listenKey>），
+不需要网络和真实资金即可做集成测试、压测和延迟测量。
+
+行情：每个交易对按 1m 基础K线生成价格路径（随机游走，或回放数据库中记录的K线），
+每根K线内按 --tick-ms 推送若干帧，高周期K线由 aggregator 合成；--speed 为模拟时间相对真实时间的倍数。
+故障注入：--latency-ms/--jitter-ms 为 REST 响应延迟，--error-rate 为随机返回 503 的比例，
+--ws-drop-sec 为定期断开行情连接（测试重连），运行中可通过 POST /_control 调整。
+GET /_stats 返回请求数、推送帧数和 tick 到下单的延迟（收到订单时距该交易对最近一帧推送的时间）。
+
+用法:
+    python fake_exchange.py --port 8765 --symbols BTCUSDT,ETHUSDT --speed 60
+    FAKE_EXCHANGE=127.0.0.1:8765 python webapp.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from aiohttp import WSMsgType, web
+
+from aggregator import CandleAggregator, resample
+from backfill import interval_to_ms
+
+BASE_INTERVAL = "1m"
+BASE_MS = 60000
+# 支持订阅和查询的K线周期（都由 1m 合成）
+INTERVALS = ("1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h")
+HISTORY_LIMIT = 20000  # 每个周期保留的已收盘K线根数
+ASSET = "USDT"
+
+
+def _fmt(x: float) -> str:
+    return f"{x:.8f}".rstrip("0").rstrip(".") or "0"
+
+
+def _percentile(samples, q: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * q))] if s else 0.0
+
+
+class Market:
+    """单个交易对的价格路径与各周期K线"""
+
+    def __init__(self, symbol: str, price: float, vol: float, rows: Optional[List[Dict]] = None,
+                 rng: Optional[random.Random] = None):
+        self.symbol = symbol
+        self.price = price
+        self.vol = vol  # 每根1m K线收盘价对数收益率的标准差
+        self.rng = rng or random.Random()
+        self._rows = iter(rows) if rows else None
+        self.agg = CandleAggregator(BASE_INTERVAL, INTERVALS)
+        self.history: Dict[str, Deque[Tuple]] = {itv: deque(maxlen=HISTORY_LIMIT) for itv in INTERVALS}
+        self.forming: Dict[str, Tuple] = {}
+        self.last_tick = 0.0  # 最近一帧推送的时间（perf_counter）
+
+    def next_candle(self) -> Tuple[float, float, float, float, float]:
+        """下一根1m K线 (open, high, low, close, volume)：有回放数据时按记录回放，否则随机游走"""
+        if self._rows is not None:
+            r = next(self._rows, None)
+            if r is not None:
+                return float(r["open"]), float(r["high"]), float(r["low"]), float(r["close"]), float(r.get("volume") or 1)
+            self._rows = None
+        o = self.price
+        c = o * math.exp(self.rng.gauss(0, self.vol))
+        h = max(o, c) * (1 + abs(self.rng.gauss(0, self.vol / 2)))
+        l = min(o, c) * (1 - abs(self.rng.gauss(0, self.vol / 2)))
+        return o, h, l, c, round(self.rng.uniform(10, 100), 3)
+
+    def apply(self, open_time: int, o: float, h: float, l: float, c: float, v: float, closed: bool):
+        """喂入一帧1m K线，更新各周期当前K线与历史，返回本帧的各周期更新"""
+        self.price = c
+        updates = self.agg.update(open_time, o, h, l, c, v, closed)
+        for u in updates:
+            row = (u.open_time, u.open, u.high, u.low, u.close, u.volume)
+            if u.closed:
+                self.history[u.interval].append(row)
+                self.forming.pop(u.interval, None)
+            else:
+                self.forming[u.interval] = row
+        return updates
+
+    def klines(self, interval: str, start: Optional[int], end: Optional[int], limit: int) -> List[list]:
+        ms = interval_to_ms(interval)
+        if interval in self.history:
+            rows = list(self.history[interval])
+            if interval in self.forming:
+                rows.append(self.forming[interval])
+        else:
+            # 非常用周期由 1m 历史临时合成
+            src = [dict(zip(("open_time", "open", "high", "low", "close", "volume"), r)) for r in self.history["1m"]]
+            rows = [(r["open_time"], r["open"], r["high"], r["low"], r["close"], r["volume"]) for r in resample(src, BASE_MS, ms)]
+        if start is not None:
+            rows = [r for r in rows if r[0] >= start]
+        if end is not None:
+            rows = [r for r in rows if r[0] <= end]
+        rows = rows[:limit] if start is not None else rows[-limit:]
+        return [[r[0], _fmt(r[1]), _fmt(r[2]), _fmt(r[3]), _fmt(r[4]), _fmt(r[5]), r[0] + ms - 1,
+                 _fmt(r[4] * r[5]), 1, "0", "0", "0"] for r in rows]
+
+
+class FakeExchange:
+    def __init__(self, symbols: List[str], balance: float = 10000.0, speed: float = 60.0, tick_ms: int = 250,
+                 vol: float = 0.002, history: int = 1500, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, ws_drop_sec: float = 0.0, fee_rate: float = 0.0005,
+                 replay: Optional[Dict[str, List[Dict]]] = None, seed: Optional[int] = None):
+        rng = random.Random(seed)
+        replay = replay or {}
+        self.markets: Dict[str, Market] = {}
+        for s in symbols:
+            rows = replay.get(s)
+            start = float(rows[0]["open"]) if rows else {"BTCUSDT": 60000.0, "ETHUSDT": 3000.0}.get(s, 100.0)
+            self.markets[s] = Market(s, start, vol, rows, random.Random(rng.random()))
+        self.speed = speed
+        self.tick_ms = tick_ms
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.ws_drop_sec = ws_drop_sec
+        self.fee_rate = fee_rate
+        self.rng = rng
+        # 模拟时钟：历史K线结束于当前时间所在的1m K线之前
+        now = int(time.time() * 1000) // BASE_MS * BASE_MS
+        self.clock = now - history * BASE_MS
+        for _ in range(history):
+            for m in self.markets.values():
+                o, h, l, c, v = m.next_candle()
+                m.apply(self.clock, o, h, l, c, v, True)
+            self.clock += BASE_MS
+
+        # 账户
+        self.wallet = balance
+        self.dual_side = False
+        self.leverage: Dict[str, int] = {s: 10 for s in symbols}
+        # (symbol, positionSide) -> [数量（空仓为负）, 开仓均价]
+        self.positions: Dict[Tuple[str, str], List[float]] = {}
+        self._order_ids = itertools.count(1)
+        # clientOrderId -> 已成交订单（供 GET /fapi/v1/order 查询）
+        self.filled: Dict[str, Dict[str, Any]] = {}
+        self.listen_keys: Set[str] = set()
+
+        # 订阅者
+        self.market_ws: Dict[Tuple[str, str], Set[Tuple[web.WebSocketResponse, Optional[str]]]] = {}
+        self.user_ws: Set[web.WebSocketResponse] = set()
+
+        # 统计
+        self.requests = 0
+        self.errors_injected = 0
+        self.orders = 0
+        self.ticks = 0
+        self.frames_sent = 0
+        self.tick_to_order: Deque[float] = deque(maxlen=10000)
+        self._tasks: List[asyncio.Task] = []
+
+    # ==================== 行情推送 ====================
+
+    def _kline_event(self, symbol: str, u, event_ms: int) -> Dict[str, Any]:
+        ms = interval_to_ms(u.interval)
+        return {
+            "e": "kline", "E": event_ms, "s": symbol,
+            "k": {"t": u.open_time, "T": u.open_time + ms - 1, "s": symbol, "i": u.interval,
+                  "o": _fmt(u.open), "c": _fmt(u.close), "h": _fmt(u.high), "l": _fmt(u.low),
+                  "v": _fmt(u.volume), "x": u.closed},
+        }
+
+    async def _send(self, ws: web.WebSocketResponse, text: str):
+        try:
+            await ws.send_str(text)
+            self.frames_sent += 1
+        except (ConnectionError, RuntimeError):
+            pass
+
+    async def _emit(self, m: Market, updates):
+        event_ms = self.clock
+        sends = []
+        for u in updates:
+            subs = self.market_ws.get((m.symbol.lower(), u.interval))
+            if not subs:
+                continue
+            data = self._kline_event(m.symbol, u, event_ms)
+            raw = json.dumps(data)
+            for ws, stream in list(subs):
+                sends.append(self._send(ws, json.dumps({"stream": stream, "data": data}) if stream else raw))
+        if sends:
+            await asyncio.gather(*sends)
+        m.last_tick = time.perf_counter()
+
+    @staticmethod
+    def _tick_path(o: float, h: float, l: float, c: float, n: int) -> List[float]:
+        """K线内的价格路径：开盘 -> 最高/最低（先到者随收盘方向） -> 收盘，线性插值为 n 个点"""
+        points = [o, l, h, c] if c >= o else [o, h, l, c]
+        if n <= 1:
+            return [c]
+        out = []
+        for i in range(n):
+            x = i * 3 / (n - 1)
+            j = min(int(x), 2)
+            out.append(points[j] + (points[j + 1] - points[j]) * (x - j))
+        return out
+
+    async def run_market(self):
+        ticks_per_candle = max(1, BASE_MS // self.tick_ms)
+        next_t = time.monotonic()
+        while True:
+            candles = {s: m.next_candle() for s, m in self.markets.items()}
+            paths = {s: self._tick_path(o, h, l, c, ticks_per_candle) for s, (o, h, l, c, v) in candles.items()}
+            open_time = self.clock
+            highs = {s: c[0] for s, c in candles.items()}
+            lows = dict(highs)
+            for i in range(ticks_per_candle):
+                closed = i == ticks_per_candle - 1
+                for s, m in self.markets.items():
+                    o, h, l, c, v = candles[s]
+                    price = paths[s][i]
+                    highs[s] = max(highs[s], price)
+                    lows[s] = min(lows[s], price)
+                    updates = m.apply(open_time, o, highs[s], lows[s], price, v * (i + 1) / ticks_per_candle, closed)
+                    self.ticks += 1
+                    await self._emit(m, updates)
+                self.clock = open_time + (i + 1) * BASE_MS // ticks_per_candle
+                next_t += self.tick_ms / 1000.0 / self.speed
+                delay = next_t - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # 跟不上设定速度时不追赶，按最大吞吐推送
+                    next_t = time.monotonic()
+                    await asyncio.sleep(0)
+
+    async def run_ws_drops(self):
+        while self.ws_drop_sec > 0:
+            await asyncio.sleep(self.ws_drop_sec)
+            for subs in list(self.market_ws.values()):
+                for ws, _ in list(subs):
+                    await ws.close()
+
+    # ==================== 账户与撮合 ====================
+
+    def _unrealized(self, symbol: str, amt: float, entry: float) -> float:
+        return (self.markets[symbol].price - entry) * amt
+
+    def _margin_used(self) -> float:
+        return sum(abs(amt) * entry / self.leverage.get(s, 10) for (s, _), (amt, entry) in self.positions.items())
+
+    def _available(self) -> float:
+        upnl = sum(self._unrealized(s, amt, entry) for (s, _), (amt, entry) in self.positions.items())
+        return self.wallet + upnl - self._margin_used()
+
+    def _position_rows(self, symbol: Optional[str] = None) -> List[Dict[str, Any]]:
+        sides = ("LONG", "SHORT") if self.dual_side else ("BOTH",)
+        out = []
+        for s, m in self.markets.items():
+            if symbol and s != symbol:
+                continue
+            for ps in sides:
+                amt, entry = self.positions.get((s, ps), (0.0, 0.0))
+                out.append({
+                    "symbol": s, "positionSide": ps, "positionAmt": _fmt(amt), "entryPrice": _fmt(entry),
+                    "markPrice": _fmt(m.price), "unRealizedProfit": _fmt(self._unrealized(s, amt, entry)),
+                    "leverage": str(self.leverage.get(s, 10)), "marginType": "cross",
+                })
+        return out
+
+    def _account(self) -> Dict[str, Any]:
+        upnl = sum(self._unrealized(s, amt, entry) for (s, _), (amt, entry) in self.positions.items())
+        available = self._available()
+        return {
+            "totalWalletBalance": _fmt(self.wallet), "totalUnrealizedProfit": _fmt(upnl),
+            "availableBalance": _fmt(available), "totalMarginBalance": _fmt(self.wallet + upnl),
+            "assets": [{"asset": ASSET, "walletBalance": _fmt(self.wallet), "crossWalletBalance": _fmt(self.wallet),
+                        "availableBalance": _fmt(available), "unrealizedProfit": _fmt(upnl)}],
+            "positions": self._position_rows(),
+        }
+
+    def _fill(self, p: Dict[str, str]) -> Dict[str, Any]:
+        symbol = p.get("symbol", "")
+        if symbol not in self.markets:
+            raise _ApiError(400, -1121, "Invalid symbol.")
+        if p.get("type", "MARKET") != "MARKET":
+            raise _ApiError(400, -4000, "Only MARKET orders are supported by the fake exchange.")
+        side = p.get("side")
+        qty = float(p.get("quantity", 0))
+        if side not in ("BUY", "SELL") or qty <= 0:
+            raise _ApiError(400, -4003, "Quantity less than or equal to zero.")
+        ps = p.get("positionSide", "BOTH")
+        if (ps == "BOTH") == self.dual_side:
+            raise _ApiError(400, -4061, "Order's position side does not match user's setting.")
+        price = self.markets[symbol].price
+        signed = qty if side == "BUY" else -qty
+        amt, entry = self.positions.get((symbol, ps), (0.0, 0.0))
+        reduce_only = p.get("reduceOnly") == "true"
+        if reduce_only and (amt == 0 or amt * signed > 0):
+            raise _ApiError(400, -2022, "ReduceOnly Order is rejected.")
+
+        realized = 0.0
+        if amt * signed < 0:
+            # 减仓/平仓（单向持仓下超出部分反向开仓）
+            closing = min(abs(signed), abs(amt))
+            realized = (price - entry) * closing * (1 if amt > 0 else -1)
+            new_amt = amt + signed
+            if reduce_only and abs(signed) > abs(amt):
+                new_amt = 0.0
+            entry = entry if abs(new_amt) > 0 and new_amt * amt > 0 else (price if new_amt else 0.0)
+        else:
+            notional = qty * price
+            if notional / self.leverage.get(symbol, 10) > self._available():
+                raise _ApiError(400, -2019, "Margin is insufficient.")
+            new_amt = amt + signed
+            entry = (abs(amt) * entry + qty * price) / abs(new_amt)
+        fee = qty * price * self.fee_rate
+        self.wallet += realized - fee
+        if new_amt:
+            self.positions[(symbol, ps)] = [new_amt, entry]
+        else:
+            self.positions.pop((symbol, ps), None)
+        self.orders += 1
+        return {
+            "orderId": next(self._order_ids), "clientOrderId": p.get("newClientOrderId") or f"fake-{self.orders}",
+            "symbol": symbol, "status": "FILLED", "side": side, "positionSide": ps, "type": "MARKET",
+            "origQty": _fmt(qty), "executedQty": _fmt(qty), "avgPrice": _fmt(price), "cumQuote": _fmt(qty * price),
+            "reduceOnly": reduce_only, "updateTime": int(time.time() * 1000),
+            "_fee": fee, "_realized": realized, "_amt": new_amt, "_entry": entry,
+        }
+
+    async def _push_user(self, order: Dict[str, Any]):
+        if not self.user_ws:
+            return
+        now = int(time.time() * 1000)
+        s, ps = order["symbol"], order["positionSide"]
+        events = [
+            {"e": "ORDER_TRADE_UPDATE", "E": now, "T": now, "o": {
+                "s": s, "c": order["clientOrderId"], "S": order["side"], "o": "MARKET", "q": order["origQty"],
+                "ap": order["avgPrice"], "X": "FILLED", "x": "TRADE", "i": order["orderId"], "l": order["executedQty"],
+                "z": order["executedQty"], "L": order["avgPrice"], "N": ASSET, "n": _fmt(order["_fee"]),
+                "T": now, "R": order["reduceOnly"], "ps": ps, "rp": _fmt(order["_realized"])}},
+            {"e": "ACCOUNT_UPDATE", "E": now, "T": now, "a": {
+                "m": "ORDER",
+                "B": [{"a": ASSET, "wb": _fmt(self.wallet), "cw": _fmt(self.wallet), "bc": "0"}],
+                "P": [{"s": s, "pa": _fmt(order["_amt"]), "ep": _fmt(order["_entry"]), "cr": "0",
+                       "up": _fmt(self._unrealized(s, order["_amt"], order["_entry"])), "mt": "cross", "iw": "0",
+                       "ps": ps}]}},
+        ]
+        # 与真实交易所一样，成交推送可能早于 REST 响应到达
+        for ws in list(self.user_ws):
+            for e in events:
+                await self._send(ws, json.dumps(e))
+
+    # ==================== HTTP ====================
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if request.path.startswith("/_") or request.path.startswith("/ws") or request.path.startswith("/stream"):
+            return await handler(request)
+        self.requests += 1
+        if self.latency_ms or self.jitter_ms:
+            await asyncio.sleep(max(0.0, self.latency_ms + self.rng.gauss(0, self.jitter_ms)) / 1000)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors_injected += 1
+            return _error(503, -1001, "Internal error; unable to process your request. Please try your request again.")
+        try:
+            resp = await handler(request)
+        except _ApiError as e:
+            return _error(e.status, e.code, e.msg)
+        resp.headers["X-MBX-USED-WEIGHT-1M"] = str(min(self.requests, 2400))
+        return resp
+
+    @staticmethod
+    def _params(request: web.Request, body: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        params = dict(request.query)
+        if body:
+            params.update(body)
+        return params
+
+    def _signed(self, params: Dict[str, str]):
+        if "signature" not in params or "timestamp" not in params:
+            raise _ApiError(400, -1102, "Mandatory parameter 'signature' was not sent, was empty/null, or malformed.")
+
+    async def h_klines(self, request):
+        p = self._params(request)
+        m = self.markets.get(p.get("symbol", "").upper())
+        if m is None:
+            raise _ApiError(400, -1121, "Invalid symbol.")
+        start = int(p["startTime"]) if "startTime" in p else None
+        end = int(p["endTime"]) if "endTime" in p else None
+        limit = min(int(p.get("limit", 500)), 1500)
+        return web.json_response(m.klines(p.get("interval", BASE_INTERVAL), start, end, limit))
+
+    async def h_ticker(self, request):
+        p = self._params(request)
+        if "symbol" in p:
+            m = self.markets.get(p["symbol"].upper())
+            if m is None:
+                raise _ApiError(400, -1121, "Invalid symbol.")
+            return web.json_response({"symbol": m.symbol, "price": _fmt(m.price), "time": self.clock})
+        return web.json_response([{"symbol": s, "price": _fmt(m.price), "time": self.clock} for s, m in self.markets.items()])
+
+    async def h_exchange_info(self, request):
+        symbols = [{
+            "symbol": s, "status": "TRADING", "quoteAsset": ASSET,
+            "filters": [
+                {"filterType": "PRICE_FILTER", "tickSize": "0.10" if m.price > 1000 else "0.01", "minPrice": "0.01", "maxPrice": "1000000"},
+                {"filterType": "LOT_SIZE", "stepSize": "0.001", "minQty": "0.001", "maxQty": "1000"},
+                {"filterType": "MARKET_LOT_SIZE", "stepSize": "0.001", "minQty": "0.001", "maxQty": "120"},
+                {"filterType": "MIN_NOTIONAL", "notional": "5"},
+            ],
+        } for s, m in self.markets.items()]
+        return web.json_response({"serverTime": int(time.time() * 1000), "symbols": symbols})
+
+    async def h_leverage_bracket(self, request):
+        self._signed(self._params(request))
+        return web.json_response([{"symbol": s, "brackets": [
+            {"bracket": 1, "initialLeverage": 125, "notionalCap": 50000, "notionalFloor": 0, "maintMarginRatio": 0.004},
+            {"bracket": 2, "initialLeverage": 20, "notionalCap": 10000000, "notionalFloor": 50000, "maintMarginRatio": 0.025},
+        ]} for s in self.markets])
+
+    async def h_account(self, request):
+        self._signed(self._params(request))
+        return web.json_response(self._account())
+
+    async def h_balance(self, request):
+        self._signed(self._params(request))
+        a = self._account()["assets"][0]
+        return web.json_response([{"asset": ASSET, "balance": a["walletBalance"], "availableBalance": a["availableBalance"],
+                                   "crossWalletBalance": a["crossWalletBalance"], "crossUnPnl": a["unrealizedProfit"]}])
+
+    async def h_position_risk(self, request):
+        p = self._params(request)
+        self._signed(p)
+        return web.json_response(self._position_rows(p.get("symbol")))
+
+    async def h_position_mode(self, request):
+        p = self._params(request, dict(await request.post()))
+        self._signed(p)
+        if request.method == "GET":
+            return web.json_response({"dualSidePosition": self.dual_side})
+        dual = p.get("dualSidePosition", "false").lower() == "true"
+        if dual == self.dual_side:
+            raise _ApiError(400, -4059, "No need to change position side.")
+        if self.positions:
+            raise _ApiError(400, -4068, "Position side cannot be changed if there exists position.")
+        self.dual_side = dual
+        return web.json_response({"code": 200, "msg": "success"})
+
+    async def h_leverage(self, request):
+        p = self._params(request, dict(await request.post()))
+        self._signed(p)
+        self.leverage[p["symbol"]] = int(p["leverage"])
+        return web.json_response({"symbol": p["symbol"], "leverage": int(p["leverage"]), "maxNotionalValue": "1000000"})
+
+    async def h_order(self, request):
+        received = time.perf_counter()
+        p = self._params(request, dict(await request.post()))
+        self._signed(p)
+        m = self.markets.get(p.get("symbol", ""))
+        if m is not None and m.last_tick:
+            self.tick_to_order.append((received - m.last_tick) * 1000)
+        order = self._fill(p)
+        public = {k: v for k, v in order.items() if not k.startswith("_")}
+        self.filled[order["clientOrderId"]] = public
+        await self._push_user(order)
+        return web.json_response(public)
+
+    async def h_query_order(self, request):
+        p = self._params(request)
+        self._signed(p)
+        order = self.filled.get(p.get("origClientOrderId", ""))
+        if order is None or order["symbol"] != p.get("symbol"):
+            raise _ApiError(400, -2013, "Order does not exist.")
+        return web.json_response(order)
+
+    async def h_listen_key(self, request):
+        if request.method == "POST":
+            key = f"fake{self.rng.getrandbits(64):016x}"
+            self.listen_keys.add(key)
+            return web.json_response({"listenKey": key})
+        return web.json_response({})
+
+    async def h_time(self, request):
+        return web.json_response({"serverTime": int(time.time() * 1000)})
+
+    async def h_ping(self, request):
+        return web.json_response({})
+
+    # ==================== websocket ====================
+
+    async def _serve_market(self, request, streams: List[str], combined: bool):
+        ws = web.WebSocketResponse(heartbeat=15)
+        await ws.prepare(request)
+        keys = []
+        for stream in streams:
+            symbol, _, kind = stream.partition("@")
+            interval = kind[len("kline_"):] if kind.startswith("kline_") else ""
+            if interval not in INTERVALS or symbol.upper() not in self.markets:
+                continue
+            key = (symbol, interval)
+            self.market_ws.setdefault(key, set()).add((ws, stream if combined else None))
+            keys.append((key, stream if combined else None))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            for key, stream in keys:
+                self.market_ws.get(key, set()).discard((ws, stream))
+        return ws
+
+    async def h_ws(self, request):
+        name = request.match_info["name"]
+        if "@" in name:
+            return await self._serve_market(request, [name], combined=False)
+        if name not in self.listen_keys:
+            raise web.HTTPBadRequest(text="invalid listenKey")
+        ws = web.WebSocketResponse(heartbeat=15)
+        await ws.prepare(request)
+        self.user_ws.add(ws)
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.user_ws.discard(ws)
+        return ws
+
+    async def h_stream(self, request):
+        streams = [s for s in request.query.get("streams", "").split("/") if s]
+        return await self._serve_market(request, streams, combined=True)
+
+    # ==================== 控制与统计 ====================
+
+    async def h_stats(self, request):
+        lat = list(self.tick_to_order)
+        return web.json_response({
+            "requests": self.requests, "errors_injected": self.errors_injected, "orders": self.orders,
+            "ticks": self.ticks, "frames_sent": self.frames_sent,
+            "market_clients": sum(len(v) for v in self.market_ws.values()), "user_clients": len(self.user_ws),
+            "clock": self.clock, "wallet": self.wallet, "dual_side": self.dual_side,
+            "positions": [r for r in self._position_rows() if float(r["positionAmt"])],
+            "tick_to_order_ms": {"count": len(lat), "p50": _percentile(lat, 0.5), "p99": _percentile(lat, 0.99),
+                                 "max": max(lat) if lat else 0.0},
+        })
+
+    async def h_control(self, request):
+        body = await request.json()
+        for key in ("speed", "latency_ms", "jitter_ms", "error_rate", "ws_drop_sec"):
+            if key in body:
+                setattr(self, key, float(body[key]))
+        return web.json_response({k: getattr(self, k) for k in ("speed", "latency_ms", "jitter_ms", "error_rate", "ws_drop_sec")})
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes([
+            web.get("/fapi/v1/ping", self.h_ping),
+            web.get("/fapi/v1/time", self.h_time),
+            web.get("/fapi/v1/klines", self.h_klines),
+            web.get("/fapi/v1/ticker/price", self.h_ticker),
+            web.get("/fapi/v2/ticker/price", self.h_ticker),
+            web.get("/fapi/v1/exchangeInfo", self.h_exchange_info),
+            web.get("/fapi/v1/leverageBracket", self.h_leverage_bracket),
+            web.get("/fapi/v2/account", self.h_account),
+            web.get("/fapi/v3/account", self.h_account),
+            web.get("/fapi/v2/balance", self.h_balance),
+            web.get("/fapi/v2/positionRisk", self.h_position_risk),
+            web.get("/fapi/v3/positionRisk", self.h_position_risk),
+            web.route("*", "/fapi/v1/positionSide/dual", self.h_position_mode),
+            web.post("/fapi/v1/leverage", self.h_leverage),
+            web.post("/fapi/v1/order", self.h_order),
+            web.get("/fapi/v1/order", self.h_query_order),
+            web.route("*", "/fapi/v1/listenKey", self.h_listen_key),
+            web.get("/ws/{name}", self.h_ws),
+            web.get("/stream", self.h_stream),
+            web.get("/_stats", self.h_stats),
+            web.post("/_control", self.h_control),
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app):
+        self._tasks = [asyncio.create_task(self.run_market()), asyncio.create_task(self.run_ws_drops())]
+
+    async def _on_cleanup(self, app):
+        for t in self._tasks:
+            t.cancel()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> web.AppRunner:
+        """在当前事件循环中启动（供基准与集成测试脚本使用），返回的 runner 用于 cleanup()"""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+class _ApiError(Exception):
+    def __init__(self, status: int, code: int, msg: str):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+
+
+def _error(status: int, code: int, msg: str) -> web.Response:
+    return web.json_response({"code": code, "msg": msg}, status=status)
+
+
+def _load_replay(db_path: str, symbols: List[str], interval: str) -> Dict[str, List[Dict]]:
+    """从数据库读取记录的K线（按 1m 节奏回放，每根记录对应一根 1m K线）"""
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    out = {}
+    for s in symbols:
+        rows = conn.execute("SELECT open, high, low, close, volume FROM klines WHERE symbol=? AND interval=? ORDER BY open_time",
+                            (s, interval)).fetchall()
+        if rows:
+            out[s] = [dict(r) for r in rows]
+    conn.close()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟币安合约交易所")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--symbols", default="BTCUSDT")
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--speed", type=float, default=1.0, help="模拟时间倍速（60 表示每秒一根1m K线）")
+    parser.add_argument("--tick-ms", type=int, default=250, help="每帧推送对应的模拟时间（毫秒）")
+    parser.add_argument("--vol", type=float, default=0.002, help="随机游走每分钟波动率")
+    parser.add_argument("--history", type=int, default=1500, help="启动时生成的历史1m K线根数")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="REST 随机返回 503 的比例")
+    parser.add_argument("--ws-drop-sec", type=float, default=0.0, help="每隔多少秒断开行情连接（0 不断开）")
+    parser.add_argument("--replay-db", help="回放该数据库中记录的K线（否则随机游走）")
+    parser.add_argument("--replay-interval", default="1m")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    replay = _load_replay(args.replay_db, symbols, args.replay_interval) if args.replay_db else None
+    ex = FakeExchange(symbols, balance=args.balance, speed=args.speed, tick_ms=args.tick_ms, vol=args.vol,
+                      history=args.history, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      error_rate=args.error_rate, ws_drop_sec=args.ws_drop_sec, replay=replay, seed=args.seed)
+    print(f"模拟交易所: http://{args.host}:{args.port}  交易对: {','.join(symbols)}  倍速: {args.speed}")
+    print(f"使用: FAKE_EXCHANGE={args.host}:{args.port} python webapp.py")
+    web.run_app(ex.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import math
+from collections import deque
+from typing import Any, Dict, Optional
+
 import numpy as np
 import pandas as pd
 import requests
@@ -144,4 +148,164 @@ def calculate_boll_dynamic(symbol, interval, period=21, std_mult=2.0):
         'price_change_pct': price_change_pct,
         'method': method,
         'data_points': len(df_calc)
-    }
\ No newline at end of file
+    }
+
+class StreamingBoll:
+    """
+    增量BOLL计算器（由K线 websocket 帧直接驱动）
+    维护最近 period 根已收盘K线收盘价的滚动和与平方和，每个tick O(1) 更新；
+    计算时拼接当前未收盘K线，不访问网络和数据库。
+
+    动态方法选择与 calculate_boll_dynamic 一致（仅完整K线 / 平均价格 / 实时价格）。
+    由于 websocket 帧中未收盘K线的收盘价就是实时价格，价格变化幅度改为
+    相对上一根已收盘K线的收盘价计算。
+    """
+
+    METHOD_COMPLETE = "仅完整K线（大波动）"
+    METHOD_AVERAGE = "平均价格（中等波动）"
+    METHOD_REALTIME = "实时价格（小波动）"
+
+    def __init__(self, period: int = 21, std_mult: float = 2.0):
+        self.period = period
+        self.std_mult = std_mult
+        # 已收盘K线收盘价（减去 _shift 后存储，降低平方和的数值误差）
+        self._closes: deque = deque(maxlen=period)
+        self._shift = 0.0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._pushes = 0
+        self.last_open_time = 0
+        # 当前未收盘K线
+        self.forming_open_time = 0
+        self.forming_high = 0.0
+        self.forming_low = 0.0
+        self.forming_close = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return len(self._closes) >= self.period - 1 and self.period > 1
+
+    @property
+    def last_close(self) -> float:
+        """最近一根已收盘K线的收盘价"""
+        return self._closes[-1] + self._shift if self._closes else 0.0
+
+    def seed(self, rows):
+        """用数据库中的已收盘K线初始化（rows 为 fetch_klines 的返回值，时间升序）"""
+        self._closes.clear()
+        self._sum = self._sumsq = 0.0
+        self._pushes = 0
+        self.forming_open_time = 0
+        tail = list(rows)[-self.period:]
+        self._shift = float(tail[0]["close"]) if tail else 0.0
+        for r in tail:
+            self.push_close(int(r["open_time"]), float(r["close"]))
+
+    def push_close(self, open_time: int, close: float):
+        """追加一根已收盘K线；重复推送同一根K线时覆盖其收盘价"""
+        x = close - self._shift
+        if self._closes and open_time <= self.last_open_time:
+            if open_time == self.last_open_time:
+                old = self._closes[-1]
+                self._closes[-1] = x
+                self._sum += x - old
+                self._sumsq += x * x - old * old
+            return
+        if len(self._closes) == self._closes.maxlen:
+            old = self._closes[0]
+            self._sum -= old
+            self._sumsq -= old * old
+        self._closes.append(x)
+        self._sum += x
+        self._sumsq += x * x
+        self.last_open_time = open_time
+        self._pushes += 1
+        # 定期精确重算，消除滚动加减带来的浮点漂移（摊还 O(1)）
+        if self._pushes >= self.period:
+            self._resum()
+
+    def _resum(self):
+        self._pushes = 0
+        if not self._closes:
+            return
+        base = self._closes[-1]
+        self._shift += base
+        for i in range(len(self._closes)):
+            self._closes[i] -= base
+        self._sum = math.fsum(self._closes)
+        self._sumsq = math.fsum(x * x for x in self._closes)
+
+    def update(self, open_time: int, high: float, low: float, close: float, is_closed: bool):
+        """喂入一帧K线数据（websocket 的 k 字段）"""
+        if is_closed:
+            self.push_close(open_time, close)
+            self.forming_open_time = 0
+            return
+        if open_time <= self.last_open_time:
+            return
+        self.forming_open_time = open_time
+        self.forming_high = high
+        self.forming_low = low
+        self.forming_close = close
+
+    def _bands(self, replace: Optional[float]):
+        n = len(self._closes)
+        s, ss = self._sum, self._sumsq
+        if replace is not None:
+            x = replace - self._shift
+            if n == self.period:
+                old = self._closes[0]
+                s -= old
+                ss -= old * old
+                n -= 1
+            s += x
+            ss += x * x
+            n += 1
+        mean = s / n
+        var = (ss - s * mean) / (n - 1) if n > 1 else 0.0
+        std = math.sqrt(var) if var > 0 else 0.0
+        mid = mean + self._shift
+        return mid + self.std_mult * std, mid, mid - self.std_mult * std
+
+    def compute(self, current_price: Optional[float] = None) -> Dict[str, Any]:
+        """
+        计算当前BOLL值
+
+        Returns:
+            dict: 与 calculate_boll_dynamic 相同的字段
+        """
+        if not self.ready:
+            raise ValueError(f"数据不足，需要至少{self.period - 1}根完整K线，当前只有{len(self._closes)}根")
+        last_close = self.last_close
+        price = current_price if current_price else (self.forming_close or last_close)
+        price_change = abs(price - last_close)
+        price_change_pct = price_change / last_close * 100 if last_close else 0.0
+
+        if not self.forming_open_time:
+            # 刚收盘，尚无未收盘K线
+            if len(self._closes) < self.period:
+                raise ValueError(f"数据不足，需要至少{self.period}根完整K线，当前只有{len(self._closes)}根")
+            replace = None
+            method = self.METHOD_COMPLETE
+        elif price_change_pct > 0.5 and len(self._closes) >= self.period:
+            replace = None
+            method = self.METHOD_COMPLETE
+        elif price_change_pct > 0.1:
+            replace = (self.forming_high + self.forming_low + price) / 3
+            method = self.METHOD_AVERAGE
+        else:
+            replace = price
+            method = self.METHOD_REALTIME
+
+        up, mid, dn = self._bands(replace)
+        return {
+            'up': up,
+            'mid': mid,
+            'dn': dn,
+            'current_price': price,
+            'last_close': last_close,
+            'price_change': price_change,
+            'price_change_pct': price_change_pct,
+            'method': method,
+            'data_points': self.period
+        }
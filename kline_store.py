@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+列式K线存储
+每个 (symbol, interval) 一个目录，open_time/open/high/low/close/volume 各存为一个定长数组文件，
+通过内存映射读取，按 open_time 升序追加；时间到偏移的索引为 open_time 列上的二分查找。
+range()/tail() 直接返回映射数组的切片（零拷贝），百万根K线的加载是毫秒级。
+
+与 SQLite 保持同步：订阅 insert_kline 发布的 K线事件，新K线同时写入列存储（只写映射内存，读取立即可见），
+落盘（msync）与元数据更新由后台线程每 SYNC_INTERVAL 秒批量完成，不占用引擎事件循环；
+已有数据用 `python kline_store.py import` 从 klines 表导入。
+
+用法:
+    python kline_store.py import [--symbol BTCUSDT] [--interval 15m] [--full]
+    python kline_store.py info
+    python kline_store.py bench [--rows 1000000]
+"""
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import config
+import events
+
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("open_time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+)
+INITIAL_CAPACITY = 4096
+SYNC_INTERVAL = 1.0  # 事件写入的落盘间隔（秒）
+
+
+class KlineStore:
+    """单个 (symbol, interval) 的列式存储"""
+
+    def __init__(self, symbol: str, interval: str, root: Optional[str] = None):
+        self.symbol = symbol
+        self.interval = interval
+        self.path = os.path.join(root or config.KLINE_STORE_DIR, f"{symbol}_{interval}")
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cols: Dict[str, np.memmap] = {}
+        self.count = 0
+        self.capacity = 0
+        self._dirty = False
+        meta = self._read_meta()
+        self._map(max(meta.get("capacity", 0), INITIAL_CAPACITY))
+        # 元数据中的条数只在数据落盘后更新，崩溃时多写的尾部数据会被忽略
+        self.count = min(meta.get("count", 0), self.capacity)
+        self._meta_count = self.count  # 已写入元数据的条数
+
+    # ==================== 文件与映射 ====================
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, count: Optional[int] = None, capacity: Optional[int] = None):
+        """调用方持有 self._lock"""
+        count = self.count if count is None else count
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"symbol": self.symbol, "interval": self.interval,
+                       "count": count,
+                       "capacity": self.capacity if capacity is None else capacity, "columns": [c for c, _ in COLUMNS]}, f)
+        os.replace(tmp, self._meta_path())
+        self._meta_count = count
+
+    def _map(self, capacity: int):
+        """按容量扩展列文件并重新映射（旧的切片仍引用旧映射，保持有效）"""
+        for name, dtype in COLUMNS:
+            fn = os.path.join(self.path, f"{name}.bin")
+            size = capacity * np.dtype(dtype).itemsize
+            with open(fn, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            self._cols[name] = np.memmap(fn, dtype=dtype, mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def _reserve(self, n: int):
+        if n <= self.capacity:
+            return
+        cap = self.capacity
+        while cap < n:
+            cap *= 2
+        self._flush_cols()
+        self._map(cap)
+
+    def _flush_cols(self):
+        for col in self._cols.values():
+            col.flush()
+
+    # ==================== 写入 ====================
+
+    def append(self, rows: Iterable[Sequence], sync: bool = True):
+        """
+        写入K线 (open_time, open, high, low, close, volume)
+
+        新时间追加到末尾；已存在的时间原地覆盖；早于末尾且不存在的时间（补洞）整体合并重写。
+        sync=False 时只写入映射内存，由 sync() 稍后落盘。
+        """
+        if isinstance(rows, np.ndarray):
+            data = np.asarray(rows[:, :6], dtype=np.float64)
+        else:
+            data = np.array([tuple(r)[:6] for r in rows], dtype=np.float64).reshape(-1, 6)
+        if data.size == 0:
+            return
+        times = data[:, 0].astype(np.int64)
+        # 按时间排序并去重（同一时间保留最后一条）
+        order = np.argsort(times, kind="stable")
+        times, data = times[order], data[order]
+        keep = np.append(times[1:] != times[:-1], True)
+        times, data = times[keep], data[keep]
+
+        with self._lock:
+            n = self.count
+            ot = self._cols["open_time"]
+            last = int(ot[n - 1]) if n else None
+            pos = np.searchsorted(ot[:n], times)
+            exists = pos < n
+            exists[exists] = ot[pos[exists]] == times[exists]
+            new = ~exists
+            if new.any() and last is not None and times[new].min() <= last:
+                self._merge(times, data)
+            else:
+                if exists.any():
+                    idx = pos[exists]
+                    for j, (name, _) in enumerate(COLUMNS[1:], start=1):
+                        self._cols[name][idx] = data[exists, j]
+                k = int(new.sum())
+                if k:
+                    self._reserve(n + k)
+                    self._cols["open_time"][n:n + k] = times[new]
+                    for j, (name, _) in enumerate(COLUMNS[1:], start=1):
+                        self._cols[name][n:n + k] = data[new, j]
+                    self.count = n + k
+            if not sync:
+                self._dirty = True
+                return
+            self._flush_cols()
+            self._write_meta()
+            self._dirty = False
+
+    def sync(self):
+        """
+        落盘 append(sync=False) 写入的数据；msync 在锁外进行，不阻塞同时到来的写入
+
+        元数据在锁内写入，且条数只增不减：与另一次落盘（后台线程、退出时或同步写入）交错时，
+        较早的快照不会覆盖已写入的更大条数。
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            cols = list(self._cols.values())
+            count, capacity = self.count, self.capacity
+        for col in cols:
+            col.flush()
+        with self._lock:
+            if count >= self._meta_count:
+                self._write_meta(count, capacity)
+
+    def _merge(self, times: np.ndarray, data: np.ndarray):
+        """新数据落在已有区间内部时，合并后整体重写"""
+        n = self.count
+        old_t = np.array(self._cols["open_time"][:n])
+        all_t = np.concatenate([old_t, times])
+        cols = {name: np.concatenate([np.array(self._cols[name][:n]), data[:, j]])
+                for j, (name, _) in enumerate(COLUMNS[1:], start=1)}
+        # 稳定排序后同一时间保留后写入的（新数据）
+        order = np.argsort(all_t, kind="stable")
+        all_t = all_t[order]
+        keep = np.append(all_t[1:] != all_t[:-1], True)
+        all_t = all_t[keep]
+        m = len(all_t)
+        self._reserve(m)
+        self._cols["open_time"][:m] = all_t
+        for name in cols:
+            self._cols[name][:m] = cols[name][order][keep]
+        self.count = m
+
+    # ==================== 读取（零拷贝） ====================
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _view(self, i: int, j: int) -> Dict[str, np.ndarray]:
+        out = {}
+        for name, _ in COLUMNS:
+            v = self._cols[name][i:j]
+            v.flags.writeable = False
+            out[name] = v
+        return out
+
+    def index_of(self, open_time: int) -> int:
+        """open_time 在存储中的偏移（不存在时为插入位置）"""
+        return int(np.searchsorted(self._cols["open_time"][:self.count], open_time))
+
+    def range(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """open_time 位于 [start, end) 的K线，返回各列的只读视图"""
+        n = self.count
+        ot = self._cols["open_time"][:n]
+        i = int(np.searchsorted(ot, start)) if start is not None else 0
+        j = int(np.searchsorted(ot, end)) if end is not None else n
+        return self._view(i, j)
+
+    def tail(self, limit: int) -> Dict[str, np.ndarray]:
+        n = self.count
+        return self._view(max(0, n - limit), n)
+
+    def last_time(self) -> Optional[int]:
+        return int(self._cols["open_time"][self.count - 1]) if self.count else None
+
+
+_stores: Dict[Tuple[str, str], KlineStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(symbol: str = config.SYMBOL, interval: str = config.INTERVAL) -> KlineStore:
+    key = (symbol, interval)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = KlineStore(symbol, interval)
+        return store
+
+
+def sync_all():
+    """落盘所有存储中尚未落盘的写入"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.sync()
+        except Exception as e:  # pragma: no cover
+            print(f"列存储落盘失败 {store.symbol} {store.interval}: {e}")
+
+
+_sync_thread: Optional[threading.Thread] = None
+
+
+def _sync_loop():
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        sync_all()
+
+
+def _start_sync():
+    global _sync_thread
+    _sync_thread = threading.Thread(target=_sync_loop, name="kline-store-sync", daemon=True)
+    _sync_thread.start()
+    atexit.register(sync_all)
+
+
+def _on_kline_event(rows):
+    """insert_kline 写入 SQLite 后同步到列存储（rows 为9列元组）；只写内存，落盘交给后台线程"""
+    groups: Dict[Tuple[str, str], list] = {}
+    for symbol, interval, ot, o, h, l, c, v, _ in rows:
+        groups.setdefault((symbol, interval), []).append((ot, o, h, l, c, v))
+    for (symbol, interval), items in groups.items():
+        try:
+            get_store(symbol, interval).append(items, sync=False)
+        except Exception as e:  # pragma: no cover
+            print(f"列存储同步失败 {symbol} {interval}: {e}")
+    if _sync_thread is None:
+        _start_sync()
+
+
+if config.KLINE_STORE_ENABLED:
+    events.subscribe(events.KLINE, _on_kline_event)
+
+
+def import_from_sqlite(symbol: str = config.SYMBOL, interval: str = config.INTERVAL, full: bool = False) -> int:
+    """
+    从 klines 表导入列存储
+
+    默认只导入比存储中最新K线更新的部分；full=True 时导入全部（补洞、修复）。
+    """
+    from db import get_conn
+
+    store = get_store(symbol, interval)
+    after = -1 if full or not len(store) else store.last_time()
+    conn = get_conn()
+    cur = conn.execute(
+        "SELECT open_time, open, high, low, close, volume FROM klines WHERE symbol=? AND interval=? AND open_time>? ORDER BY open_time ASC",
+        (symbol, interval, after),
+    )
+    total = 0
+    while True:
+        rows = cur.fetchmany(100000)
+        if not rows:
+            break
+        store.append(rows)
+        total += len(rows)
+    return total
+
+
+def _bench(rows: int):
+    import tempfile
+
+    root = tempfile.mkdtemp(prefix="kline_store_bench_")
+    store = KlineStore("BENCH", "1m", root=root)
+    t = np.arange(rows, dtype=np.int64) * 60000
+    px = 50000 + np.cumsum(np.random.default_rng(0).normal(0, 10, rows))
+    t0 = time.perf_counter()
+    store.append(np.column_stack([t, px, px + 5, px - 5, px, np.ones(rows)]))
+    print(f"写入 {rows} 根K线: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    t0 = time.perf_counter()
+    reopened = KlineStore("BENCH", "1m", root=root)
+    cols = reopened.range()
+    closes = np.asarray(cols["close"])
+    print(f"打开并映射 {len(reopened)} 根K线: {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+    t0 = time.perf_counter()
+    mean = float(closes.mean())
+    print(f"全量收盘价均值 {mean:.2f}: {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        reopened.range(int(t[rows // 3]), int(t[rows // 2]))
+    print(f"按时间区间切片: {(time.perf_counter() - t0) * 1000:.3f} µs/次")
+
+    # 对比：从 SQLite 物化字典列表
+    import sqlite3
+
+    conn = sqlite3.connect(os.path.join(root, "bench.db"))
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE klines (open_time INTEGER, open REAL, high REAL, low REAL, close REAL, volume REAL)")
+    conn.executemany("INSERT INTO klines VALUES (?, ?, ?, ?, ?, ?)",
+                     zip(t.tolist(), px.tolist(), (px + 5).tolist(), (px - 5).tolist(), px.tolist(), [1.0] * rows))
+    conn.commit()
+    t0 = time.perf_counter()
+    dicts = [dict(r) for r in conn.execute("SELECT * FROM klines ORDER BY open_time")]
+    print(f"SQLite 物化 {len(dicts)} 个字典: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列式K线存储")
+    parser.add_argument("command", choices=["import", "info", "bench"])
+    parser.add_argument("--symbol", default=config.SYMBOL)
+    parser.add_argument("--interval", default=config.INTERVAL)
+    parser.add_argument("--full", action="store_true", help="导入全部K线（默认只导入增量）")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        t0 = time.perf_counter()
+        n = import_from_sqlite(args.symbol, args.interval, args.full)
+        store = get_store(args.symbol, args.interval)
+        print(f"导入 {n} 根K线，存储共 {len(store)} 根，用时 {time.perf_counter() - t0:.2f} 秒")
+    elif args.command == "info":
+        store = get_store(args.symbol, args.interval)
+        print(f"{store.path}: {len(store)} 根K线，容量 {store.capacity}，最新 open_time {store.last_time()}")
+    else:
+        _bench(args.rows)
+
+
+if __name__ == "__main__":
+    main()
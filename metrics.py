@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+交易热路径延迟统计
+每个阶段一个固定内存的对数-线性直方图（HDR 风格：每个二进制量级 64 个线性子桶，相对误差 < 1.6%，
+1µs ~ 60s 共 1331 个计数），记录一次只需一次下标计算和一次加法。
+
+一帧行情从 _consume 收到开始形成一条 trace（contextvars 传递，评估任务与 Trader 内无需传参），
+各阶段用单调时钟打点：
+    decode      行情帧解码（ws_decode）
+    frame       _on_kline 内的行情/指标更新（含收盘K线写库）
+    queue       收到行情到评估开始（调度等待）
+    bands       BOLL 计算
+    state       状态机判断（到开始下单前）
+    pretrade    下单前检查（余额、取整、校验）
+    order_ack   下单请求往返（发送到交易所确认返回）
+    fill        等待用户数据流成交推送
+    db_write    成交写库
+以及从收到行情起的累计延迟 tick_to_order（开始发送订单）、tick_to_ack（订单确认返回）。
+
+/api/metrics 返回各阶段分位数；后台线程定期把本周期的分位数写入 latency_snapshots 表（带版本号），
+部署后用 `python metrics.py report` 按版本对比各阶段延迟。
+"""
+
+import argparse
+import atexit
+import contextvars
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import config
+
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS       # 128：小于此值的微秒数精确计数
+HALF = SUB_COUNT >> 1           # 64：之后每个量级的线性子桶数
+MAX_US = 60_000_000             # 超过 60 秒的记为 60 秒
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _index(us: int) -> int:
+    if us < SUB_COUNT:
+        return us if us > 0 else 0
+    shift = us.bit_length() - SUB_BITS
+    return (shift + 1) * HALF + (us >> shift) - HALF
+
+
+def _value(index: int) -> float:
+    """桶的代表值（桶区间中点，微秒）"""
+    if index < SUB_COUNT:
+        return float(index)
+    shift = index // HALF - 1
+    return ((index - shift * HALF) << shift) + (1 << shift) / 2
+
+
+_SIZE = _index(MAX_US) + 1
+
+
+class Histogram:
+    """固定内存的延迟直方图（单位微秒）；单线程写入，其他线程可随时读取"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * _SIZE
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, us: int):
+        if us > MAX_US:
+            us = MAX_US
+        self.counts[_index(us)] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def copy(self) -> "Histogram":
+        h = Histogram()
+        h.counts = list(self.counts)
+        h.count, h.total, h.max = self.count, self.total, self.max
+        return h
+
+    def merge(self, other: "Histogram"):
+        """累加另一个直方图（合并各线程分片）"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def since(self, earlier: "Histogram") -> "Histogram":
+        """相对于较早副本的增量（max 取当前值的近似）"""
+        h = Histogram()
+        h.counts = [a - b for a, b in zip(self.counts, earlier.counts)]
+        h.count = self.count - earlier.count
+        h.total = self.total - earlier.total
+        h.max = self.max if h.count else 0
+        return h
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= rank:
+                    return min(_value(i), float(self.max))
+        return float(self.max)
+
+    def summary(self) -> Dict[str, float]:
+        """分位数摘要（毫秒）"""
+        out = {"count": self.count, "mean": self.total / self.count / 1000 if self.count else 0.0,
+               "max": self.max / 1000}
+        for q in PERCENTILES:
+            out[f"p{q * 100:g}"] = self.percentile(q) / 1000
+        return out
+
+
+STAGES = ("decode", "frame", "queue", "bands", "state", "pretrade", "order_ack", "fill", "db_write",
+          "tick_to_order", "tick_to_ack")
+histograms: Dict[str, Histogram] = {name: Histogram() for name in STAGES}
+_now = time.perf_counter_ns
+
+
+def observe(stage: str, start_ns: int):
+    """记录从 start_ns 到现在的耗时"""
+    if config.METRICS_ENABLED:
+        histograms[stage].record((_now() - start_ns) // 1000)
+
+
+class Trace:
+    """一帧行情触发的一次评估（及其下单）的打点记录"""
+
+    __slots__ = ("t0", "last", "done")
+
+    def __init__(self, t0: int):
+        self.t0 = t0
+        self.last = t0
+        self.done = set()
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("latency_trace", default=None)
+
+
+def start_trace(recv_ns: int) -> Optional[Trace]:
+    """在当前上下文（评估任务）开始一条 trace，recv_ns 为触发评估的行情到达时间"""
+    if not config.METRICS_ENABLED or not recv_ns:
+        _trace.set(None)
+        return None
+    trace = Trace(recv_ns)
+    _trace.set(trace)
+    return trace
+
+
+def mark(stage: str):
+    """记录上一个打点到现在的阶段耗时；同一 trace 内每个阶段只记一次"""
+    trace = _trace.get()
+    if trace is None or stage in trace.done:
+        return
+    now = _now()
+    histograms[stage].record((now - trace.last) // 1000)
+    trace.last = now
+    trace.done.add(stage)
+
+
+def mark_total(name: str):
+    """记录从收到行情到现在的累计耗时"""
+    trace = _trace.get()
+    if trace is None or name in trace.done:
+        return
+    histograms[name].record((_now() - trace.t0) // 1000)
+    trace.done.add(name)
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    return {name: h.summary() for name, h in histograms.items()}
+
+
+# ==================== 持久化 ====================
+
+def app_version() -> str:
+    """部署版本：APP_VERSION 环境变量，否则取 git 提交号"""
+    if config.APP_VERSION:
+        return config.APP_VERSION
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=2, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+class _Persister:
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._last: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self.version = ""
+
+    def start(self):
+        if self._thread is not None or not config.METRICS_ENABLED or config.METRICS_PERSIST_SEC <= 0:
+            return
+        self.version = app_version()
+        self._last = {name: h.copy() for name, h in histograms.items()}
+        self._thread = threading.Thread(target=self._run, name="metrics-persist", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(config.METRICS_PERSIST_SEC)
+            try:
+                self.flush()
+            except Exception as e:  # pragma: no cover
+                print(f"延迟统计落库失败: {e}")
+
+    def flush(self):
+        """把上次落库以来的增量分位数写入 latency_snapshots"""
+        from db import get_conn
+
+        with self._lock:
+            ts = int(time.time() * 1000)
+            rows = []
+            for name, h in histograms.items():
+                cur = h.copy()
+                delta = cur.since(self._last.get(name) or Histogram())
+                self._last[name] = cur
+                if not delta.count:
+                    continue
+                s = delta.summary()
+                rows.append((ts, self.version, name, s["count"], s["mean"], s["p50"], s["p90"], s["p99"], s["p99.9"], s["max"]))
+            if rows:
+                conn = get_conn()
+                conn.executemany(
+                    "INSERT INTO latency_snapshots(ts, version, stage, count, mean_ms, p50_ms, p90_ms, p99_ms, p999_ms, max_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.commit()
+
+
+persister = _Persister()
+
+
+def history(limit_versions: int = 5) -> List[Dict[str, float]]:
+    """最近几个版本各阶段的延迟（按样本数加权的平均分位数）"""
+    from db import get_conn
+
+    conn = get_conn()
+    cur = conn.execute(
+        """
+        WITH v AS (SELECT version, MAX(ts) AS last_ts FROM latency_snapshots GROUP BY version
+                   ORDER BY last_ts DESC LIMIT ?)
+        SELECT s.version, v.last_ts, s.stage, SUM(s.count) AS count,
+               SUM(s.p50_ms * s.count) / SUM(s.count) AS p50_ms,
+               SUM(s.p99_ms * s.count) / SUM(s.count) AS p99_ms,
+               MAX(s.max_ms) AS max_ms
+        FROM latency_snapshots s JOIN v ON s.version = v.version
+        GROUP BY s.version, s.stage ORDER BY v.last_ts DESC, s.stage
+        """,
+        (limit_versions,),
+    )
+    return [dict(r) for r in cur.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热路径延迟统计")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--versions", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = history(args.versions)
+    if not rows:
+        print("latency_snapshots 中还没有数据")
+        return
+    print(f"{'version':<12}{'stage':<15}{'count':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for r in rows:
+        print(f"{r['version']:<12}{r['stage']:<15}{r['count']:>10}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
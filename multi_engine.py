@@ -0,0 +1,149 @@
+"""
+多交易对引擎
+一个进程内为每个交易对运行一个 Engine 状态机，共享一个 Trader（REST 连接池、用户数据流、交易规则）、
+一个行情广播器和一份请求权重预算；行情通过组合流订阅，每个连接最多 STREAMS_PER_CONNECTION 个流，
+收到的推送解码（ws_decode）后按交易对路由到对应 Engine 的 _on_kline。
+
+用法:
+    SYMBOLS=BTCUSDT,ETHUSDT,SOLUSDT python webapp.py
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+from config import config
+from db import log
+from engine import Engine
+from trader import Trader
+from broadcast import TickBroadcaster
+from backfill import WeightBudget, backfill_gap
+from rest_client import AsyncFuturesClient, aiohttp
+import metrics
+import exporter
+import ws_decode
+from ws_decode import KlineEvent
+import ws_record
+
+
+class MultiEngine:
+    def __init__(self, symbols: Optional[List[str]] = None, socketio=None, trader=None):
+        self.symbols = list(dict.fromkeys(symbols or config.SYMBOLS))
+        self.socketio = socketio
+        self.trader = trader or Trader()
+        self.broadcaster = TickBroadcaster(socketio) if socketio else None
+        # 余额只查询一次，各交易对共用
+        balance = self.trader.get_balance()
+        self.engines: Dict[str, Engine] = {
+            s: Engine(socketio=socketio, trader=self.trader, symbol=s, broadcaster=self.broadcaster,
+                      initial_balance=balance)
+            for s in self.symbols
+        }
+        self.messages = 0
+        self.unrouted = 0
+        self.decoder = ws_decode.get_decoder()
+        self.recorder = None  # 所有组合流连接共用一个录制文件
+
+    @property
+    def primary(self) -> Engine:
+        """页面展示的交易对（config.SYMBOL，总是包含在 config.SYMBOLS 中）"""
+        return self.engines.get(config.SYMBOL) or self.engines[self.symbols[0]]
+
+    def set_boll_params(self, period: int, std: float):
+        """所有交易对共用同一组BOLL参数"""
+        for e in self.engines.values():
+            e.boll_period = period
+            e.boll_std = std
+        return period, std
+
+    async def bootstrap(self):
+        """并发补齐所有交易对的历史K线（共享连接池与权重预算）"""
+        if aiohttp is None:
+            print("aiohttp 未安装，无法获取历史 K 线。")
+            return
+        client = AsyncFuturesClient(api_key="", api_secret="", base_url=config.MARKET_REST_URL)
+        budget = WeightBudget(config.BACKFILL_WEIGHT_BUDGET)
+        try:
+            jobs = [(s, interval, initial) for s in self.symbols for interval, initial in self.engines[s].backfill_plan()]
+            results = await asyncio.gather(
+                *(backfill_gap(s, interval, initial, client=client, budget=budget) for s, interval, initial in jobs),
+                return_exceptions=True,
+            )
+        finally:
+            await client.close()
+        for (symbol, interval, _), res in zip(jobs, results):
+            if isinstance(res, Exception):
+                log("ERROR", f"bootstrap失败 {symbol} {interval}: {res}")
+            elif res["candles"]:
+                log("INFO", f"bootstrap 插入/补齐 {res['candles']} 条 K 线: {symbol} {interval}")
+        print(f"{len(self.symbols)} 个交易对K线补齐完成，消耗权重 {budget.used}")
+
+    async def drain(self, timeout: float = config.SHUTDOWN_DRAIN_SEC) -> bool:
+        """所有交易对停止评估，等待进行中的下单完成"""
+        results = await asyncio.gather(*(e.drain(timeout) for e in self.engines.values()))
+        return all(results)
+
+    def stream_urls(self) -> List[str]:
+        streams = [self.engines[s].stream_name() for s in self.symbols]
+        n = max(1, config.STREAMS_PER_CONNECTION)
+        return [f"{config.COMBINED_WS_URL}?streams={'/'.join(streams[i:i + n])}" for i in range(0, len(streams), n)]
+
+    def route(self, msg, recv_ns: int = 0):
+        """已解析为字典的组合流消息 {"stream": ..., "data": {...}} 按交易对分发"""
+        self.route_event(KlineEvent.from_dict(msg.get("data") or {}), recv_ns)
+
+    def route_event(self, ev: KlineEvent, recv_ns: int = 0):
+        eng = self.engines.get(ev.symbol)
+        self.messages += 1
+        if eng is None:
+            self.unrouted += 1
+            return
+        eng._on_kline(ev, recv_ns)
+
+    async def _run_connection(self, url: str, symbols: List[str]):
+        while True:
+            try:
+                # 每次(重)连接前重建本连接内各交易对的增量状态
+                for s in symbols:
+                    self.engines[s]._on_connect()
+                record = self.recorder.append if self.recorder is not None else None
+                if record is not None:
+                    self.recorder.mark_connect({s: self.engines[s].seed_rows() for s in symbols})
+                async with websockets.connect(url, ping_interval=15, ping_timeout=15, max_queue=1000) as ws:
+                    print(f"组合流连接成功: {len(symbols)} 个交易对")
+                    decode = self.decoder.decode_combined
+                    async for msg in ws:
+                        t0 = time.perf_counter_ns()
+                        if record is not None:
+                            record(msg, t0)
+                        exporter.WS_MESSAGES.inc()
+                        ev = decode(msg)
+                        metrics.observe("decode", t0)
+                        self.route_event(ev, t0)
+            except Exception as e:  # pragma: no cover
+                log("ERROR", f"ws error: {e}")
+                print(f"WebSocket连接错误: {e}")
+                exporter.WS_RECONNECTS.inc(1, "market")
+                await asyncio.sleep(3)
+
+    async def run_ws(self):
+        self._user_stream_task = asyncio.create_task(self.trader.run_user_stream())
+        await self.trader.refresh_exchange_info()
+        if self.recorder is not None:
+            self.recorder.close()  # 重新运行（自动重启）时结束上一个会话的录制
+        self.recorder = ws_record.open_recorder(self.symbols, combined=True)
+        n = max(1, config.STREAMS_PER_CONNECTION)
+        groups = [self.symbols[i:i + n] for i in range(0, len(self.symbols), n)]
+        await asyncio.gather(*(self._run_connection(url, g) for url, g in zip(self.stream_urls(), groups)))
+
+
+async def main():
+    me = MultiEngine()
+    await me.bootstrap()
+    await me.run_ws()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
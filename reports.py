@@ -0,0 +1,162 @@
+"""
+收益报表查询层
+汇总、按日、按交易对与持仓数据都来自与成交同一事务增量维护的 daily_stats / symbol_stats（见 db.add_trade），
+查询只与天数、交易对数有关，与成交笔数无关：
+    profit_report()   一条查询得到累计汇总与最近几天，另一条读取按交易对汇总
+    positions()       一条查询得到持仓、最新收盘价（相关子查询走K线索引）与已实现盈亏
+结果为只读的 NamedTuple，/api/profits_summary、/api/positions 与 /api/report 共用。
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+
+from config import config
+from db import get_conn
+
+DEFAULT_INITIAL_BALANCE = 40.0  # 没有记录初始余额时的默认值（与页面一致）
+
+
+class DayFigures(NamedTuple):
+    """一段时间（某一交易日或累计）的平仓统计"""
+    date: str
+    trade_count: int  # 平仓次数
+    profit_count: int
+    loss_count: int
+    pnl: float  # 平仓盈亏（未扣手续费）
+    fees: float  # 开仓+平仓手续费
+    initial_balance: float
+
+    @property
+    def net_profit(self) -> float:
+        return self.pnl - self.fees
+
+    @property
+    def profit_rate(self) -> float:
+        return self.net_profit / self.initial_balance * 100 if self.initial_balance and self.initial_balance > 0 else 0.0
+
+    def to_payload(self) -> Dict:
+        """页面使用的字段（profit 为扣除手续费后的净利润）"""
+        return {
+            'date': self.date,
+            'trade_count': self.trade_count,
+            'profit_count': self.profit_count,
+            'loss_count': self.loss_count,
+            'total_fees': self.fees,
+            'profit': self.net_profit,
+            'profit_rate': self.profit_rate,
+            'initial_balance': self.initial_balance,
+        }
+
+
+class SymbolFigures(NamedTuple):
+    symbol: str
+    trade_count: int  # 全部成交
+    close_count: int
+    profit_count: int
+    loss_count: int
+    pnl: float
+    fees: float
+    last_ts: Optional[int]
+
+    @property
+    def net_profit(self) -> float:
+        return self.pnl - self.fees
+
+
+class PositionFigures(NamedTuple):
+    symbol: str
+    side: str
+    qty: float
+    entry_price: float
+    ts: int
+    last_price: float  # 最新已收盘K线的收盘价，没有K线时为入场价
+    realized_pnl: float
+
+    @property
+    def unrealized_pnl(self) -> float:
+        if self.side == 'long':
+            return (self.last_price - self.entry_price) * self.qty
+        if self.side == 'short':
+            return (self.entry_price - self.last_price) * self.qty
+        return 0.0
+
+
+class ProfitReport(NamedTuple):
+    total: DayFigures  # date 为首个交易日
+    first_date: Optional[str]
+    days: List[DayFigures]  # 最近几天，日期降序
+    symbols: Dict[str, SymbolFigures]
+
+    def to_payload(self) -> Dict:
+        return {
+            'total': dict(self.total.to_payload(), first_date=self.first_date),
+            'days': [d.to_payload() for d in self.days],
+            'symbols': {s: dict(f._asdict(), net_profit=f.net_profit) for s, f in self.symbols.items()},
+        }
+
+
+def profit_report(recent_days: int = 2) -> ProfitReport:
+    """累计汇总、最近 recent_days 个有成交的交易日与按交易对汇总"""
+    conn = get_conn()
+    cur = conn.cursor()
+    # 一次查询：累计值（对全部交易日求和，只有一行）左连接最近几天及其当日初始余额；没有成交时日期列为 NULL
+    cur.execute(
+        """
+        WITH total AS (
+            SELECT COALESCE(SUM(close_count), 0) AS close_count,
+                   COALESCE(SUM(profit_count), 0) AS profit_count,
+                   COALESCE(SUM(loss_count), 0) AS loss_count,
+                   COALESCE(SUM(pnl), 0.0) AS pnl,
+                   COALESCE(SUM(fees), 0.0) AS fees,
+                   MIN(date) AS first_date,
+                   (SELECT initial_balance FROM daily_profits WHERE initial_balance > 0
+                    ORDER BY date ASC LIMIT 1) AS first_balance
+            FROM daily_stats
+        )
+        SELECT t.close_count AS total_close_count, t.profit_count AS total_profit_count,
+               t.loss_count AS total_loss_count, t.pnl AS total_pnl, t.fees AS total_fees,
+               t.first_date, t.first_balance,
+               d.date, d.close_count, d.profit_count, d.loss_count, d.pnl, d.fees,
+               p.date IS NOT NULL AS has_daily, p.initial_balance
+        FROM total t
+        LEFT JOIN (SELECT * FROM daily_stats ORDER BY date DESC LIMIT ?) d
+        LEFT JOIN daily_profits p ON p.date = d.date
+        ORDER BY d.date DESC
+        """,
+        (recent_days,),
+    )
+    rows = cur.fetchall()
+    head = rows[0]
+    total = DayFigures(head['first_date'] or "", head['total_close_count'], head['total_profit_count'],
+                       head['total_loss_count'], head['total_pnl'], head['total_fees'],
+                       head['first_balance'] or DEFAULT_INITIAL_BALANCE)
+    days = [
+        DayFigures(r['date'], r['close_count'], r['profit_count'], r['loss_count'], r['pnl'], r['fees'],
+                   r['initial_balance'] if r['has_daily'] else DEFAULT_INITIAL_BALANCE)
+        for r in rows if r['date'] is not None
+    ]
+    cur.execute("SELECT symbol, trade_count, close_count, profit_count, loss_count, pnl, fees, last_ts "
+                "FROM symbol_stats ORDER BY symbol")
+    symbols = {r['symbol']: SymbolFigures(*r) for r in cur.fetchall()}
+    conn.close()
+    return ProfitReport(total, total.date or None, days, symbols)
+
+
+def positions(interval: Optional[str] = None) -> List[PositionFigures]:
+    """数据库中的持仓，附带最新收盘价与该交易对的已实现盈亏（一条查询）"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT p.symbol, LOWER(COALESCE(p.side, '')) AS side, p.qty, p.entry_price, p.ts,
+               COALESCE((SELECT k.close FROM klines k WHERE k.symbol = p.symbol AND k.interval = ?
+                         ORDER BY k.open_time DESC LIMIT 1), p.entry_price) AS last_price,
+               COALESCE(ss.pnl, 0) AS realized_pnl
+        FROM positions p LEFT JOIN symbol_stats ss ON ss.symbol = p.symbol
+        ORDER BY p.symbol ASC
+        """,
+        (interval or config.INTERVAL,),
+    )
+    out = [PositionFigures(r['symbol'], r['side'], float(r['qty']), float(r['entry_price']), r['ts'],
+                           float(r['last_price']), float(r['realized_pnl'])) for r in cur.fetchall()]
+    conn.close()
+    return out
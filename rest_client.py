@@ -0,0 +1,177 @@
+"""
+异步币安 U 本位合约 REST 客户端
+基于 aiohttp 长连接池（keep-alive 复用 TLS 连接），进程内 HMAC-SHA256 签名，
+超时与重试可配置，并记录每个接口的调用延迟。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlencode
+
+from config import config
+import exporter
+
+try:
+    import aiohttp  # type: ignore
+except ImportError:  # pragma: no cover
+    aiohttp = None  # type: ignore
+
+
+def futures_rest_url() -> str:
+    if config.FUTURES_REST_URL:
+        return config.FUTURES_REST_URL.rstrip("/")
+    return "https://testnet.binancefuture.com" if config.USE_TESTNET else "https://fapi.binance.com"
+
+
+class BinanceAPIError(Exception):
+    """交易所返回的业务错误（与 python-binance 的 BinanceAPIException 文本格式一致）"""
+
+    def __init__(self, status: int, code: int, message: str):
+        super().__init__(f"APIError(code={code}): {message}")
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class AsyncFuturesClient:
+    # 可安全重试的 HTTP 状态码（限频、服务端错误）
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_key: str = config.API_KEY, api_secret: str = config.API_SECRET,
+                 base_url: Optional[str] = None, timeout: float = config.REST_TIMEOUT,
+                 max_retries: int = config.REST_MAX_RETRIES, pool_size: int = config.REST_POOL_SIZE):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp 未安装，无法使用异步 REST 客户端")
+        self.api_key = api_key
+        self.api_secret = (api_secret or "").encode()
+        self.base_url = (base_url or futures_rest_url()).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._session = None
+        self._loop = None
+        # 最近一次响应头 X-MBX-USED-WEIGHT-1M：本 IP 当前分钟已用的请求权重
+        self.used_weight = 0
+        # 每个接口最近的调用延迟（毫秒）
+        self.latency: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=500))
+
+    async def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # 会话与事件循环绑定，跨循环使用时重建
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"X-MBX-APIKEY": self.api_key} if self.api_key else None,
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _sign(self, params: Dict[str, Any]) -> str:
+        query = urlencode(params)
+        signature = hmac.new(self.api_secret, query.encode(), hashlib.sha256).hexdigest()
+        return f"{query}&signature={signature}"
+
+    async def request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                      signed: bool = False) -> Any:
+        """
+        发送请求并返回解析后的 JSON
+
+        GET 请求在超时、连接错误、429/5xx 时按指数退避重试；
+        下单等非幂等请求只在连接尚未建立（请求未发出）时重试，避免重复下单。
+        """
+        method = method.upper()
+        idempotent = method == "GET"
+        params = {k: (str(v).lower() if isinstance(v, bool) else v) for k, v in (params or {}).items() if v is not None}
+        attempt = 0
+        while True:
+            if signed:
+                params["timestamp"] = int(time.time() * 1000)
+                params.setdefault("recvWindow", config.RECV_WINDOW)
+                query = self._sign(params)
+            else:
+                query = urlencode(params)
+            url = f"{self.base_url}{path}" + (f"?{query}" if query else "")
+            session = await self._get_session()
+            t0 = time.perf_counter()
+            try:
+                async with session.request(method, url) as resp:
+                    text = await resp.text()
+                    status = resp.status
+                    weight = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+                    if weight:
+                        self.used_weight = int(weight)
+                        exporter.REST_WEIGHT.set(self.used_weight)
+            except aiohttp.ClientConnectorError:
+                # 连接未建立，请求尚未发出，任何方法都可以重试
+                if attempt >= self.max_retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+            else:
+                self.latency[f"{method} {path}"].append((time.perf_counter() - t0) * 1000)
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    # 非 JSON 响应（网关/CDN 的 502/503 页面、WAF 的 418 页面）：先看状态码，5xx/429 走重试
+                    if not (idempotent and status in self.RETRY_STATUS) or attempt >= self.max_retries:
+                        raise BinanceAPIError(status, -1, text[:200])
+                    attempt += 1
+                    await asyncio.sleep(min(0.2 * 2 ** attempt, 2.0))
+                    continue
+                if status < 400:
+                    return data
+                code = data.get("code", status) if isinstance(data, dict) else status
+                msg = data.get("msg", "") if isinstance(data, dict) else str(data)
+                if not (idempotent and status in self.RETRY_STATUS) or attempt >= self.max_retries:
+                    raise BinanceAPIError(status, code, msg)
+            attempt += 1
+            await asyncio.sleep(min(0.2 * 2 ** attempt, 2.0))
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """各接口延迟统计（毫秒）"""
+        stats = {}
+        for key, samples in self.latency.items():
+            if not samples:
+                continue
+            s = sorted(samples)
+            stats[key] = {
+                "count": len(s),
+                "avg": sum(s) / len(s),
+                "p50": s[len(s) // 2],
+                "p99": s[min(len(s) - 1, int(len(s) * 0.99))],
+                "max": s[-1],
+            }
+        return stats
+
+    # ==================== 常用接口 ====================
+
+    async def klines(self, symbol: str, interval: str, **params):
+        return await self.request("GET", "/fapi/v1/klines", {"symbol": symbol, "interval": interval, **params})
+
+    async def ticker_price(self, symbol: str) -> Dict[str, Any]:
+        return await self.request("GET", "/fapi/v1/ticker/price", {"symbol": symbol})
+
+    async def account(self) -> Dict[str, Any]:
+        return await self.request("GET", "/fapi/v2/account", signed=True)
+
+    async def position_risk(self, **params):
+        return await self.request("GET", "/fapi/v2/positionRisk", params, signed=True)
+
+    async def create_order(self, **params) -> Dict[str, Any]:
+        return await self.request("POST", "/fapi/v1/order", params, signed=True)
+
+    async def query_order(self, **params) -> Dict[str, Any]:
+        return await self.request("GET", "/fapi/v1/order", params, signed=True)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+引擎状态共享内存快照
+引擎进程（唯一写者）按固定频率把每个交易对的最新价格、BOLL、状态机、持仓与余额写入一段固定布局的共享内存，
+Web 进程（可以有多个）直接映射读取，不发请求、不加锁，也不与交易循环竞争 GIL。
+
+布局（小端）：
+    头部 16 字节    magic "BOLS" | 版本 u32 | 槽数 u32 | 槽大小 u32
+    每个交易对一个槽（64 字节对齐，第一个槽为主交易对）
+                    seq u64 | symbol 16s | state 32s | ts q | last_price d | up d | mid d | dn d |
+                    boll_period i | boll_std d | balance d | side 8s | qty d | entry_price d | halted ?
+每个槽用顺序锁（seqlock）保护：写者先把 seq 加一（奇数表示写入中），写完再加一；
+读者读取前后 seq 相同且为偶数才采用，否则重试。写者只有一个，读者永远不会阻塞写者。
+
+用法:
+    python shm_state.py          # 打印当前快照
+"""
+
+import argparse
+import asyncio
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple, Optional
+
+from config import config
+from db import get_position, log
+import events
+
+MAGIC = b"BOLS"
+VERSION = 1
+_HEADER = struct.Struct("<4sIII")
+_SEQ = struct.Struct("<Q")
+_BODY = struct.Struct("<16s32sqddddidd8sdd?")
+SLOT_SIZE = (_SEQ.size + _BODY.size + 63) // 64 * 64
+MAX_RETRIES = 100
+STALE_MS = 3000  # 超过该时间未更新视为写者已退出
+BALANCE_REFRESH_SEC = 10  # 用户数据流未连接时通过 REST 刷新余额的间隔
+ERROR_LOG_SEC = 60  # 同一错误重复出现时的日志间隔，其间只计数
+
+
+class EngineSnapshot(NamedTuple):
+    seq: int
+    symbol: str
+    state: str
+    ts: int  # 写入时间（毫秒）
+    last_price: float
+    up: float
+    mid: float
+    dn: float
+    boll_period: int
+    boll_std: float
+    balance: float
+    side: str  # long / short，无持仓为空串
+    qty: float
+    entry_price: float
+    halted: bool
+
+    @property
+    def age_ms(self) -> int:
+        return int(time.time() * 1000) - self.ts
+
+
+def _str(b: bytes) -> str:
+    return b.rstrip(b"\0").decode(errors="replace")
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """只读方映射已有的段；不登记到 resource_tracker，否则读者退出时会删除写者的段"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class StateWriter:
+    """引擎进程中的写者；engines 的第一个为主交易对"""
+
+    def __init__(self, engines: List, trader, name: str = config.ENGINE_SHM_NAME):
+        self.engines = engines
+        self.trader = trader
+        self.name = name
+        size = _HEADER.size + SLOT_SIZE * len(engines)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 上次异常退出留下的段
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.buf = self.shm.buf
+        self._seq = [0] * len(engines)
+        _HEADER.pack_into(self.buf, 0, MAGIC, VERSION, len(engines), SLOT_SIZE)
+        self.balance = engines[0].initial_balance
+        self._balance_ts = time.monotonic()
+        # 错误类别 -> [最近的错误信息, 最近记录时间, 之后被抑制的次数]
+        self._errors: Dict[str, list] = {}
+        self._positions: Dict[str, tuple] = {}
+        for e in engines:
+            pos = get_position(e.symbol)
+            self._positions[e.symbol] = (pos["side"], pos["qty"], pos["entry_price"]) if pos else ("", 0.0, 0.0)
+        events.subscribe(events.POSITION, self._on_position)
+
+    def _on_position(self, payload):
+        side = payload.get("side")
+        self._positions[payload["symbol"]] = (side, payload["qty"], payload["entry_price"]) if side else ("", 0.0, 0.0)
+
+    def _write(self, i: int, values: tuple):
+        off = _HEADER.size + i * SLOT_SIZE
+        seq = self._seq[i] + 1
+        _SEQ.pack_into(self.buf, off, seq)  # 奇数：写入中
+        _BODY.pack_into(self.buf, off + _SEQ.size, *values)
+        _SEQ.pack_into(self.buf, off, seq + 1)
+        self._seq[i] = seq + 1
+
+    def publish(self):
+        ts = int(time.time() * 1000)
+        for i, e in enumerate(self.engines):
+            up, mid, dn = e.last_bands
+            side, qty, entry = self._positions.get(e.symbol, ("", 0.0, 0.0))
+            self._write(i, (e.symbol.encode(), e.state.encode(), ts, e.last_price, up, mid, dn,
+                            e.boll_period, e.boll_std, self.balance, (side or "").encode(), qty, entry, e.halted))
+
+    async def _refresh_balance(self) -> bool:
+        """刷新余额，返回本次是否实际更新"""
+        stream = self.trader.stream
+        if stream is not None and stream.connected:
+            self.balance = stream.available_balance()
+        elif time.monotonic() - self._balance_ts >= BALANCE_REFRESH_SEC:
+            self._balance_ts = time.monotonic()
+            self.balance = await self.trader.get_balance_async()
+        else:
+            return False
+        return True
+
+    def _report(self, kind: str, level: str, message: str):
+        """错误信息变化或距上次记录超过 ERROR_LOG_SEC 秒才写日志，并附带期间被抑制的次数"""
+        now = time.monotonic()
+        last = self._errors.get(kind)
+        if last is not None and last[0] == message and now - last[1] < ERROR_LOG_SEC:
+            last[2] += 1
+            return
+        suppressed = last[2] if last is not None else 0
+        self._errors[kind] = [message, now, 0]
+        log(level, f"{message}（此前 {suppressed} 次重复未记录）" if suppressed else message)
+
+    def _recovered(self, kind: str, message: str):
+        last = self._errors.pop(kind, None)
+        if last is not None:
+            log("INFO", f"{message}（此前 {last[2]} 次重复未记录）" if last[2] else message)
+
+    async def run(self, hz: float = config.ENGINE_SHM_HZ):
+        period = 1.0 / hz
+        while True:
+            try:
+                if await self._refresh_balance():
+                    self._recovered("balance", "余额刷新已恢复")
+            except Exception as e:
+                # 余额刷新失败不影响写快照，沿用上次的余额
+                self._report("balance", "WARNING", f"共享内存快照余额刷新失败: {e}")
+            try:
+                self.publish()
+            except Exception as e:
+                self._report("publish", "ERROR", f"共享内存快照写入失败: {e}")
+            else:
+                self._recovered("publish", "共享内存快照写入已恢复")
+            await asyncio.sleep(period)
+
+    def close(self):
+        events.unsubscribe(events.POSITION, self._on_position)
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class StateReader:
+    """Web 进程中的读者；段不存在或写者长时间未更新时自动重新映射（引擎进程重启后会新建段）"""
+
+    def __init__(self, name: str = config.ENGINE_SHM_NAME):
+        self.name = name
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self._slots: Dict[str, int] = {}
+        self._next_attach = 0.0
+        self.retries = 0
+
+    def _open(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_attach:
+            return False
+        self._next_attach = now + 1.0
+        self.close()
+        try:
+            shm = _attach(self.name)
+        except (FileNotFoundError, ValueError):
+            return False
+        magic, version, nslots, slot_size = _HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            shm.close()
+            return False
+        self.shm = shm
+        self._slots = {}
+        return True
+
+    def _read_slot(self, i: int) -> Optional[EngineSnapshot]:
+        buf = self.shm.buf
+        off = _HEADER.size + i * SLOT_SIZE
+        for _ in range(MAX_RETRIES):
+            s1 = _SEQ.unpack_from(buf, off)[0]
+            if s1 & 1:
+                self.retries += 1
+                continue
+            body = _BODY.unpack_from(buf, off + _SEQ.size)
+            if _SEQ.unpack_from(buf, off)[0] != s1:
+                self.retries += 1
+                continue
+            if s1 == 0:
+                return None  # 尚未写入
+            (symbol, state, ts, last_price, up, mid, dn, period, std, balance, side, qty, entry, halted) = body
+            return EngineSnapshot(s1, _str(symbol), _str(state), ts, last_price, up, mid, dn, period, std,
+                                  balance, _str(side), qty, entry, halted)
+        return None
+
+    def all(self) -> List[EngineSnapshot]:
+        """所有交易对的快照（主交易对在前）；写者不存在或已停止更新时为空"""
+        if self.shm is None and not self._open():
+            return []
+        nslots = _HEADER.unpack_from(self.shm.buf, 0)[2]
+        slots = [(i, self._read_slot(i)) for i in range(nslots)]
+        snaps = [s for _, s in slots if s is not None]
+        if not snaps or snaps[0].age_ms > STALE_MS:
+            # 引擎进程可能已重启（新建了段），之后的读取重新映射
+            self.close()
+            return []
+        self._slots = {s.symbol: i for i, s in slots if s is not None}
+        return snaps
+
+    def read(self, symbol: Optional[str] = None) -> Optional[EngineSnapshot]:
+        """某个交易对（默认主交易对）的最新快照"""
+        if self.shm is None and not self._open():
+            return None
+        i = self._slots.get(symbol, -1) if symbol else 0
+        if i < 0:
+            snaps = self.all()
+            return next((s for s in snaps if s.symbol == symbol), None)
+        snap = self._read_slot(i)
+        if snap is not None and snap.age_ms > STALE_MS:
+            self.close()
+            return None
+        return snap
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="引擎状态共享内存快照")
+    parser.add_argument("--name", default=config.ENGINE_SHM_NAME)
+    args = parser.parse_args()
+
+    snaps = StateReader(args.name).all()
+    if not snaps:
+        print(f"共享内存 {args.name} 不存在或引擎进程未在更新")
+        return
+    for s in snaps:
+        pos = f"{s.side} {s.qty:.6f} @ {s.entry_price:.2f}" if s.side else "无持仓"
+        print(f"{s.symbol:<12}{s.state:<28}价格 {s.last_price:.2f}  UP {s.up:.2f} MID {s.mid:.2f} DN {s.dn:.2f}  "
+              f"余额 {s.balance:.2f}  {pos}  seq={s.seq} {s.age_ms}ms 前")
+
+
+if __name__ == "__main__":
+    main()
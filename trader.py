@@ -1,9 +1,15 @@
 import asyncio
+import itertools
 import time
 from typing import Optional, Dict, Any
 
 from config import config
 from db import add_trade, set_position, get_position, close_position, log
+from rest_client import AsyncFuturesClient, aiohttp
+from user_stream import UserDataStream
+from exchange_info import exchange_info
+import metrics
+import exporter
 
 try:
     from binance.client import Client as UMFutures  # type: ignore
@@ -17,9 +23,19 @@ except ImportError:
 class Trader:
     def __init__(self):
         self.client = None
+        # 异步 REST 客户端（长连接池），下单和查询不阻塞 websocket 事件循环
+        self.rest = AsyncFuturesClient() if aiohttp is not None and config.API_KEY else None
+        # 用户数据流：本地维护余额、持仓与成交（需要异步 REST 客户端申请 listenKey）
+        self.stream = UserDataStream(self.rest) if self.rest is not None and config.USER_STREAM_ENABLED else None
+        self._order_seq = itertools.count(1)
         self.dual_side_position = False  # 是否支持双向持仓
+        self.last_order_latency_ms = 0.0
         if UMFutures is not None and config.API_KEY:
-            if config.USE_TESTNET:
+            if config.FUTURES_REST_URL:
+                # 自定义地址（本地模拟交易所等）：同步客户端的合约接口也指向它，不访问现货 ping
+                self.client = UMFutures(api_key=config.API_KEY, api_secret=config.API_SECRET, ping=False)
+                self.client.FUTURES_URL = f"{config.FUTURES_REST_URL.rstrip('/')}/fapi"
+            elif config.USE_TESTNET:
                 # 对于测试网，需要使用不同的初始化方式
                 self.client = UMFutures(api_key=config.API_KEY, api_secret=config.API_SECRET, testnet=True)
             else:
@@ -29,6 +45,101 @@ class Trader:
             # 尝试开启双向持仓模式
             self._setup_dual_side_position()
 
+    async def _create_order(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """发送订单：优先使用异步连接池，否则放到线程中调用同步客户端"""
+        side = params.get("side", "")
+        exporter.ORDERS.inc(1, side)
+        t0 = time.perf_counter()
+        try:
+            if self.rest is not None:
+                res = await self.rest.create_order(**params)
+            else:
+                res = await asyncio.to_thread(self.client.futures_create_order, **params)
+        except Exception:
+            exporter.ORDER_FAILURES.inc(1, side)
+            raise
+        elapsed = time.perf_counter() - t0
+        self.last_order_latency_ms = elapsed * 1000
+        exporter.ORDER_SECONDS.observe(elapsed)
+        return res
+
+    def _client_order_id(self) -> str:
+        return f"boll-{int(time.time() * 1000)}-{next(self._order_seq)}"
+
+    async def _submit_order(self, params: Dict[str, Any]):
+        """
+        下单并等待成交推送
+
+        Returns:
+            (res, fill): fill 为用户数据流中的成交结果（均价、成交量、实际手续费、已实现盈亏），
+            数据流未连接或超时时为 None
+        """
+        metrics.mark("pretrade")
+        metrics.mark_total("tick_to_order")
+        # 始终带上 clientOrderId：下单响应超时后可以按它确认订单状态
+        cid = self._client_order_id()
+        params["newClientOrderId"] = cid
+        waiter = self.stream.expect_fill(cid) if self.stream is not None and self.stream.connected else None
+        fill = None
+        try:
+            try:
+                res = await self._create_order(params)
+            except asyncio.TimeoutError:
+                # 请求可能已到达交易所，订单状态未知：继续等成交推送，或按 clientOrderId 查询
+                log("WARNING", f"下单响应超时，订单状态未知: {cid}")
+                res = None
+            else:
+                metrics.mark("order_ack")
+                metrics.mark_total("tick_to_ack")
+            if waiter is not None:
+                try:
+                    fill = await asyncio.wait_for(waiter, config.USER_STREAM_FILL_TIMEOUT)
+                    metrics.mark("fill")
+                    if fill["executedQty"] <= 0 or fill["avgPrice"] <= 0:
+                        fill = None
+                except asyncio.TimeoutError:
+                    log("WARNING", f"等待成交推送超时: {cid}")
+        finally:
+            if waiter is not None:
+                self.stream.forget(cid)
+        if res is None:
+            res = await self._confirm_order(params["symbol"], cid, fill)
+        return res, fill
+
+    async def _confirm_order(self, symbol: str, cid: str, fill: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        下单响应超时后确认订单结果：有成交推送时直接采用，否则按 clientOrderId 查询订单
+
+        订单不存在（-2013）或未成交时抛出异常，由调用方按下单失败处理
+        """
+        if fill is not None:
+            return {"clientOrderId": cid, "status": fill["status"],
+                    "avgPrice": fill["avgPrice"], "executedQty": fill["executedQty"]}
+        if self.rest is not None:
+            res = await self.rest.query_order(symbol=symbol, origClientOrderId=cid)
+        else:
+            res = await asyncio.to_thread(self.client.futures_get_order, symbol=symbol, origClientOrderId=cid)
+        if float(res.get("executedQty", 0)) <= 0:
+            raise RuntimeError(f"订单 {cid} 未成交 (status={res.get('status')})")
+        log("INFO", f"下单响应超时，查询确认订单已成交: {cid} {res.get('status')}")
+        return res
+
+    async def run_user_stream(self):
+        if self.stream is not None:
+            await self.stream.run()
+
+    async def refresh_exchange_info(self):
+        """启动时确保交易规则缓存可用，之后后台按 TTL 刷新"""
+        await exchange_info.ensure_fresh(self.rest)
+        self._exchange_info_task = asyncio.create_task(exchange_info.run_refresh_loop(self.rest))
+
+    async def _market_price(self, symbol: str) -> float:
+        if self.rest is not None:
+            ticker = await self.rest.ticker_price(symbol)
+        else:
+            ticker = await asyncio.to_thread(self.client.futures_symbol_ticker, symbol=symbol)
+        return float(ticker.get("price", 0))
+
     def _setup_dual_side_position(self):
         """设置双向持仓模式"""
         if self.client is None:
@@ -49,21 +160,20 @@ class Trader:
                 self.dual_side_position = False
                 log("WARNING", f"无法开启双向持仓模式: {e}，将使用单向持仓模式")
 
-    async def place_order(self, side: str, qty: float, price: Optional[float] = None):
+    async def place_order(self, side: str, qty: float, price: Optional[float] = None, symbol: Optional[str] = None):
         ts = int(time.time() * 1000)
-        symbol = config.SYMBOL
+        symbol = symbol or config.SYMBOL
 
-        if self.client is None:
+        if self.client is None and self.rest is None:
             log("ERROR", "Binance client not initialized")
             return {"error": "Binance client not initialized"}
 
-        # 处理数量精度，BTCUSDT通常是3位小数
-        qty = round(qty, 3)
-        
-        # 确保数量大于最小值
-        if qty < 0.001:
-            log("WARNING", f"Order quantity {qty} is too small, minimum is 0.001")
-            return {"error": "Quantity too small"}
+        # 按交易对的数量步长向下取整，并在本地校验最小/最大数量、最小名义价值和杠杆分层上限
+        qty = exchange_info.quantize_qty(symbol, qty)
+        error = exchange_info.validate(symbol, qty, price)
+        if error:
+            log("WARNING", error)
+            return {"error": error}
 
         # 真实交易
         try:
@@ -78,8 +188,11 @@ class Trader:
             if self.dual_side_position:
                 position_side = "LONG" if side == "BUY" else "SHORT"
                 params["positionSide"] = position_side
-            res = self.client.futures_create_order(**params)
+            res, fill = await self._submit_order(params)
             avg_price = float(res.get("avgPrice", 0)) if isinstance(res, dict) else 0.0
+            if fill:
+                # 用户数据流推送的实际成交均价
+                avg_price = fill["avgPrice"]
             
             # 如果avgPrice为0，尝试获取当前市场价格
             if avg_price == 0.0 and price is not None:
@@ -88,47 +201,46 @@ class Trader:
             elif avg_price == 0.0:
                 # 如果没有提供价格，尝试获取当前市场价格
                 try:
-                    ticker = self.client.futures_symbol_ticker(symbol=symbol)
-                    avg_price = float(ticker.get("price", 0))
+                    avg_price = await self._market_price(symbol)
                     log("WARNING", f"Order avgPrice is 0, using current market price: {avg_price}")
                 except Exception as e:
                     log("ERROR", f"Failed to get market price: {e}")
                     avg_price = 0.0
             
-            # 计算手续费：交易金额 * 手续费率
+            # 手续费：优先使用成交推送中的实际手续费，否则按 交易金额 * 手续费率 估算
             trade_amount = qty * avg_price
-            fee = trade_amount * config.FEE_RATE
+            fee = fill["commission"] if fill and fill["commission"] > 0 else trade_amount * config.FEE_RATE
             add_trade(ts, symbol, side, qty, avg_price, simulate=False, fee=fee)
             if side == "BUY":
                 set_position(symbol, "long", qty, avg_price, ts)
             else:
                 set_position(symbol, "short", qty, avg_price, ts)
-            log("INFO", f"REAL ORDER {side} {qty} @ {avg_price}")
+            metrics.mark("db_write")
+            log("INFO", f"REAL ORDER {side} {qty} @ {avg_price} ({self.last_order_latency_ms:.0f}ms)")
             return res
         except Exception as e:  # pragma: no cover
             log("ERROR", f"order failed: {e}")
             return {"error": str(e)}
 
-    async def close_all(self, current_price: Optional[float] = None) -> float:
-        pos = get_position(config.SYMBOL)
+    async def close_all(self, current_price: Optional[float] = None, symbol: Optional[str] = None) -> float:
+        symbol = symbol or config.SYMBOL
+        pos = get_position(symbol)
         if not pos:
             return 0.0
         side = pos["side"]
         qty = pos["qty"]
         ts = int(time.time() * 1000)
-        symbol = config.SYMBOL
         close_side = "SELL" if side == "long" else "BUY"
 
-        if self.client is None:
+        if self.client is None and self.rest is None:
             log("ERROR", "Binance client not initialized")
             return 0.0
 
-        # 处理数量精度，BTCUSDT通常是3位小数
-        qty = round(qty, 3)
-        
-        # 确保数量大于最小值
-        if qty < 0.001:
-            log("WARNING", f"Close quantity {qty} is too small, minimum is 0.001")
+        # 按交易对的数量步长取整；平仓是减仓单，不受最小名义价值限制
+        qty = exchange_info.quantize_qty(symbol, qty)
+        error = exchange_info.validate(symbol, qty, current_price, reduce_only=True)
+        if error:
+            log("WARNING", f"Close rejected: {error}")
             return 0.0
 
         # 真实平仓
@@ -147,8 +259,10 @@ class Trader:
             else:
                 # 单向持仓模式下使用reduceOnly
                 params["reduceOnly"] = True
-            res = self.client.futures_create_order(**params)
+            res, fill = await self._submit_order(params)
             exit_price = float(res.get("avgPrice", 0))
+            if fill:
+                exit_price = fill["avgPrice"]
             
             # 如果avgPrice为0，尝试获取当前市场价格
             if exit_price == 0.0 and current_price is not None:
@@ -157,55 +271,73 @@ class Trader:
             elif exit_price == 0.0:
                 # 如果没有提供当前价格，尝试获取市场价格
                 try:
-                    ticker = self.client.futures_symbol_ticker(symbol=symbol)
-                    exit_price = float(ticker.get("price", 0))
+                    exit_price = await self._market_price(symbol)
                     log("WARNING", f"Close avgPrice is 0, using current market price: {exit_price}")
                 except Exception as e:
                     log("ERROR", f"Failed to get market price for close: {e}")
                     exit_price = 0.0
             
             pnl = (exit_price - pos["entry_price"]) * qty if side == "long" else (pos["entry_price"] - exit_price) * qty
-            # 计算手续费：交易金额 * 手续费率
+            if fill and fill["realized_pnl"]:
+                # 交易所按实际开仓均价结算的已实现盈亏
+                pnl = fill["realized_pnl"]
+            # 手续费：优先使用成交推送中的实际手续费，否则按 交易金额 * 手续费率 估算
             trade_amount = qty * exit_price
-            fee = trade_amount * config.FEE_RATE
+            fee = fill["commission"] if fill and fill["commission"] > 0 else trade_amount * config.FEE_RATE
             add_trade(ts, symbol, f"CLOSE_{side.upper()}", qty, exit_price, pnl, simulate=False, fee=fee)
             close_position(symbol)
-            log("INFO", f"REAL CLOSE {side} {qty} @ {exit_price}")
+            metrics.mark("db_write")
+            log("INFO", f"REAL CLOSE {side} {qty} @ {exit_price} ({self.last_order_latency_ms:.0f}ms)")
             return exit_price
         except Exception as e:  # pragma: no cover
             log("ERROR", f"close failed: {e}")
             return 0.0
 
     def get_balance(self) -> float:
+        """同步查询余额（供 Web 接口和初始化使用）"""
         if self.client is None:
             log("ERROR", "Binance client not initialized")
             return 0.0
         try:
             # 使用futures_account()方法获取账户信息，包含可用余额
-            account_info = self.client.futures_account()
-            if account_info is None:
-                log("ERROR", "Failed to get account info: futures_account() returned None")
-                return 0.0
-            
-            # 获取各种余额信息
-            available_balance = float(account_info.get('availableBalance', 0))
-            wallet_balance = float(account_info.get('totalWalletBalance', 0))
-            unrealized_pnl = float(account_info.get('totalUnrealizedProfit', 0))
-            
-            # 详细记录余额信息
-            #log("INFO", f"余额详情 - 钱包总余额: {wallet_balance:.2f}, 可用余额: {available_balance:.2f}, 未实现盈亏: {unrealized_pnl:.2f}")
-            
-            if available_balance <= 0:
-                log("WARNING", f"Available balance is {available_balance}, using wallet balance as fallback")
-                return wallet_balance
-            
-            # 使用可用余额进行交易
-            #log("INFO", f"使用可用余额进行交易: {available_balance:.2f} USDT")
-            return available_balance
+            return self._parse_balance(self.client.futures_account())
         except Exception as e:
             log("ERROR", f"Failed to get balance: {str(e)}")
             return 0.0
 
+    async def get_balance_async(self) -> float:
+        """异步查询余额（供引擎事件循环使用），用户数据流已连接时直接读取本地状态"""
+        if self.stream is not None and self.stream.connected:
+            return self.stream.available_balance()
+        if self.rest is None:
+            return await asyncio.to_thread(self.get_balance)
+        try:
+            return self._parse_balance(await self.rest.account())
+        except Exception as e:
+            log("ERROR", f"Failed to get balance: {str(e)}")
+            return 0.0
+
+    def _parse_balance(self, account_info: Optional[Dict[str, Any]]) -> float:
+        if account_info is None:
+            log("ERROR", "Failed to get account info: futures_account() returned None")
+            return 0.0
+        
+        # 获取各种余额信息
+        available_balance = float(account_info.get('availableBalance', 0))
+        wallet_balance = float(account_info.get('totalWalletBalance', 0))
+        unrealized_pnl = float(account_info.get('totalUnrealizedProfit', 0))
+        
+        # 详细记录余额信息
+        #log("INFO", f"余额详情 - 钱包总余额: {wallet_balance:.2f}, 可用余额: {available_balance:.2f}, 未实现盈亏: {unrealized_pnl:.2f}")
+        
+        if available_balance <= 0:
+            log("WARNING", f"Available balance is {available_balance}, using wallet balance as fallback")
+            return wallet_balance
+        
+        # 使用可用余额进行交易
+        #log("INFO", f"使用可用余额进行交易: {available_balance:.2f} USDT")
+        return available_balance
+
     def get_positions(self):
         """获取实际持仓信息"""
         if self.client is None:
@@ -213,18 +345,36 @@ class Trader:
             return []
         
         try:
-            positions = self.client.futures_position_information()
-            if positions is None:
-                log("ERROR", "Failed to get positions: get_position_risk() returned None")
-                return []
-            
-            # 只返回有持仓的交易对
-            active_positions = []
-            for pos in positions:
-                position_amt = float(pos.get('positionAmt', 0))
-                if position_amt != 0:
-                    active_positions.append(pos)
-            return active_positions
+            return self._active_positions(self.client.futures_position_information())
+        except Exception as e:
+            log("ERROR", f"Failed to get positions: {str(e)}")
+            return []
+
+    async def get_positions_async(self):
+        """异步获取实际持仓信息"""
+        if self.stream is not None and self.stream.connected:
+            return self.stream.active_positions()
+        if self.rest is None:
+            return await asyncio.to_thread(self.get_positions)
+        try:
+            return self._active_positions(await self.rest.position_risk())
         except Exception as e:
             log("ERROR", f"Failed to get positions: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def _active_positions(self, positions):
+        if positions is None:
+            log("ERROR", "Failed to get positions: get_position_risk() returned None")
+            return []
+        
+        # 只返回有持仓的交易对
+        active_positions = []
+        for pos in positions:
+            position_amt = float(pos.get('positionAmt', 0))
+            if position_amt != 0:
+                active_positions.append(pos)
+        return active_positions
+
+    async def close(self):
+        if self.rest is not None:
+            await self.rest.close()
@@ -0,0 +1,166 @@
+"""
+合约用户数据流
+通过 listenKey 订阅 ORDER_TRADE_UPDATE / ACCOUNT_UPDATE，在本地维护余额、持仓和订单成交，
+下单前查询余额、成交均价和手续费都从本地状态读取，不再调用 REST。
+
+连接后先取一次 REST 快照（余额、持仓）作为基准，之后完全由推送更新；
+ACCOUNT_UPDATE 推送的是绝对值，快照前后重复应用也不会出错。
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+import websockets
+
+from config import config
+from db import log
+from rest_client import AsyncFuturesClient
+import exporter
+
+
+def user_ws_url() -> str:
+    if config.USER_WS_URL:
+        return config.USER_WS_URL.rstrip("/")
+    return "wss://stream.binancefuture.com/ws" if config.USE_TESTNET else "wss://fstream.binance.com/ws"
+
+
+class UserDataStream:
+    KEEPALIVE_SEC = 30 * 60  # listenKey 60分钟过期，每30分钟续期
+
+    def __init__(self, rest: AsyncFuturesClient, asset: str = "USDT"):
+        self.rest = rest
+        self.asset = asset
+        self.connected = False
+        self.cross_wallet = 0.0
+        self.wallet = 0.0
+        # (symbol, positionSide) -> 与 positionRisk 字段一致的持仓字典
+        self.positions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # 快照时可用余额与按推送字段估算值的差（挂单占用等推送中没有的部分）
+        self._available_offset = 0.0
+        # clientOrderId -> 等待成交的 Future 与累计的手续费/已实现盈亏
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._fills: Dict[str, Dict[str, float]] = {}
+        self.events = 0
+
+    # ==================== 本地状态 ====================
+
+    def _estimate_available(self) -> float:
+        margin = 0.0
+        unrealized = 0.0
+        for p in self.positions.values():
+            amt = float(p["positionAmt"])
+            lev = float(p.get("leverage") or config.LEVERAGE) or 1.0
+            margin += abs(amt) * float(p["entryPrice"]) / lev
+            unrealized += float(p.get("unRealizedProfit", 0))
+        return self.cross_wallet - margin + unrealized
+
+    def available_balance(self) -> float:
+        available = self._estimate_available() + self._available_offset
+        # 与 Trader._parse_balance 一致：可用余额异常时退回钱包余额
+        return available if available > 0 else self.wallet
+
+    def active_positions(self) -> List[Dict[str, Any]]:
+        return [dict(p) for p in self.positions.values() if float(p["positionAmt"]) != 0]
+
+    async def _snapshot(self):
+        account = await self.rest.account()
+        for a in account.get("assets", []):
+            if a.get("asset") == self.asset:
+                self.wallet = float(a.get("walletBalance", 0))
+                self.cross_wallet = float(a.get("crossWalletBalance", self.wallet))
+        self.positions = {}
+        for p in await self.rest.position_risk():
+            self.positions[(p["symbol"], p.get("positionSide", "BOTH"))] = p
+        self._available_offset = float(account.get("availableBalance", 0)) - self._estimate_available()
+
+    # ==================== 订单成交 ====================
+
+    def expect_fill(self, client_order_id: str) -> asyncio.Future:
+        """下单前登记，成交推送（可能早于 REST 响应）到达时完成"""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[client_order_id] = fut
+        self._fills[client_order_id] = {"commission": 0.0, "realized_pnl": 0.0}
+        return fut
+
+    def forget(self, client_order_id: str):
+        self._waiters.pop(client_order_id, None)
+        self._fills.pop(client_order_id, None)
+
+    def _on_order_update(self, o: Dict[str, Any]):
+        cid = o.get("c")
+        acc = self._fills.get(cid)
+        if acc is None:
+            return
+        if float(o.get("l", 0)) > 0:
+            if o.get("N") == self.asset:
+                acc["commission"] += float(o.get("n", 0))
+            acc["realized_pnl"] += float(o.get("rp", 0))
+        if o.get("X") in ("FILLED", "CANCELED", "EXPIRED", "REJECTED"):
+            fut = self._waiters.pop(cid, None)
+            self._fills.pop(cid, None)
+            if fut is not None and not fut.done():
+                fut.set_result({
+                    "status": o.get("X"),
+                    "avgPrice": float(o.get("ap", 0)),
+                    "executedQty": float(o.get("z", 0)),
+                    "commission": acc["commission"],
+                    "realized_pnl": acc["realized_pnl"],
+                })
+
+    def _on_account_update(self, a: Dict[str, Any]):
+        for b in a.get("B", []):
+            if b.get("a") == self.asset:
+                self.wallet = float(b.get("wb", self.wallet))
+                self.cross_wallet = float(b.get("cw", self.cross_wallet))
+        for p in a.get("P", []):
+            key = (p["s"], p.get("ps", "BOTH"))
+            pos = self.positions.setdefault(key, {"symbol": p["s"], "positionSide": key[1]})
+            pos["positionAmt"] = p.get("pa", "0")
+            pos["entryPrice"] = p.get("ep", "0")
+            pos["unRealizedProfit"] = p.get("up", "0")
+            pos["marginType"] = p.get("mt", pos.get("marginType"))
+
+    def handle(self, msg: Dict[str, Any]):
+        self.events += 1
+        event = msg.get("e")
+        if event == "ORDER_TRADE_UPDATE":
+            self._on_order_update(msg.get("o", {}))
+        elif event == "ACCOUNT_UPDATE":
+            self._on_account_update(msg.get("a", {}))
+        elif event == "listenKeyExpired":
+            raise ConnectionError("listenKey 已过期")
+
+    # ==================== 连接 ====================
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_SEC)
+            try:
+                await self.rest.request("PUT", "/fapi/v1/listenKey")
+            except Exception as e:  # pragma: no cover
+                log("WARNING", f"listenKey 续期失败: {e}")
+
+    async def run(self):
+        """保持用户数据流连接（断线自动重连并重新取快照）"""
+        while True:
+            keepalive = None
+            try:
+                key = (await self.rest.request("POST", "/fapi/v1/listenKey"))["listenKey"]
+                async with websockets.connect(f"{user_ws_url()}/{key}", ping_interval=15, ping_timeout=15) as ws:
+                    await self._snapshot()
+                    self.connected = True
+                    log("INFO", "用户数据流已连接")
+                    keepalive = asyncio.create_task(self._keepalive())
+                    async for msg in ws:
+                        self.handle(json.loads(msg))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # pragma: no cover
+                log("ERROR", f"user stream error: {e}")
+            finally:
+                self.connected = False
+                if keepalive is not None:
+                    keepalive.cancel()
+            exporter.WS_RECONNECTS.inc(1, "user")
+            await asyncio.sleep(3)
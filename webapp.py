@@ -1,29 +1,63 @@
 print("=== webapp.py 启动开始 ===")
 
+from config import config
+
+# 生产模式的异步 worker 必须在导入其他模块前打补丁；未安装对应包时退回 threading
+ASYNC_MODE = config.WEB_SERVER if config.WEB_SERVER in ("eventlet", "gevent") else "threading"
+# 配置的 WEB_SERVER 无法使用时的原因，db 导入后写入日志
+_ASYNC_FALLBACK = None
+if ASYNC_MODE != config.WEB_SERVER:
+    _ASYNC_FALLBACK = f"未知的 WEB_SERVER={config.WEB_SERVER}，使用 threading 模式"
+try:
+    if ASYNC_MODE == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+    elif ASYNC_MODE == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+except ImportError as e:
+    _ASYNC_FALLBACK = f"WEB_SERVER={ASYNC_MODE} 不可用（{e}），使用 threading 模式"
+    ASYNC_MODE = "threading"
+if _ASYNC_FALLBACK:
+    print(_ASYNC_FALLBACK)
+
 import threading
 import time
 import psutil
 import os
 import socket
 import asyncio
-from flask import Flask, render_template_string, jsonify, request
+import signal
+from flask import Flask, Response, g, render_template_string, jsonify, request
 from flask_socketio import SocketIO, emit
 import logging
+from typing import Dict, Optional
 
 print("基础模块导入完成")
 
-from config import config
 print(f"config导入完成，WEB_PORT={config.WEB_PORT}")
 
-from db import get_conn, init_db, latest_kline_time, get_position, get_daily_profits
+from db import get_conn, init_db, latest_kline_time, get_position, get_daily_profits, recent_logs, log_writer, trade_date, log
 print("db模块导入完成")
+if _ASYNC_FALLBACK:
+    log("WARNING", _ASYNC_FALLBACK)
 
 from engine import Engine
+from multi_engine import MultiEngine
+import engine_ipc
+import events
+import metrics
+import exporter
+from api_cache import ResponseCache
+import reports
 print("engine模块导入完成")
 
 from indicators import bollinger_bands
+import numpy as np
 import pandas as pd
 from db import fetch_klines
+from kline_store import get_store
+import kline_store
 print("其他模块导入完成")
 
 print("开始初始化数据库...")
@@ -31,9 +65,18 @@ init_db()
 print("数据库初始化完成")
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
+# 接口响应缓存：按数据变更事件失效，页面数量增加不增加计算量
+api_cache = ResponseCache()
+api_cache.watch(events.KLINE, lambda rows: any(r[0] == config.SYMBOL and r[1] == config.INTERVAL for r in rows))
+api_cache.watch(events.LOG, lambda rec: rec["level"] != "DEBUG")
+
+
+def _boll_params():
+    return config.BOLL_PERIOD, config.BOLL_STD
+
 # 工具：UTC+8 时间格式（月-日 时:分）
 def fmt_ts_utc8(ts_ms: int) -> str:
     return time.strftime('%m-%d %H:%M', time.gmtime(ts_ms / 1000 + 8 * 3600))
@@ -785,31 +828,181 @@ async function fetchPriceAndBoll() {
   }
 }
 
+// ===== 渲染函数：首次加载（HTTP 快照）与 Socket.IO 推送共用 =====
+
+// 系统信息 - 标题行一行展示
+function renderSystem(sys) {
+  if (sys) {
+    // 判断是否需要警告颜色
+    const cpuClass = sys.cpu > 80 ? 'sys-warning' : '';
+    const memClass = sys.mem > 85 ? 'sys-warning' : '';
+    const diskClass = sys.disk > 90 ? 'sys-warning' : '';
+      
+    const sysLine = `CPU <span class="${cpuClass}">${sys.cpu}%</span> | C${sys.cpu_cores} | MEM<span class="${memClass}">${sys.mem}%</span> (${sys.mem_total_mb}M/${sys.mem_available_mb}M) | Disk<span class="${diskClass}">${sys.disk}%</span> (${sys.disk_total_gb}G/${sys.disk_free_gb}G)`;
+    const sysEl = document.getElementById('sysline');
+    if (sysEl) sysEl.innerHTML = sysLine;
+  }
+}
+
+// 实时余额
+function renderBalance(balanceData) {
+  if (balanceData && typeof balanceData.balance !== 'undefined') {
+    const balanceEl = document.getElementById('balance');
+    if (balanceEl) balanceEl.innerText = fmt2(balanceData.balance);
+  }
+}
+
+// positions (multi-symbol)
+function renderPositions(posData) {
+  const posDiv = document.getElementById('pos');
+  if (!posData || !posData.items || posData.items.length === 0) { 
+    posDiv.innerText = '无持仓'; 
+  } else {
+    let parts = [];
+    for (const p of posData.items){
+       const sideClass = p.side.toLowerCase() === 'long' ? 'position-long' : 'position-short';
+       // 强平价格颜色：short=绿色，long=红色
+       const liquidationClass = p.side.toLowerCase() === 'short' ? 'text-success' : 'text-danger';
+       parts.push(
+         `<div class="mb-2">
+           <div class="position-item">
+             <span class="position-key">方向:</span>
+             <span class="position-value"><span class="${sideClass}">${p.side}</span></span>
+           </div>
+             
+           <div class="position-item">
+             <span class="position-key">持仓金额:</span>
+             <span class="position-value">${fmt2(p.qty_usdt)} USDT</span>
+           </div>
+           <div class="position-item">
+             <span class="position-key">数量:</span>
+             <span class="position-value">${(Math.abs(p.qty_usdt) / p.entry_price).toFixed(4)}</span>
+           </div>
+           <div class="position-item">
+             <span class="position-key">开仓价格:</span>
+             <span class="position-value">${fmt2(p.entry_price)}</span>
+           </div>
+           <div class="position-item">
+             <span class="position-key">保证金:</span>
+             <span class="position-value">${fmt2(p.open_amount)} USDT</span>
+           </div>
+           <div class="position-item">
+             <span class="position-key">未实现盈亏:</span>
+             <span class="position-value ${p.unrealized_pnl >= 0 ? 'text-success' : 'text-danger'}">${fmt2(p.unrealized_pnl)} USDT</span>
+           </div>
+           <div class="position-item">
+             <span class="position-key">强平价格:</span>
+             <span class="position-value ${liquidationClass}">${fmt2(p.liquidation_price)}</span>
+           </div>
+         </div>`
+       );
+    }
+    posDiv.innerHTML = parts.join('<hr class="my-2">');
+  }
+}
+
+// 交易记录（最新在前，最多50条）
+let tradeItems = [];
+
+function renderTrades() {
+  const ul = document.getElementById('trades'); 
+  ul.innerHTML='';
+  tradeItems.forEach(t=>{ 
+    const li = document.createElement('li'); 
+    li.className='list-group-item';
+    if (t.text && t.text.includes('平仓')) { li.classList.add('trade-close'); }
+    li.innerHTML = t.text || ''; 
+    ul.appendChild(li); 
+  });
+}
+
+// 系统日志（最新在前，最多200行）
+let logLines = [];
+
+function renderLogs() {
+  let logText = logLines.join('\\n');
+
+  // 为止损和止盈日志添加颜色标识
+  logText = logText.replace(/(.*止损.*)/g, '<span class="log-stop-loss">$1</span>');
+  logText = logText.replace(/(.*止盈.*)/g, '<span class="log-take-profit">$1</span>');
+
+  // 为状态添加颜色标识
+  logText = logText.replace(/(.*holding_long.*)/g, '<span class="log-holding-long">$1</span>');
+  logText = logText.replace(/(.*holding_short.*)/g, '<span class="log-holding-short">$1</span>');
+  logText = logText.replace(/(.*waiting.*)/g, '<span class="log-waiting">$1</span>');
+
+  // 为突破信息添加颜色标识
+  logText = logText.replace(/(.*收盘价突破.*)/g, '<span class="log-breakout">$1</span>');
+  logText = logText.replace(/(.*收盘价跌破.*)/g, '<span class="log-breakout">$1</span>');
+      
+  document.getElementById('logs').innerHTML = logText;
+}
+
+// 盈利统计 - 汇总、当天、昨天
+function renderProfits(profits) {
+  if (profits && Array.isArray(profits)) {
+    const profitsBody = document.getElementById('profits');
+    profitsBody.innerHTML = '';
+      
+    // 只显示前3行数据（汇总、当天、昨天）
+    const displayData = profits.slice(0, 3);
+      
+    displayData.forEach((p, index) => {
+      const tr = document.createElement('tr');
+        
+      // 汇总行使用特殊样式
+      if (index === 0) {
+        tr.style.backgroundColor = 'var(--cloud-white)';
+        tr.style.fontWeight = '600';
+      }
+        
+      const dateTd = document.createElement('td'); 
+      dateTd.textContent = p.date || ''; 
+      tr.appendChild(dateTd);
+        
+      const countTd = document.createElement('td'); 
+      countTd.textContent = p.trade_count || 0; 
+      tr.appendChild(countTd);
+        
+      const lossCountTd = document.createElement('td'); 
+      lossCountTd.textContent = p.loss_count || 0; 
+      lossCountTd.className = 'text-danger'; 
+      tr.appendChild(lossCountTd);
+        
+      const profitCountTd = document.createElement('td'); 
+      profitCountTd.textContent = p.profit_count || 0;
+      profitCountTd.className = 'text-success'; 
+      tr.appendChild(profitCountTd);
+        
+      const feesTd = document.createElement('td'); 
+      feesTd.textContent = fmt2(p.total_fees || 0);
+      feesTd.className = 'text-danger'; 
+      tr.appendChild(feesTd);
+        
+      const profitTd = document.createElement('td'); 
+      profitTd.textContent = fmt2(p.profit || 0);
+      profitTd.className = (p.profit || 0) >= 0 ? 'text-success' : 'text-danger'; 
+      tr.appendChild(profitTd);
+        
+      const rateTd = document.createElement('td'); 
+      rateTd.textContent = fmt2(p.profit_rate || 0) + '%'; 
+      tr.appendChild(rateTd);
+        
+      profitsBody.appendChild(tr);
+    });
+  }
+}
+
+// 首次加载与断线重连后拉取完整快照，之后由 Socket.IO 推送增量
 async function refresh(){
-  // 系统信息 - 标题行一行展示
   try {
-    const sys = await fetchJSON('/api/system');
-    if (sys) {
-      // 判断是否需要警告颜色
-      const cpuClass = sys.cpu > 80 ? 'sys-warning' : '';
-      const memClass = sys.mem > 85 ? 'sys-warning' : '';
-      const diskClass = sys.disk > 90 ? 'sys-warning' : '';
-      
-      const sysLine = `CPU <span class="${cpuClass}">${sys.cpu}%</span> | C${sys.cpu_cores} | MEM<span class="${memClass}">${sys.mem}%</span> (${sys.mem_total_mb}M/${sys.mem_available_mb}M) | Disk<span class="${diskClass}">${sys.disk}%</span> (${sys.disk_total_gb}G/${sys.disk_free_gb}G)`;
-      const sysEl = document.getElementById('sysline');
-      if (sysEl) sysEl.innerHTML = sysLine;
-    }
+    renderSystem(await fetchJSON('/api/system'));
   } catch (e) {
     console.error('获取系统信息失败:', e);
   }
 
-  // 获取实时余额
   try {
-    const balanceData = await fetchJSON('/api/balance');
-    if (balanceData && typeof balanceData.balance !== 'undefined') {
-      const balanceEl = document.getElementById('balance');
-      if (balanceEl) balanceEl.innerText = fmt2(balanceData.balance);
-    }
+    renderBalance(await fetchJSON('/api/balance'));
   } catch (e) {
     console.error('获取余额失败:', e);
     const balanceEl = document.getElementById('balance');
@@ -818,54 +1011,8 @@ async function refresh(){
     }
   }
 
-  // positions (multi-symbol)
   try {
-    const posData = await fetchJSON('/api/positions');
-    const posDiv = document.getElementById('pos');
-    if (!posData || !posData.items || posData.items.length === 0) { 
-      posDiv.innerText = '无持仓'; 
-    } else {
-      let parts = [];
-      for (const p of posData.items){
-         const sideClass = p.side.toLowerCase() === 'long' ? 'position-long' : 'position-short';
-         // 强平价格颜色：short=绿色，long=红色
-         const liquidationClass = p.side.toLowerCase() === 'short' ? 'text-success' : 'text-danger';
-         parts.push(
-           `<div class="mb-2">
-             <div class="position-item">
-               <span class="position-key">方向:</span>
-               <span class="position-value"><span class="${sideClass}">${p.side}</span></span>
-             </div>
-             
-             <div class="position-item">
-               <span class="position-key">持仓金额:</span>
-               <span class="position-value">${fmt2(p.qty_usdt)} USDT</span>
-             </div>
-             <div class="position-item">
-               <span class="position-key">数量:</span>
-               <span class="position-value">${(Math.abs(p.qty_usdt) / p.entry_price).toFixed(4)}</span>
-             </div>
-             <div class="position-item">
-               <span class="position-key">开仓价格:</span>
-               <span class="position-value">${fmt2(p.entry_price)}</span>
-             </div>
-             <div class="position-item">
-               <span class="position-key">保证金:</span>
-               <span class="position-value">${fmt2(p.open_amount)} USDT</span>
-             </div>
-             <div class="position-item">
-               <span class="position-key">未实现盈亏:</span>
-               <span class="position-value ${p.unrealized_pnl >= 0 ? 'text-success' : 'text-danger'}">${fmt2(p.unrealized_pnl)} USDT</span>
-             </div>
-             <div class="position-item">
-               <span class="position-key">强平价格:</span>
-               <span class="position-value ${liquidationClass}">${fmt2(p.liquidation_price)}</span>
-             </div>
-           </div>`
-         );
-      }
-      posDiv.innerHTML = parts.join('<hr class="my-2">');
-    }
+    renderPositions(await fetchJSON('/api/positions'));
   } catch (e) {
     console.error('获取持仓失败:', e);
     const posDiv = document.getElementById('pos');
@@ -874,103 +1021,29 @@ async function refresh(){
     }
   }
 
-  // 交易记录
   try {
     const trades = await fetchJSON('/api/trades');
     if (trades && Array.isArray(trades)) {
-      const ul = document.getElementById('trades'); 
-      ul.innerHTML='';
-      trades.forEach(t=>{ 
-        const li = document.createElement('li'); 
-        li.className='list-group-item';
-        if (t.text && t.text.includes('平仓')) { li.classList.add('trade-close'); }
-        li.innerHTML = t.text || ''; 
-        ul.appendChild(li); 
-      });
+      tradeItems = trades;
+      renderTrades();
     }
   } catch (e) {
     console.error('获取交易记录失败:', e);
   }
 
-  // 系统日志
   try {
     const logs = await fetch('/api/logs');
     if (logs.ok) {
-      let logText = await logs.text();
-      
-      // 为止损和止盈日志添加颜色标识
-      logText = logText.replace(/(.*止损.*)/g, '<span class="log-stop-loss">$1</span>');
-      logText = logText.replace(/(.*止盈.*)/g, '<span class="log-take-profit">$1</span>');
-      
-      // 为状态添加颜色标识
-      logText = logText.replace(/(.*holding_long.*)/g, '<span class="log-holding-long">$1</span>');
-      logText = logText.replace(/(.*holding_short.*)/g, '<span class="log-holding-short">$1</span>');
-      logText = logText.replace(/(.*waiting.*)/g, '<span class="log-waiting">$1</span>');
-      
-      // 为突破信息添加颜色标识
-      logText = logText.replace(/(.*收盘价突破.*)/g, '<span class="log-breakout">$1</span>');
-      logText = logText.replace(/(.*收盘价跌破.*)/g, '<span class="log-breakout">$1</span>');
-      
-      document.getElementById('logs').innerHTML = logText;
+      const text = await logs.text();
+      logLines = text ? text.split('\\n') : [];
+      renderLogs();
     }
   } catch (e) {
     console.error('获取日志失败:', e);
   }
 
-  // 盈利统计 - 使用新的汇总API
   try {
-    const profits = await fetchJSON('/api/profits_summary');
-    if (profits && Array.isArray(profits)) {
-      const profitsBody = document.getElementById('profits');
-      profitsBody.innerHTML = '';
-      
-      // 只显示前3行数据（汇总、当天、昨天）
-      const displayData = profits.slice(0, 3);
-      
-      displayData.forEach((p, index) => {
-        const tr = document.createElement('tr');
-        
-        // 汇总行使用特殊样式
-        if (index === 0) {
-          tr.style.backgroundColor = 'var(--cloud-white)';
-          tr.style.fontWeight = '600';
-        }
-        
-        const dateTd = document.createElement('td'); 
-        dateTd.textContent = p.date || ''; 
-        tr.appendChild(dateTd);
-        
-        const countTd = document.createElement('td'); 
-        countTd.textContent = p.trade_count || 0; 
-        tr.appendChild(countTd);
-        
-        const lossCountTd = document.createElement('td'); 
-        lossCountTd.textContent = p.loss_count || 0; 
-        lossCountTd.className = 'text-danger'; 
-        tr.appendChild(lossCountTd);
-        
-        const profitCountTd = document.createElement('td'); 
-        profitCountTd.textContent = p.profit_count || 0;
-        profitCountTd.className = 'text-success'; 
-        tr.appendChild(profitCountTd);
-        
-        const feesTd = document.createElement('td'); 
-        feesTd.textContent = fmt2(p.total_fees || 0);
-        feesTd.className = 'text-danger'; 
-        tr.appendChild(feesTd);
-        
-        const profitTd = document.createElement('td'); 
-        profitTd.textContent = fmt2(p.profit || 0);
-        profitTd.className = (p.profit || 0) >= 0 ? 'text-success' : 'text-danger'; 
-        tr.appendChild(profitTd);
-        
-        const rateTd = document.createElement('td'); 
-        rateTd.textContent = fmt2(p.profit_rate || 0) + '%'; 
-        tr.appendChild(rateTd);
-        
-        profitsBody.appendChild(tr);
-      });
-    }
+    renderProfits(await fetchJSON('/api/profits_summary'));
   } catch (e) {
     console.error('获取盈利统计失败:', e);
   }
@@ -1148,44 +1221,43 @@ function initKlineChart() {
   });
 }
 
-// 获取K线数据并更新图表
-async function updateKlineChart() {
+// K线列式二进制接口：小端 float64，各列依次排列
+const KLINE_COLUMNS = ['t', 'o', 'h', 'l', 'c', 'v', 'up', 'mid', 'dn'];
+let klineCursor = null;  // 图表最后一根K线的 open_time，增量请求的游标
+
+async function fetchKlineColumns(query) {
+  const response = await fetch(`/api/kline_data?format=bin&${query}`, { headers: { 'Cache-Control': 'no-cache' } });
+  if (!response.ok) {
+    throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+  }
+  const buf = new Float64Array(await response.arrayBuffer());
+  const n = buf.length / KLINE_COLUMNS.length;
+  const cols = {};
+  KLINE_COLUMNS.forEach((k, j) => { cols[k] = buf.subarray(j * n, (j + 1) * n); });
+  const klines = [];
+  const boll = [];
+  for (let i = 0; i < n; i++) {
+    klines.push({ time: cols.t[i], open: cols.o[i], high: cols.h[i], low: cols.l[i], close: cols.c[i], volume: cols.v[i] });
+    boll.push({ time: cols.t[i], upper: cols.up[i], middle: cols.mid[i], lower: cols.dn[i] });
+  }
+  return { klines, boll };
+}
+
+// 获取K线数据并更新图表：已有数据时只请求游标之后的K线并追加，full 为 true 时重新加载
+async function updateKlineChart(full = false) {
+  if (!klineChart) {
+    initKlineChart();
+  }
   try {
     const limit = document.getElementById('klineLimit').value || 50;
-    const data = await fetchJSON(`/api/kline_data?limit=${limit}`);
-    
-    if (data && data.klines && data.boll && Array.isArray(data.klines) && Array.isArray(data.boll)) {
-      klineData = data.klines;
-      const bollData = data.boll;
-      
-      // 准备蜡烛图数据
-      const candlestickData = klineData.map(k => ({
-        x: k.time,
-        o: k.open,
-        h: k.high,
-        l: k.low,
-        c: k.close
-      }));
-      
-      // 准备BOLL数据 - 使用时间戳作为x轴
-      const bollUpper = bollData.map(b => ({ x: b.time, y: b.upper }));
-      const bollMiddle = bollData.map(b => ({ x: b.time, y: b.middle }));
-      const bollLower = bollData.map(b => ({ x: b.time, y: b.lower }));
-      
-      // 更新图表数据
-      if (klineChart) {
-        klineChart.data.datasets[0].data = candlestickData;
-        klineChart.data.datasets[1].data = bollUpper;
-        klineChart.data.datasets[2].data = bollMiddle;
-        klineChart.data.datasets[3].data = bollLower;
-        klineChart.update('none'); // 无动画更新
-      }
-
-      // 更新实时数据显示
-      updateRealTimeData(klineData, bollData);
-    } else {
-      console.warn('K线数据或BOLL数据无效:', data);
-    }
+    const incremental = !full && klineCursor !== null && klineChart.data.datasets[0].data.length > 0;
+    const data = await fetchKlineColumns(incremental ? `limit=${limit}&since=${klineCursor}` : `limit=${limit}`);
+    if (!incremental) {
+      klineChart.data.datasets.forEach(d => { d.data = []; });
+      klineData = [];
+      klineCursor = null;
+    }
+    applyKlineDelta(data);
   } catch (e) {
     console.error('获取K线数据失败:', e);
   }
@@ -1228,25 +1300,75 @@ function updateRealTimeData(klineData, bollData) {
   }
 }
 
+// 合并推送的K线增量：相同时间的K线替换，新K线追加，并保持显示数量
+function applyKlineDelta(data) {
+  if (!klineChart || !data || !Array.isArray(data.klines) || !Array.isArray(data.boll)) {
+    return;
+  }
+  if (data.klines.length === 0) {
+    klineChart.update('none');
+    return;
+  }
+  const limit = Number(document.getElementById('klineLimit').value || 50);
+  const ds = klineChart.data.datasets;
+  data.klines.forEach((k, i) => {
+    const b = data.boll[i];
+    const points = [
+      { x: k.time, o: k.open, h: k.high, l: k.low, c: k.close },
+      { x: b.time, y: b.upper },
+      { x: b.time, y: b.middle },
+      { x: b.time, y: b.lower }
+    ];
+    const last = ds[0].data.length - 1;
+    if (last >= 0 && ds[0].data[last].x === k.time) {
+      points.forEach((p, j) => { ds[j].data[last] = p; });
+      klineData[klineData.length - 1] = k;
+    } else if (last < 0 || ds[0].data[last].x < k.time) {
+      points.forEach((p, j) => { ds[j].data.push(p); });
+      klineData.push(k);
+    }
+  });
+  while (ds[0].data.length > limit) {
+    ds.forEach(d => d.data.shift());
+    klineData.shift();
+  }
+  klineCursor = ds[0].data[ds[0].data.length - 1].x;
+  klineChart.update('none');
+  updateRealTimeData(data.klines, data.boll);
+}
+
 // K线数量选择器事件监听
 document.addEventListener('DOMContentLoaded', function() {
-  // 初始化K线图
-  initKlineChart();
+  // 初始化K线图（首次加载数据时可能已经初始化）
+  if (!klineChart) {
+    initKlineChart();
+  }
   
   // 监听K线数量选择器变化
   const klineLimitSelect = document.getElementById('klineLimit');
   if (klineLimitSelect) {
     klineLimitSelect.addEventListener('change', function() {
-      updateKlineChart();
+      updateKlineChart(true);
     });
   }
 });
 
 // 初始化Socket.IO连接
 const socket = io();
+const PAGE_SYMBOL = '{{ cfg.SYMBOL }}';
 
-// 监听实时价格更新
+// 监听实时价格更新（服务端按固定帧率合并推送，可能同时带有 BOLL 字段）
 socket.on('price_update', function(data) {
+  // 多交易对时每个交易对单独推送，页面只显示当前交易对
+  if (data && data.symbol && data.symbol !== PAGE_SYMBOL) {
+    return;
+  }
+  if (data && data.boll_up) {
+    current_boll = { boll_up: data.boll_up, boll_mid: data.boll_mid, boll_dn: data.boll_dn };
+    if (!data.price) {
+      updatePriceAndBoll();
+    }
+  }
   if (data && data.price) {
     // 更新全局价格变量
     current_price = data.price;
@@ -1262,17 +1384,42 @@ socket.on('price_update', function(data) {
   }
 });
 
-// 连接状态监听
+// 服务端在数据变化时推送的增量
+socket.on('system', renderSystem);
+socket.on('balance', renderBalance);
+socket.on('positions', renderPositions);
+socket.on('profits', renderProfits);
+socket.on('kline', applyKlineDelta);
+
+socket.on('trades', function(data) {
+  if (data && Array.isArray(data.items)) {
+    tradeItems = data.items.concat(tradeItems).slice(0, 50);
+    renderTrades();
+  }
+});
+
+socket.on('logs', function(data) {
+  if (data && Array.isArray(data.lines)) {
+    logLines = data.lines.concat(logLines).slice(0, 200);
+    renderLogs();
+  }
+});
+
+// 连接状态监听：断线期间可能错过推送，重连后重新拉取快照
+let socketConnectedOnce = false;
 socket.on('connect', function() {
   console.log('Socket.IO连接已建立');
+  if (socketConnectedOnce) {
+    refresh();
+  }
+  socketConnectedOnce = true;
 });
 
 socket.on('disconnect', function() {
   console.log('Socket.IO连接已断开');
 });
 
-// 减少轮询频率，主要用于其他数据更新（非价格数据）
-setInterval(refresh, 10000); // 改为10秒更新一次其他数据
+// 首次加载完整数据，之后不再轮询
 refresh();
 </script>
 </body>
@@ -1285,11 +1432,10 @@ def index():
     return render_template_string(TEMPLATE, cfg=config)
 
 
-@app.get("/api/system")
-def api_system():
+def _system_payload():
     vm = psutil.virtual_memory()
     du = psutil.disk_usage("/")
-    return jsonify({
+    return {
         "cpu": psutil.cpu_percent(interval=None),
         "cpu_cores": psutil.cpu_count(logical=True),
         "mem": vm.percent,
@@ -1298,7 +1444,34 @@ def api_system():
         "disk": du.percent,
         "disk_total_gb": round(du.total / (1024 * 1024 * 1024), 1),
         "disk_free_gb": round(du.free / (1024 * 1024 * 1024), 1),
-    })
+    }
+
+
+@app.get("/api/system")
+def api_system():
+    return jsonify(_system_payload())
+
+
+@app.before_request
+def _request_timer_start():
+    g.request_t0 = time.perf_counter()
+
+
+@app.after_request
+def _request_timer_stop(response):
+    t0 = g.get("request_t0")
+    if t0 is not None:
+        # 按路由规则统计（/api/xxx 而非带参数的完整路径），避免标签基数无限增长
+        endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        exporter.HTTP_REQUESTS.inc(1, endpoint, request.method, str(response.status_code))
+        exporter.HTTP_SECONDS.observe(time.perf_counter() - t0, endpoint, request.method)
+    return response
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus 文本格式指标"""
+    return Response(exporter.registry.expose(), content_type=exporter.CONTENT_TYPE)
 
 
 # 兼容旧接口（单一文本）
@@ -1319,8 +1492,7 @@ def api_position_compat():
 
 
 # 多交易币对持仓列表
-@app.get("/api/positions")
-def api_positions():
+def _positions_payload():
     items = []
     
     # 优先从实际API获取持仓信息
@@ -1356,51 +1528,24 @@ def api_positions():
     
     # 如果没有API持仓或获取失败，从数据库获取
     if not items:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT symbol, side, qty, entry_price, ts FROM positions ORDER BY symbol ASC")
-        rows = [dict(r) for r in cur.fetchall()]
-        
-        # 预取各symbol最新价格
-        latest = {}
-        for r in rows:
-            cur.execute("SELECT close FROM klines WHERE symbol=? AND interval=? ORDER BY open_time DESC LIMIT 1", (r['symbol'], config.INTERVAL))
-            k = cur.fetchone()
-            latest[r['symbol']] = float(k['close']) if k else r['entry_price']
-        
-        # 计算
-        for r in rows:
-            side_raw = (r['side'] or '').lower()
-            side = 'long' if side_raw == 'long' else ('short' if side_raw == 'short' else side_raw)
-            last_price = latest.get(r['symbol'], r['entry_price'])
-            qty = float(r['qty'])
-            entry = float(r['entry_price'])
-            
-            # 未实现盈亏
-            if side == 'long':
-                unrealized = (last_price - entry) * qty
-            elif side == 'short':
-                unrealized = (entry - last_price) * qty
-            else:
-                unrealized = 0.0
-            
-            # 已实现盈亏（基于trades.pnl汇总，若未维护则为0）
-            cur.execute("SELECT COALESCE(SUM(pnl),0) AS s FROM trades WHERE symbol=?", (r['symbol'],))
-            realized = float(cur.fetchone()['s'])
-            
+        for p in reports.positions():
             items.append({
-                'symbol': r['symbol'],
-                'side': side,
-                'qty': qty,
-                'entry_price': entry,
-                'open_amount': qty * entry,
-                'open_time': fmt_ts_utc8(r['ts']),
-                'unrealized_pnl': unrealized,
-                'realized_pnl': realized,
+                'symbol': p.symbol,
+                'side': p.side,
+                'qty': p.qty,
+                'entry_price': p.entry_price,
+                'open_amount': p.qty * p.entry_price,
+                'open_time': fmt_ts_utc8(p.ts),
+                'unrealized_pnl': p.unrealized_pnl,
+                'realized_pnl': p.realized_pnl,
             })
-        conn.close()
     
-    return jsonify({'items': items})
+    return {'items': items}
+
+
+@app.get("/api/positions")
+def api_positions():
+    return jsonify(_positions_payload())
 
 
 @app.route('/api/profits')
@@ -1408,152 +1553,28 @@ def api_profits():
     profits = get_daily_profits()
     return jsonify(profits)
 
-@app.route('/api/profits_summary')
-def api_profits_summary():
-    """获取累计汇总数据和最近3天的盈利数据"""
-    from datetime import datetime, timedelta
-    
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # 直接从trades表计算累计汇总数据（计算所有平仓交易：CLOSE_LONG和CLOSE_SHORT）
-    cur.execute("""
-        SELECT 
-            COUNT(*) as total_trade_count,
-            SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as total_profit_count,
-            SUM(CASE WHEN pnl < 0 THEN 1 ELSE 0 END) as total_loss_count,
-            COALESCE(SUM(pnl), 0) as total_profit
-        FROM trades 
-        WHERE side IN ('CLOSE_LONG', 'CLOSE_SHORT')
-    """)
-    summary_row = cur.fetchone()
-    
-    # 计算所有交易的总手续费（包括开仓和平仓）
-    cur.execute("""
-        SELECT COALESCE(SUM(fee), 0) as all_fees
-        FROM trades
-    """)
-    all_fees_row = cur.fetchone()
-    
-    # 获取初始余额（从第一条记录或使用默认值）
-    cur.execute("SELECT initial_balance FROM daily_profits WHERE initial_balance > 0 ORDER BY date ASC LIMIT 1")
-    initial_balance_row = cur.fetchone()
-    initial_balance = initial_balance_row['initial_balance'] if initial_balance_row else 40.0
-    
-    # 计算总净利润（总盈亏 - 所有手续费），与每日数据计算逻辑保持一致
-    total_net_profit = (summary_row['total_profit'] or 0.0) - (all_fees_row['all_fees'] or 0.0)
-    
-    # 计算总利润率（使用净利润）
-    total_profit_rate = (total_net_profit / initial_balance * 100) if initial_balance > 0 else 0.0
-    
-    # 获取当天日期
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    # 计算交易天数：从第一次交易到当前日期的天数
-    cur.execute("SELECT MIN(ts) as first_trade_ts FROM trades")
-    first_trade_row = cur.fetchone()
-    
-    if first_trade_row and first_trade_row['first_trade_ts']:
-        # 将时间戳转换为日期
-        first_trade_date = datetime.fromtimestamp(first_trade_row['first_trade_ts'] / 1000).date()
-        current_date = datetime.now().date()
-        # 计算天数差
-        trading_days = (current_date - first_trade_date).days + 1  # +1 包含第一天
+def _profits_summary_payload():
+    """累计汇总数据和最近2天的盈利数据"""
+    from datetime import date as _date
+
+    report = reports.profit_report(recent_days=2)
+    # 当天日期（UTC+8，与交易日划分一致）
+    today = trade_date(int(time.time() * 1000))
+    if report.first_date:
+        # 交易天数：从第一次交易到当前日期的天数（+1 包含第一天）
+        trading_days = (_date.fromisoformat(today) - _date.fromisoformat(report.first_date)).days + 1
         summary_title = f'{trading_days} 天交易汇总'
     else:
         # 如果没有交易记录，显示默认格式
         summary_title = f'汇总({today})'
-    
-    # 构建汇总数据
-    summary_data = {
-        'date': summary_title,
-        'trade_count': summary_row['total_trade_count'] or 0,
-        'profit_count': summary_row['total_profit_count'] or 0,
-        'loss_count': summary_row['total_loss_count'] or 0,
-        'total_fees': all_fees_row['all_fees'] or 0.0,
-        'profit': total_net_profit,
-        'profit_rate': total_profit_rate,
-        'initial_balance': initial_balance
-    }
-    
-    # 获取实际有交易记录的日期（最多显示最近2天）
-    cur.execute("""
-        SELECT DISTINCT DATE(datetime(ts/1000 + 8*3600, 'unixepoch')) as trade_date
-        FROM trades 
-        ORDER BY trade_date DESC
-        LIMIT 2
-    """)
-    
-    trade_dates = [row['trade_date'] for row in cur.fetchall()]
-    
-    recent_profits = []
-    for date_str in trade_dates:
-        # 统计该日期的平仓交易数据（交易次数只计算平仓：CLOSE_LONG和CLOSE_SHORT）
-        cur.execute("""
-            SELECT 
-                COUNT(*) as close_count,
-                SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as profit_count,
-                SUM(CASE WHEN pnl < 0 THEN 1 ELSE 0 END) as loss_count,
-                COALESCE(SUM(fee), 0) as close_fees,
-                COALESCE(SUM(pnl), 0) as profit
-            FROM trades 
-            WHERE side IN ('CLOSE_LONG', 'CLOSE_SHORT') AND DATE(datetime(ts/1000 + 8*3600, 'unixepoch')) = ?
-        """, (date_str,))
-        
-        close_row = cur.fetchone()
-        
-        # 统计该日期的所有交易手续费（包括开仓和平仓）
-        cur.execute("""
-            SELECT COALESCE(SUM(fee), 0) as total_fees
-            FROM trades 
-            WHERE DATE(datetime(ts/1000 + 8*3600, 'unixepoch')) = ?
-        """, (date_str,))
-        
-        all_fees_row = cur.fetchone()
-        
-        # 交易次数、盈利次数、亏损次数只计算平仓交易
-        trade_count = close_row['close_count'] or 0
-        profit_count = close_row['profit_count'] or 0
-        loss_count = close_row['loss_count'] or 0
-        
-        # 手续费包括所有交易（开仓+平仓）
-        total_fees = all_fees_row['total_fees'] or 0.0
-        
-        # 盈亏只来自平仓交易
-        profit = close_row['profit'] or 0.0
-        
-        # 获取该日期的初始余额和利润率（从daily_profits表）
-        cur.execute("""
-            SELECT initial_balance, profit_rate 
-            FROM daily_profits 
-            WHERE date = ?
-        """, (date_str,))
-        
-        daily_row = cur.fetchone()
-        initial_balance = daily_row['initial_balance'] if daily_row else 40.0
-        
-        # 计算净利润（总盈亏 - 手续费）
-        net_profit = profit - total_fees
-        
-        # 计算利润率（使用净利润）
-        profit_rate = (net_profit / initial_balance * 100) if initial_balance > 0 else 0.0
-        
-        recent_profits.append({
-            'date': date_str,
-            'trade_count': trade_count,
-            'profit_count': profit_count,
-            'loss_count': loss_count,
-            'total_fees': total_fees,
-            'profit': net_profit,
-            'profit_rate': profit_rate,
-            'initial_balance': initial_balance
-        })
-    
-    conn.close()
-    
-    # 返回汇总数据和最近数据
-    result = [summary_data] + recent_profits
-    return jsonify(result)
+    summary = report.total._replace(date=summary_title)
+    return [summary.to_payload()] + [d.to_payload() for d in report.days]
+
+
+@app.route('/api/profits_summary')
+@api_cache.cached(events.TRADE, events.PROFIT, vary=lambda: trade_date(int(time.time() * 1000)))
+def api_profits_summary():
+    return jsonify(_profits_summary_payload())
 
 @app.route('/api/engine_status')
 def api_engine_status():
@@ -1562,7 +1583,7 @@ def api_engine_status():
         if hasattr(app, 'engine_instance') and app.engine_instance:
             eng = app.engine_instance
             return jsonify({
-                'connected': True,
+                'connected': getattr(eng, 'connected', True),
                 'last_price': eng.last_price,
                 'state': eng.state,
                 'prices_count': len(eng.prices),
@@ -1744,15 +1765,17 @@ def api_update_boll_params():
         if not (0.5 <= std <= 5.0):
             return jsonify({'success': False, 'message': 'std必须在0.5-5.0之间'}), 400
         
-        # 更新配置
+        # 先更新引擎（多交易对时更新所有引擎；进程模式下经 IPC，可能失败），成功后再写入配置
+        engine = getattr(app, 'multi_engine', None) or getattr(app, 'engine_instance', None)
+        if hasattr(engine, 'set_boll_params'):
+            period, std = engine.set_boll_params(period, std)
+        elif engine:
+            engine.boll_period = period
+            engine.boll_std = std
+        
         config.BOLL_PERIOD = period
         config.BOLL_STD = std
         
-        # 如果有engine实例，也更新其配置
-        if hasattr(app, 'engine_instance') and app.engine_instance:
-            app.engine_instance.boll_period = period
-            app.engine_instance.boll_std = std
-        
         return jsonify({
             'success': True,
             'message': f'BOLL参数已更新: period={period}, std={std}',
@@ -1764,114 +1787,186 @@ def api_update_boll_params():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.get("/api/trades")
-def api_trades():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT ts, side, qty, price, pnl, simulate, fee FROM trades ORDER BY ts DESC LIMIT 50")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-
-    def fmt(r):
-        ts_str = fmt_ts_utc8(int(r['ts']))
-        side = r['side']
-        if side in ("BUY", "SELL"):
-            action = "开仓"
-            direction = "long" if side == "BUY" else "short"
-        elif isinstance(side, str) and side.startswith("CLOSE"):
-            action = "平仓"
-            direction = side.split("_", 1)[-1].lower() if "_" in side else "-"
-        else:
-            action = side
-            direction = "-"
-        qty = float(r['qty'])
-        price = float(r['price'])
-        
-        # 根据操作类型显示不同的金额信息
-        if action == "开仓":
-            # 开仓显示分配的交易保证金（按照engine.py中的逻辑）
-            # 在engine.py中: margin = balance * TRADE_PERCENT, qty = margin * LEVERAGE / price
-            # 所以: margin = qty * price / LEVERAGE (这就是分配给交易的保证金)
-            margin = (qty * price) / config.LEVERAGE
-            text = f"{ts_str} {action} 分配保证金: {margin:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
-            
-            # 显示开仓手续费（如果有的话）
-            if r.get('fee') is not None and r['fee'] > 0:
-                fee = float(r['fee'])
-                fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
-                text += fee_text
-                
-        elif action == "平仓":
-            # 平仓显示平仓收益和盈亏
-            if r.get('pnl') is not None:
-                pnl = float(r['pnl'])
-                
-                # 使用数据库中存储的实际手续费
-                fee = float(r.get('fee', 0))
-                
-                # 计算保证金
-                original_margin = (qty * price) / config.LEVERAGE
-                
-                # 平仓收益 = 保证金 + 盈亏 - 手续费
-                close_amount = original_margin + pnl - fee
-                
-                text = f"{ts_str} {action} 收益: {close_amount:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
-                
-                # 添加盈亏信息（原始盈亏，未减去手续费）
-                if pnl > 0:
-                    pnl_text = f" <span class='trade-profit'>盈利: {pnl:.2f}</span>"
-                elif pnl < 0:
-                    pnl_text = f" <span class='trade-loss'>亏损: {abs(pnl):.2f}</span>"
-                else:
-                    pnl_text = f" <span class='trade-neutral'>盈亏: 0.00</span>"
-                
-                # 添加手续费信息
-                fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
-                
-                text += pnl_text + fee_text
+def _format_trade(r):
+    """交易记录格式化为页面显示的文本"""
+    ts_str = fmt_ts_utc8(int(r['ts']))
+    side = r['side']
+    if side in ("BUY", "SELL"):
+        action = "开仓"
+        direction = "long" if side == "BUY" else "short"
+    elif isinstance(side, str) and side.startswith("CLOSE"):
+        action = "平仓"
+        direction = side.split("_", 1)[-1].lower() if "_" in side else "-"
+    else:
+        action = side
+        direction = "-"
+    qty = float(r['qty'])
+    price = float(r['price'])
+
+    # 根据操作类型显示不同的金额信息
+    if action == "开仓":
+        # 开仓显示分配的交易保证金（按照engine.py中的逻辑）
+        # 在engine.py中: margin = balance * TRADE_PERCENT, qty = margin * LEVERAGE / price
+        # 所以: margin = qty * price / LEVERAGE (这就是分配给交易的保证金)
+        margin = (qty * price) / config.LEVERAGE
+        text = f"{ts_str} {action} 分配保证金: {margin:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
+
+        # 显示开仓手续费（如果有的话）
+        if r.get('fee') is not None and r['fee'] > 0:
+            fee = float(r['fee'])
+            fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
+            text += fee_text
+
+    elif action == "平仓":
+        # 平仓显示平仓收益和盈亏
+        if r.get('pnl') is not None:
+            pnl = float(r['pnl'])
+
+            # 使用数据库中存储的实际手续费
+            fee = float(r.get('fee', 0))
+
+            # 计算保证金
+            original_margin = (qty * price) / config.LEVERAGE
+
+            # 平仓收益 = 保证金 + 盈亏 - 手续费
+            close_amount = original_margin + pnl - fee
+
+            text = f"{ts_str} {action} 收益: {close_amount:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
+
+            # 添加盈亏信息（原始盈亏，未减去手续费）
+            if pnl > 0:
+                pnl_text = f" <span class='trade-profit'>盈利: {pnl:.2f}</span>"
+            elif pnl < 0:
+                pnl_text = f" <span class='trade-loss'>亏损: {abs(pnl):.2f}</span>"
             else:
-                # 没有盈亏信息时，显示名义价值
-                amount = qty * price
-                text = f"{ts_str} {action} 名义价值: {amount:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
-                
-                # 显示手续费（如果有的话）
-                if r.get('fee') is not None and r['fee'] > 0:
-                    fee = float(r['fee'])
-                    fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
-                    text += fee_text
+                pnl_text = f" <span class='trade-neutral'>盈亏: 0.00</span>"
+
+            # 添加手续费信息
+            fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
+
+            text += pnl_text + fee_text
         else:
-            # 其他操作显示名义价值
+            # 没有盈亏信息时，显示名义价值
             amount = qty * price
-            text = f"{ts_str} {action} 金额: {amount:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
-            
+            text = f"{ts_str} {action} 名义价值: {amount:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
+
             # 显示手续费（如果有的话）
             if r.get('fee') is not None and r['fee'] > 0:
                 fee = float(r['fee'])
                 fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
                 text += fee_text
-        
-        return {"text": text}
+    else:
+        # 其他操作显示名义价值
+        amount = qty * price
+        text = f"{ts_str} {action} 金额: {amount:.2f} 方向: {direction} 价格: {price:.2f} 数量: {qty:.4f}"
 
-    items = list(map(fmt, rows))
-    return jsonify(items)
+        # 显示手续费（如果有的话）
+        if r.get('fee') is not None and r['fee'] > 0:
+            fee = float(r['fee'])
+            fee_text = f" <span class='trade-fee'>手续费: {fee:.2f}</span>"
+            text += fee_text
 
+    return {"text": text}
 
-@app.get("/api/logs")
-def api_logs():
+
+@app.get("/api/trades")
+@api_cache.cached(events.TRADE)
+def api_trades():
     conn = get_conn()
     cur = conn.cursor()
-    # 排除DEBUG级别的日志，只显示INFO、WARNING、ERROR级别的日志
-    cur.execute("SELECT ts, level, message FROM logs WHERE level != 'DEBUG' ORDER BY ts DESC LIMIT 200")
-    rows = cur.fetchall()
+    cur.execute("SELECT ts, side, qty, price, pnl, simulate, fee FROM trades ORDER BY ts DESC LIMIT 50")
+    rows = [dict(r) for r in cur.fetchall()]
     conn.close()
-    return "\n".join(
-        [f"{fmt_ts_utc8(row['ts'])} [{row['level']}] {row['message']}" for row in rows]
-    )
+    return jsonify(list(map(_format_trade, rows)))
 
 
+def _format_log(row) -> str:
+    return f"{fmt_ts_utc8(row['ts'])} [{row['level']}] {row['message']}"
 
-@app.get("/api/balance")
-def api_balance():
+
+@app.get("/api/logs")
+@api_cache.cached(events.LOG)
+def api_logs():
+    # 直接读取内存环形缓冲（已排除DEBUG级别），不访问数据库
+    rows = recent_logs(200)
+    return "\n".join(map(_format_log, rows))
+
+
+@app.get("/api/log_stats")
+def api_log_stats():
+    """异步日志管道的积压与丢弃统计"""
+    return jsonify(log_writer.stats())
+
+
+@app.get("/api/symbols")
+def api_symbols():
+    """各交易对的状态机、最新价格与组合流路由统计"""
+    me = getattr(app, 'multi_engine', None)
+    engines = me.engines if me else {}
+    if not engines and getattr(app, 'engine_instance', None):
+        engines = {app.engine_instance.symbol: app.engine_instance}
+    items = [{"symbol": s, "state": e.state, "last_price": e.last_price} for s, e in engines.items()]
+    out = {"symbols": items}
+    if me:
+        out["messages"] = me.messages
+        out["unrouted"] = me.unrouted
+    return jsonify(out)
+
+
+@app.get("/api/mtf_boll")
+def api_mtf_boll():
+    """多周期模式下各周期的BOLL（由基础周期K线流聚合，MTF_ENABLED 未开启时为空）"""
+    eng = getattr(app, 'engine_instance', None)
+    out = {}
+    for itv, boll in (eng.mtf_boll.items() if eng else []):
+        try:
+            r = boll.compute(eng.last_price or None)
+            out[itv] = {"up": float(r["up"]), "mid": float(r["mid"]), "dn": float(r["dn"]), "ready": True}
+        except ValueError:
+            out[itv] = {"ready": False}
+    return jsonify({"confirm_interval": config.MTF_CONFIRM_INTERVAL, "intervals": out})
+
+
+@app.get("/api/broadcast_stats")
+def api_broadcast_stats():
+    """实时价格推送的合并与丢帧统计"""
+    eng = getattr(app, 'engine_instance', None)
+    if eng is None or eng.broadcaster is None:
+        return jsonify({})
+    return jsonify(eng.broadcaster.stats())
+
+
+@app.get("/api/report")
+@api_cache.cached(events.TRADE, events.PROFIT)
+def api_report():
+    """累计、最近几天（days，默认7）与按交易对的收益汇总"""
+    return jsonify(reports.profit_report(recent_days=min(request.args.get("days", 7, type=int), 366)).to_payload())
+
+
+@app.get("/api/cache_stats")
+def api_cache_stats():
+    """接口响应缓存的命中统计"""
+    return jsonify(api_cache.snapshot())
+
+
+@app.get("/api/metrics")
+def api_metrics():
+    """热路径各阶段延迟分位数（毫秒，进程启动以来）"""
+    eng = getattr(app, 'engine_instance', None)
+    if isinstance(eng, engine_ipc.EngineProxy):
+        # 热路径在引擎进程中
+        return jsonify(eng.metrics())
+    return jsonify({"version": metrics.persister.version or metrics.app_version(), "stages": metrics.snapshot()})
+
+
+@app.get("/api/metrics/history")
+def api_metrics_history():
+    """最近几个部署版本的各阶段延迟对比"""
+    return jsonify(metrics.history(request.args.get("versions", 5, type=int)))
+
+
+
+def _balance_payload():
     """获取当前余额（模拟模式下返回模拟余额）"""
     try:
         # 获取 Engine 实例中的 trader 余额
@@ -1880,67 +1975,124 @@ def api_balance():
         else:
             # 如果没有 engine 实例，返回默认值
             balance = 0.0
-        return jsonify({"balance": balance})
+        return {"balance": balance}
     except Exception as e:
-        return jsonify({"balance": 0.0, "error": str(e)})
+        return {"balance": 0.0, "error": str(e)}
+
+
+@app.get("/api/balance")
+def api_balance():
+    return jsonify(_balance_payload())
+
+
+KLINE_COLUMNS = ("t", "o", "h", "l", "c", "v", "up", "mid", "dn")
+
+
+def _kline_arrays(limit: int, since: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    最近 limit 根K线及对应的 BOLL，各列为 numpy 数组（KLINE_COLUMNS）
+
+    since 给出时只返回 open_time >= since 的K线（含 since 这一根），只读取计算这些K线的 BOLL 所需的数据。
+    """
+    period = config.BOLL_PERIOD
+    if config.KLINE_STORE_ENABLED:
+        # 列存储：零拷贝读取，since 用二分查找定位
+        store = get_store(config.SYMBOL, config.INTERVAL)
+        n = len(store)
+        count = min(limit, n)
+        if since is not None:
+            count = min(count, n - store.index_of(since))
+        raw = store.tail(count + period - 1)
+        ot, o, h, l, c, v = (raw[name] for name in ("open_time", "open", "high", "low", "close", "volume"))
+    else:
+        rows = fetch_klines(config.SYMBOL, limit=limit + period - 1)
+        ot = np.array([r['open_time'] for r in rows], dtype=np.int64)
+        o, h, l, c, v = (np.array([r[k] or 0.0 for r in rows], dtype=np.float64)
+                         for k in ("open", "high", "low", "close", "volume"))
+        count = min(limit, len(rows))
+        if since is not None:
+            count = min(count, len(rows) - int(np.searchsorted(ot, since)))
+    mid, up, dn = _boll_arrays(c, period, config.BOLL_STD)
+    tail = slice(len(ot) - count, None)
+    return {
+        "t": ot[tail], "o": o[tail], "h": h[tail], "l": l[tail], "c": c[tail], "v": v[tail],
+        "up": up[tail], "mid": mid[tail], "dn": dn[tail],
+    }
+
+
+def _boll_arrays(close: np.ndarray, period: int, std_mult: float):
+    """滑动窗口视图上逐窗口求均值与样本标准差（与 bollinger_bands ddof=1 一致），不足一个周期的位置为 NaN"""
+    mid = np.full(len(close), np.nan)
+    std = np.full(len(close), np.nan)
+    if len(close) >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(np.asarray(close, dtype=np.float64), period)
+        mid[period - 1:] = windows.mean(axis=1)
+        std[period - 1:] = windows.std(axis=1, ddof=1)
+    return mid, mid + std_mult * std, mid - std_mult * std
+
+
+def _json_list(a: np.ndarray) -> list:
+    """numpy 数组转 JSON 列表（NaN 转为 null）"""
+    out = a.tolist()
+    if a.dtype.kind == "f" and np.isnan(a).any():
+        out = [None if x != x else x for x in out]
+    return out
+
+
+def _kline_payload(limit: int, since: Optional[int] = None):
+    """最近 limit 根K线及对应的 BOLL 指标（逐根对象格式，页面推送与旧接口使用）"""
+    cols = _kline_arrays(limit, since)
+    if since is None and (len(cols["t"]) == 0 or np.isnan(cols["mid"][-1])):  # 不足一个 BOLL 周期
+        return {
+            'klines': [],
+            'boll': [],
+            'error': 'K线数据不足'
+        }
+    t, o, h, l, c, v, up, mid, dn = (_json_list(cols[k]) for k in KLINE_COLUMNS)
+    klines = [{'time': ti, 'open': oi, 'high': hi, 'low': li, 'close': ci, 'volume': vi}
+              for ti, oi, hi, li, ci, vi in zip(t, o, h, l, c, v)]
+    boll_data = [{'time': ti, 'upper': ui, 'middle': mi, 'lower': di}
+                 for ti, ui, mi, di in zip(t, up, mid, dn)]
+    return {
+        'klines': klines,
+        'boll': boll_data,
+        'symbol': config.SYMBOL,
+        'interval': config.INTERVAL
+    }
 
 
 @app.get("/api/kline_data")
+@api_cache.cached(events.KLINE, vary=_boll_params)
 def api_kline_data():
-    """获取 K 线数据和 BOLL 指标用于图表显示"""
+    """
+    获取 K 线数据和 BOLL 指标用于图表显示
+
+    参数:
+        limit: 最多返回的K线数（默认100，最大500）
+        since: 只返回 open_time >= since 的K线（增量更新，传入图表最后一根K线的 open_time）
+        format: rows（默认，逐根对象）、columns（列式 JSON）、
+                bin（小端 float64 列块：t,o,h,l,c,v,up,mid,dn 依次各 X-Kline-Count 个）
+    """
     try:
-        # 获取参数，默认返回最近100条K线数据
-        limit = int(request.args.get('limit', 100))
-        limit = min(limit, 500)  # 限制最大数量
-        
-        # 获取K线数据
-        rows = fetch_klines(config.SYMBOL, limit=limit + config.BOLL_PERIOD)
-        if len(rows) < config.BOLL_PERIOD:
-            return jsonify({
-                'klines': [],
-                'boll': [],
-                'error': 'K线数据不足'
-            })
-        
-        # 转换为DataFrame计算BOLL指标
-        df = pd.DataFrame(rows)
-        mid, up, dn = bollinger_bands(df, config.BOLL_PERIOD, config.BOLL_STD, ddof=1)
-        
-        # 只返回最近limit条数据
-        df_display = df.tail(limit).copy()
-        mid_display = mid.tail(limit)
-        up_display = up.tail(limit)
-        dn_display = dn.tail(limit)
-        
-        # 格式化K线数据
-        klines = []
-        for i, (idx, row) in enumerate(df_display.iterrows()):
-            klines.append({
-                'time': int(row['open_time']),
-                'open': float(row['open']),
-                'high': float(row['high']),
-                'low': float(row['low']),
-                'close': float(row['close']),
-                'volume': float(row['volume'])
-            })
-        
-        # 格式化BOLL数据
-        boll_data = []
-        for i, (idx, row) in enumerate(df_display.iterrows()):
-            boll_data.append({
-                'time': int(row['open_time']),
-                'upper': float(up_display.iloc[i]),
-                'middle': float(mid_display.iloc[i]),
-                'lower': float(dn_display.iloc[i])
-            })
-        
+        limit = min(int(request.args.get('limit', 100)), 500)  # 限制最大数量
+        since = request.args.get('since', type=int)
+        fmt = request.args.get('format', 'rows')
+        if fmt == 'rows':
+            return jsonify(_kline_payload(limit, since))
+        cols = _kline_arrays(limit, since)
+        count = len(cols["t"])
+        if fmt == 'bin':
+            body = np.vstack([cols[k] for k in KLINE_COLUMNS]).astype('<f8').tobytes()
+            resp = Response(body, mimetype='application/octet-stream')
+            resp.headers['X-Kline-Count'] = str(count)
+            resp.headers['X-Kline-Columns'] = ",".join(KLINE_COLUMNS)
+            return resp
         return jsonify({
-            'klines': klines,
-            'boll': boll_data,
             'symbol': config.SYMBOL,
-            'interval': config.INTERVAL
+            'interval': config.INTERVAL,
+            'count': count,
+            'columns': {k: _json_list(cols[k]) for k in KLINE_COLUMNS},
         })
-        
     except Exception as e:
         return jsonify({
             'klines': [],
@@ -1950,6 +2102,7 @@ def api_kline_data():
 
 
 @app.get("/api/realtime_boll")
+@api_cache.cached(events.KLINE, vary=_boll_params)
 def api_realtime_boll():
     """获取实时BOLL数据用于同步系统"""
     try:
@@ -2014,6 +2167,153 @@ def api_boll_sync_status():
         }), 500
 
 
+# ==================== 实时推送 ====================
+# 数据在变化处通过事件总线发布，这里登记为待推送，由后台推送线程合并后
+# 只计算一次负载并广播给所有页面（取代每个页面每10秒轮询全部接口）。
+# 事件处理函数运行在发布者线程（可能是引擎事件循环），只做登记不做查询。
+
+PUSH_COALESCE_SEC = 0.2     # 合并突发事件的等待时间
+STATUS_PUSH_INTERVAL = 10   # 系统信息、余额、持仓盈亏的推送间隔（秒）
+
+_push_lock = threading.Lock()
+_push_wake = threading.Event()
+_push_dirty = set()
+_push_logs = []
+_push_trades = []
+_push_kline_rows = 0
+_push_started = False
+_clients = 0
+
+
+def _mark_dirty(*kinds):
+    with _push_lock:
+        _push_dirty.update(kinds)
+    _push_wake.set()
+
+
+def _on_log_event(rec):
+    if rec["level"] == "DEBUG" or not _clients:
+        return
+    with _push_lock:
+        _push_logs.append(_format_log(rec))
+        _push_dirty.add("logs")
+    _push_wake.set()
+
+
+def _on_trade_event(trade):
+    if not _clients:
+        return
+    with _push_lock:
+        _push_trades.append(_format_trade(trade))
+        _push_dirty.update(("trades", "profits", "positions", "balance"))
+    _push_wake.set()
+
+
+def _on_kline_event(rows):
+    global _push_kline_rows
+    n = sum(1 for r in rows if r[0] == config.SYMBOL and r[1] == config.INTERVAL)
+    if not n or not _clients:
+        return
+    with _push_lock:
+        _push_kline_rows += n
+        _push_dirty.add("kline")
+    _push_wake.set()
+
+
+def _on_position_event(_):
+    if _clients:
+        _mark_dirty("positions", "balance")
+
+
+def _on_profit_event(_):
+    if _clients:
+        _mark_dirty("profits")
+
+
+events.subscribe(events.LOG, _on_log_event)
+events.subscribe(events.TRADE, _on_trade_event)
+events.subscribe(events.KLINE, _on_kline_event)
+events.subscribe(events.POSITION, _on_position_event)
+events.subscribe(events.PROFIT, _on_profit_event)
+
+
+def _emit(event: str, payload):
+    socketio.emit(event, payload)
+    exporter.SOCKETIO_EMITS.inc(1, event)
+
+
+def _push_worker():
+    global _push_kline_rows
+    while True:
+        _push_wake.wait()
+        socketio.sleep(PUSH_COALESCE_SEC)
+        _push_wake.clear()
+        with _push_lock:
+            dirty = set(_push_dirty)
+            logs, trades, kline_rows = _push_logs[:], _push_trades[:], _push_kline_rows
+            _push_dirty.clear()
+            _push_logs.clear()
+            _push_trades.clear()
+            _push_kline_rows = 0
+        try:
+            # 日志与交易按时间倒序发送（最新在前），与接口返回顺序一致
+            if "logs" in dirty:
+                _emit('logs', {'lines': logs[::-1]})
+            if "trades" in dirty:
+                _emit('trades', {'items': trades[::-1]})
+            if "profits" in dirty:
+                _emit('profits', _profits_summary_payload())
+            if "positions" in dirty:
+                _emit('positions', _positions_payload())
+            if "balance" in dirty:
+                _emit('balance', _balance_payload())
+            if "kline" in dirty:
+                _emit('kline', _kline_payload(min(kline_rows, 500)))
+        except Exception as e:
+            print(f"推送失败: {e}")
+
+
+def _status_loop():
+    while True:
+        socketio.sleep(STATUS_PUSH_INTERVAL)
+        if not _clients:
+            continue
+        try:
+            _emit('system', _system_payload())
+        except Exception as e:
+            print(f"推送系统信息失败: {e}")
+        # 未实现盈亏随价格变化，按固定间隔刷新一次（与在线页面数量无关）
+        _mark_dirty("positions", "balance")
+
+
+def _start_push():
+    global _push_started
+    with _push_lock:
+        if _push_started:
+            return
+        _push_started = True
+    socketio.start_background_task(_push_worker)
+    socketio.start_background_task(_status_loop)
+
+
+exporter.registry.gauge("socketio_clients", "Connected Socket.IO clients", fn=lambda: _clients)
+
+
+@socketio.on('connect')
+def on_connect(*args):
+    global _clients
+    with _push_lock:
+        _clients += 1
+    _start_push()
+
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    global _clients
+    with _push_lock:
+        _clients = max(0, _clients - 1)
+
+
 def _ensure_port_free(port: int):
     """如果端口被占用，立即杀掉占用进程，并等待端口释放。"""
     try:
@@ -2048,21 +2348,71 @@ def _ensure_port_free(port: int):
         pass
 
 
-def run_web():
-    print("启动检查开始...")
-
-    eng = Engine(socketio=socketio)  # 传入socketio对象
-    asyncio.run(eng.bootstrap())
-    
-    # 将 engine 实例存储到 app 对象中，供 API 接口使用
-    app.engine_instance = eng
+def _start_engine_thread():
+    """引擎与 Web 同进程：行情与交易循环在后台线程的事件循环中运行"""
+    if len(config.SYMBOLS) > 1:
+        # 多交易对：一个进程、一个组合流；页面与接口展示主交易对
+        eng = MultiEngine(config.SYMBOLS, socketio=socketio)
+        asyncio.run(eng.bootstrap())
+        app.engine_instance = eng.primary
+    else:
+        eng = Engine(socketio=socketio)  # 传入socketio对象
+        asyncio.run(eng.bootstrap())
+        # 将 engine 实例存储到 app 对象中，供 API 接口使用
+        app.engine_instance = eng
+    app.multi_engine = eng if isinstance(eng, MultiEngine) else None
 
     print("启动 WebSocket API 订阅实时币价...")
+    loop = asyncio.new_event_loop()
     def run_engine_ws():
-        asyncio.run(eng.run_ws())
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(eng.run_ws())
     thread = threading.Thread(target=run_engine_ws, daemon=True)
     thread.start()
     print("WebSocket 订阅已启动。")
+    metrics.persister.start()
+
+    def stop():
+        future = asyncio.run_coroutine_threadsafe(engine_ipc.shutdown(eng), loop)
+        future.result(config.SHUTDOWN_DRAIN_SEC + 5)
+    return stop
+
+
+def _start_engine_process():
+    """引擎在独立进程中运行，本进程通过 IPC 代理访问"""
+    # 列存储由引擎进程写入，本进程的K线读取走 SQLite，收到的K线事件也不再写列存储
+    config.KLINE_STORE_ENABLED = False
+    events.unsubscribe(events.KLINE, kline_store._on_kline_event)
+    proxy = engine_ipc.EngineProxy(socketio)
+    if config.ENGINE_SPAWN:
+        proxy.spawn()
+    proxy.start()
+    app.engine_instance = proxy
+    app.multi_engine = proxy if len(config.SYMBOLS) > 1 else None
+    engine_ipc.apply_cpu_policy(config.WEB_CPUS, config.WEB_NICE)
+    return proxy.stop
+
+
+def run_web():
+    print("启动检查开始...")
+
+    engine_mode = config.ENGINE_MODE
+    if ASYNC_MODE != "threading" and engine_mode != "process":
+        # 打过补丁的进程中 asyncio 引擎会与 Web 共用协程调度，必须隔离到独立进程
+        print(f"{ASYNC_MODE} 模式下引擎在独立进程中运行")
+        engine_mode = "process"
+    stop_engine = _start_engine_process() if engine_mode == "process" else _start_engine_thread()
+
+    def _on_signal(signum, frame):
+        print("收到退出信号，等待进行中的订单完成...")
+        try:
+            stop_engine()
+        except Exception as e:
+            print(f"等待订单完成失败: {e}")
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
 
     # 检查数据库 K 线数据（更新后）
     conn = get_conn()
@@ -2084,10 +2434,14 @@ def run_web():
     _ensure_port_free(5000)
     print(f"端口 5000 已可用。")
 
-    print("启动检查完成。")
-    # 使用socketio.run启动应用，支持WebSocket
-    # 添加allow_unsafe_werkzeug=True以支持生产环境部署
-    socketio.run(app, host=config.WEB_HOST, port=config.WEB_PORT, debug=False, allow_unsafe_werkzeug=True)
+    print(f"启动检查完成，Web 服务模式: {ASYNC_MODE}，引擎: {engine_mode}。")
+    if ASYNC_MODE == "threading":
+        # 使用socketio.run启动应用，支持WebSocket
+        # 添加allow_unsafe_werkzeug=True以支持生产环境部署
+        socketio.run(app, host=config.WEB_HOST, port=config.WEB_PORT, debug=False, allow_unsafe_werkzeug=True)
+    else:
+        # eventlet/gevent 自带的 WSGI 服务器：每个连接（含长轮询）一个协程，可承载数千个 Socket.IO 连接
+        socketio.run(app, host=config.WEB_HOST, port=config.WEB_PORT, debug=False, log_output=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+行情帧解码
+websocket 收到的K线推送先经过解码器得到 KlineEvent，再交给 Engine._on_kline / MultiEngine.route_event。
+解码后端按 WS_DECODER 选择（auto 时依次尝试，未安装的自动跳过）：
+    msgspec   按帧结构直接解码（只构造需要的字段，跳过其余键），最快
+    orjson    C 实现的 JSON 解析，得到字典后取字段
+    json      标准库
+
+KlineEvent 在解码时只转换每帧都要用的价格、开盘时间与收盘标志，开盘价与成交量保留原始字符串，
+只在K线收盘写库或多周期聚合时才转换（未收盘帧占绝大多数）。
+
+用法:
+    decoder = get_decoder()
+    ev = decoder.decode(raw)            # 单流帧 {"e": "kline", "s": ..., "k": {...}}
+    ev = decoder.decode_combined(raw)   # 组合流帧 {"stream": ..., "data": {...}}
+"""
+
+import json
+from typing import Any, Dict, Optional, Union
+
+from config import config
+from db import log
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+
+class KlineEvent:
+    """一帧K线推送"""
+
+    __slots__ = ("symbol", "open_time", "is_closed", "price", "_o", "_h", "_l", "_v")
+
+    def __init__(self, symbol: str, open_time: int, is_closed: bool, c, o, h, l, v):
+        self.symbol = symbol
+        self.open_time = int(open_time)
+        self.is_closed = is_closed
+        self.price = float(c)
+        self._o, self._h, self._l, self._v = o, h, l, v
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KlineEvent":
+        """已解析的推送字典（单流帧或组合流的 data 部分）"""
+        k = data.get("k", {})
+        return cls(data.get("s") or k.get("s", ""), k.get("t", 0), k.get("x", False), k.get("c", 0),
+                   k.get("o", 0), k.get("h", 0), k.get("l", 0), k.get("v", 0))
+
+    @property
+    def close(self) -> float:
+        return self.price
+
+    @property
+    def open(self) -> float:
+        return float(self._o)
+
+    @property
+    def high(self) -> float:
+        return float(self._h)
+
+    @property
+    def low(self) -> float:
+        return float(self._l)
+
+    @property
+    def volume(self) -> float:
+        return float(self._v)
+
+    def __repr__(self) -> str:
+        return (f"KlineEvent({self.symbol} t={self.open_time} c={self.price} o={self._o} h={self._h} "
+                f"l={self._l} v={self._v} x={self.is_closed})")
+
+
+class JsonDecoder:
+    """先解析为字典再取字段（标准库 json 或 orjson）"""
+
+    def __init__(self, name: str = "json"):
+        self.name = name
+        self.loads = orjson.loads if name == "orjson" else json.loads
+
+    def decode(self, raw: Union[str, bytes]) -> KlineEvent:
+        return KlineEvent.from_dict(self.loads(raw))
+
+    def decode_combined(self, raw: Union[str, bytes]) -> KlineEvent:
+        return KlineEvent.from_dict(self.loads(raw).get("data") or {})
+
+
+if msgspec is not None:
+    _Num = Union[str, float]
+
+    class _Kline(msgspec.Struct):
+        t: int = 0
+        s: str = ""
+        o: _Num = 0
+        h: _Num = 0
+        l: _Num = 0
+        c: _Num = 0
+        v: _Num = 0
+        x: bool = False
+
+    class _Frame(msgspec.Struct):
+        s: str = ""
+        k: _Kline = msgspec.field(default_factory=_Kline)
+
+    class _Combined(msgspec.Struct):
+        data: _Frame = msgspec.field(default_factory=_Frame)
+
+
+class MsgspecDecoder:
+    """按帧结构解码，未声明的键直接跳过"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._single = msgspec.json.Decoder(_Frame)
+        self._combined = msgspec.json.Decoder(_Combined)
+
+    @staticmethod
+    def _event(f) -> KlineEvent:
+        k = f.k
+        return KlineEvent(f.s or k.s, k.t, k.x, k.c, k.o, k.h, k.l, k.v)
+
+    def decode(self, raw: Union[str, bytes]) -> KlineEvent:
+        return self._event(self._single.decode(raw))
+
+    def decode_combined(self, raw: Union[str, bytes]) -> KlineEvent:
+        return self._event(self._combined.decode(raw).data)
+
+
+def available() -> Dict[str, bool]:
+    return {"msgspec": msgspec is not None, "orjson": orjson is not None, "json": True}
+
+
+def get_decoder(name: Optional[str] = None):
+    """按名称创建解码器；auto 选择已安装的最快后端，指定的后端未安装时退回标准库 json"""
+    name = (name or config.WS_DECODER).lower()
+    installed = available()
+    if name == "auto":
+        name = next(n for n in ("msgspec", "orjson", "json") if installed[n])
+    elif not installed.get(name):
+        log("WARNING", f"行情解码后端 {name} 不可用，使用标准库 json")
+        name = "json"
+    return MsgspecDecoder() if name == "msgspec" else JsonDecoder(name)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+行情 websocket 录制与回放
+录制：引擎收到的每一帧原始行情连同接收时间追加到压缩分块文件，热路径上只做一次入队
+（接收时间复用引擎已取的单调时钟 perf_counter_ns，写入时换算为墙上时间）；
+后台线程每 CHUNK_FRAMES 帧或每 FLUSH_INTERVAL 秒把排队的帧编码、zlib 压缩（压缩时释放 GIL）后追加一个块。
+每次（重）连接时额外记录一条 seed：引擎重建增量状态时读取的已收盘K线，回放时写回数据库，
+保证回放与当时的 BOLL/多周期状态一致；按大小轮转出的新文件以当前连接的 seed 开头，每个文件都可以单独回放。
+
+文件格式（只追加，进程崩溃时最后一个不完整的块在读取时被忽略）：
+    首行      b"WSREC1 " + JSON 元数据 + b"\\n"（交易对、周期、是否组合流、开始时间等）
+    块        头部 "<4sIIIqq"：magic b"WSCK" | 帧数 | 原始字节数 | 压缩字节数 | 首帧时间 | 末帧时间
+              + zlib 压缩的记录序列，每条记录 "<qBI"：接收时间 ns | 类型（0 行情帧 / 1 seed）| 长度 + 内容
+
+回放：Replay 是与 websocket 连接接口相同的异步可迭代对象，可直接交给 Engine._consume；
+支持按录制节奏（--speed 1）、加速（--speed 10）或全速（--speed 0）。
+回放引擎（backtest.ReplayEngine）使用模拟成交与录制时间作为时钟，不访问网络、不写正式数据库，
+同一文件的回放结果确定，可用于复现状态机问题；导出的原始帧也可作为 bench_decode.py 的压测数据。
+
+用法:
+    WS_RECORD_ENABLED=true python webapp.py                     # 录制到 data/ws_record/
+    python ws_record.py info data/ws_record/*.wsrec
+    python ws_record.py replay data/ws_record/xxx.wsrec --speed 0 [--symbol BTCUSDT] [--verbose]
+    python ws_record.py export data/ws_record/xxx.wsrec > frames.jsonl
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import config
+from db import log
+
+MAGIC = b"WSREC1 "
+_CHUNK = struct.Struct("<4sIIIqq")
+_CHUNK_MAGIC = b"WSCK"
+_RECORD = struct.Struct("<qBI")
+FRAME = 0
+SEED = 1
+
+
+class Recorder:
+    CHUNK_FRAMES = 5000
+    FLUSH_INTERVAL = 1.0  # 秒
+    MAX_PENDING = 200_000  # 排队帧数上限，超过时丢弃并计数（磁盘过慢不影响交易循环）
+    LEVEL = 1  # zlib 压缩级别：行情帧重复度高，级别 1 已有约 10 倍压缩且最快
+
+    def __init__(self, meta: Dict[str, Any], directory: str = config.WS_RECORD_DIR,
+                 rotate_bytes: int = config.WS_RECORD_ROTATE_MB * 1024 * 1024):
+        self.meta = dict(meta, version=1)
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self._pending: deque = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._file = None
+        self._seed: Optional[Tuple[int, int, str]] = None  # 已写入的最近一条 seed，轮转时写在新文件开头
+        self.path = ""
+        self.parts = 0  # 已创建的文件数（文件名序号，同一秒内轮转也不会重名）
+        self.frames = 0
+        self.dropped = 0
+        self.chunks = 0
+        self.raw_bytes = 0
+        self.written_bytes = 0
+        self._offset_ns = time.time_ns() - time.perf_counter_ns()  # 单调时钟 -> 墙上时间
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="ws-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- 热路径 ----------
+
+    def append(self, raw, recv_ns: int = 0):
+        """记录一帧原始行情；recv_ns 为收到该帧时的 perf_counter_ns"""
+        if len(self._pending) >= self.MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append((recv_ns or time.perf_counter_ns(), FRAME, raw))
+
+    def mark_connect(self, seed: Dict[str, Dict[str, List[Dict[str, Any]]]]):
+        """(重)连接时记录各交易对重建增量状态所用的K线 {symbol: {interval: rows}}"""
+        self._pending.append((time.perf_counter_ns(), SEED, json.dumps(seed, separators=(",", ":"))))
+        self._wake.set()
+
+    # ---------- 后台写入 ----------
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log("ERROR", f"行情录制写入失败: {e}")
+
+    def _open(self):
+        self.parts += 1
+        name = (f"{self.meta.get('name', 'market')}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+                f"-{self.parts:03d}.wsrec")
+        self.path = os.path.join(self.directory, name)
+        self._file = open(self.path, "ab")
+        self._file.write(MAGIC + json.dumps(dict(self.meta, started=time.time()), ensure_ascii=False).encode() + b"\n")
+        log("INFO", f"行情录制文件: {self.path}")
+        if self._seed is not None:
+            # 新文件从当前连接的 seed 开始，回放时能重建当时的增量状态
+            self._write_chunk([self._seed])
+
+    def _write_chunk(self, records: List[Tuple[int, int, str]]):
+        parts = []
+        for ts, kind, data in records:
+            body = data.encode() if isinstance(data, str) else data
+            parts.append(_RECORD.pack(ts, kind, len(body)))
+            parts.append(body)
+        raw = b"".join(parts)
+        comp = zlib.compress(raw, self.LEVEL)
+        self._file.write(_CHUNK.pack(_CHUNK_MAGIC, len(records), len(raw), len(comp), records[0][0], records[-1][0])
+                         + comp)
+        self._file.flush()
+        self.chunks += 1
+        self.raw_bytes += len(raw)
+        self.written_bytes += _CHUNK.size + len(comp)
+
+    def flush(self):
+        with self._flush_lock:
+            offset = self._offset_ns
+            while self._pending:
+                # 先轮转再取帧：本块之前最近的 seed 就是新文件开头需要的那一条
+                if self._file is None or self._file.tell() >= self.rotate_bytes:
+                    if self._file is not None:
+                        self._file.close()
+                    self._open()
+                records = []
+                while self._pending and len(records) < self.CHUNK_FRAMES:
+                    ts, kind, data = self._pending.popleft()
+                    rec = (ts + offset, kind, data)
+                    if kind == SEED:
+                        self._seed = rec
+                    records.append(rec)
+                self._write_chunk(records)
+                self.frames += len(records)
+
+    def close(self):
+        """停止后台线程并写完排队的帧（重复调用无副作用）"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "frames": self.frames,
+            "chunks": self.chunks,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "ratio": self.raw_bytes / self.written_bytes if self.written_bytes else 0.0,
+        }
+
+
+def open_recorder(symbols: List[str], combined: bool) -> Optional[Recorder]:
+    """WS_RECORD_ENABLED 时为一个行情会话创建录制器；元数据记录回放所需的策略参数"""
+    if not config.WS_RECORD_ENABLED:
+        return None
+    meta = {
+        "name": symbols[0] if len(symbols) == 1 else f"{len(symbols)}symbols",
+        "symbols": list(symbols),
+        "combined": combined,
+        "interval": config.INTERVAL,
+        "mtf_enabled": config.MTF_ENABLED,
+        "mtf_base_interval": config.MTF_BASE_INTERVAL,
+        "mtf_intervals": config.MTF_INTERVALS,
+        "mtf_confirm_interval": config.MTF_CONFIRM_INTERVAL,
+        "boll_period": config.BOLL_PERIOD,
+        "boll_std": config.BOLL_STD,
+    }
+    return Recorder(meta)
+
+
+# ==================== 读取 ====================
+
+def read_meta(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        line = f.readline()
+    if not line.startswith(MAGIC):
+        raise ValueError(f"不是行情录制文件: {path}")
+    return json.loads(line[len(MAGIC):])
+
+
+def iter_chunks(path: str) -> Iterator[Tuple[int, bytes]]:
+    """(帧数, 解压后的记录序列)；末尾不完整的块（写入中或进程崩溃）被忽略"""
+    with open(path, "rb") as f:
+        if not f.readline().startswith(MAGIC):
+            raise ValueError(f"不是行情录制文件: {path}")
+        while True:
+            head = f.read(_CHUNK.size)
+            if len(head) < _CHUNK.size:
+                return
+            magic, n, raw_len, comp_len, _, _ = _CHUNK.unpack(head)
+            comp = f.read(comp_len)
+            if magic != _CHUNK_MAGIC or len(comp) < comp_len:
+                return
+            raw = zlib.decompress(comp)
+            if len(raw) != raw_len:
+                return
+            yield n, raw
+
+
+def iter_records(path: str) -> Iterator[Tuple[int, int, str]]:
+    """按顺序产出 (接收时间 ns, 类型, 内容)"""
+    for _, raw in iter_chunks(path):
+        off = 0
+        end = len(raw)
+        while off < end:
+            ts, kind, size = _RECORD.unpack_from(raw, off)
+            off += _RECORD.size
+            yield ts, kind, raw[off:off + size].decode()
+            off += size
+
+
+def iter_frames(path: str) -> Iterator[Tuple[int, str]]:
+    """只产出行情帧 (接收时间 ns, 原始文本)"""
+    for ts, kind, data in iter_records(path):
+        if kind == FRAME:
+            yield ts, data
+
+
+class Replay:
+    """
+    录制文件的回放源，接口与 websocket 连接一致（async for msg in replay）
+
+    speed: 1 按录制节奏，>1 加速，0 全速；每帧之后让出一次事件循环，评估任务与实时运行时一样在下一帧前执行，
+    回放结果与速度无关。seed 记录交给 on_seed 回调（写回K线并重建引擎增量状态）。
+    """
+
+    def __init__(self, paths: List[str], speed: float = 1.0, on_seed: Optional[Callable[[Dict], None]] = None,
+                 accept: Optional[Callable[[str], bool]] = None):
+        self.paths = paths
+        self.speed = speed
+        self.on_seed = on_seed
+        self.accept = accept  # 过滤帧（如组合流中只回放某个交易对）
+        self.now_ms = 0  # 当前帧的录制接收时间
+        self.frames = 0
+
+    def __aiter__(self):
+        return self._run()
+
+    async def _run(self):
+        first_ns = 0
+        t0 = 0.0
+        for path in self.paths:
+            for ts, kind, data in iter_records(path):
+                self.now_ms = ts // 1_000_000
+                if kind == SEED:
+                    if self.on_seed is not None:
+                        self.on_seed(json.loads(data))
+                    continue
+                if self.accept is not None and not self.accept(data):
+                    continue
+                if self.speed > 0:
+                    if not first_ns:
+                        first_ns, t0 = ts, time.perf_counter()
+                    delay = (ts - first_ns) / 1e9 / self.speed - (time.perf_counter() - t0)
+                    await asyncio.sleep(delay if delay > 0 else 0)
+                else:
+                    await asyncio.sleep(0)
+                self.frames += 1
+                yield data
+
+
+# ==================== 命令行 ====================
+
+def _info(paths: List[str]):
+    for path in paths:
+        meta = read_meta(path)
+        frames = chunks = raw_bytes = seeds = 0
+        first = last = 0
+        for ts, kind, _ in iter_records(path):
+            if kind == SEED:
+                seeds += 1
+                continue
+            frames += 1
+            first = first or ts
+            last = ts
+        for _, raw in iter_chunks(path):
+            chunks += 1
+            raw_bytes += len(raw)
+        size = os.path.getsize(path)
+        span = (last - first) / 1e9 if frames else 0.0
+        print(f"{path}")
+        print(f"  交易对 {','.join(meta.get('symbols', []))} 周期 {meta.get('interval')} "
+              f"{'组合流' if meta.get('combined') else '单流'}")
+        print(f"  {frames} 帧 / {chunks} 块 / {seeds} 次连接，时长 {span:.1f} 秒，"
+              f"{raw_bytes / 1024:.0f} KiB -> {size / 1024:.0f} KiB（{raw_bytes / max(size, 1):.1f} 倍）")
+        if frames:
+            print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first / 1e9))} ~ "
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last / 1e9))}")
+
+
+def _replay(args):
+    meta = read_meta(args.files[0])
+    symbols = meta.get("symbols") or [config.SYMBOL]
+    symbol = (args.symbol or symbols[0]).upper()
+    # 回放使用临时数据库与录制时的策略参数；必须在导入引擎前设置
+    tmp = tempfile.mkdtemp(prefix="ws_replay_")
+    config.DB_PATH = os.path.join(tmp, "replay.db")
+    config.KLINE_STORE_ENABLED = False
+    config.WS_RECORD_ENABLED = False
+    config.SYMBOL = symbol
+    config.INTERVAL = meta.get("interval", config.INTERVAL)
+    config.MTF_ENABLED = meta.get("mtf_enabled", False)
+    config.MTF_BASE_INTERVAL = meta.get("mtf_base_interval", config.MTF_BASE_INTERVAL)
+    config.MTF_INTERVALS = meta.get("mtf_intervals", config.MTF_INTERVALS)
+    config.MTF_CONFIRM_INTERVAL = meta.get("mtf_confirm_interval", config.MTF_CONFIRM_INTERVAL)
+    config.BOLL_PERIOD = args.period or meta.get("boll_period", config.BOLL_PERIOD)
+    config.BOLL_STD = args.std or meta.get("boll_std", config.BOLL_STD)
+
+    from backtest import ReplayEngine, SimTrader
+
+    trader = SimTrader(args.balance, symbol=symbol)
+    eng = ReplayEngine(trader, symbol=symbol, combined=meta.get("combined", False),
+                       verbose=args.verbose)
+    replay = Replay(args.files, speed=args.speed, on_seed=eng.on_seed,
+                    accept=eng.accepts if meta.get("combined") else None)
+    eng.clock = lambda: replay.now_ms
+
+    async def run():
+        t0 = time.perf_counter()
+        await eng._consume(replay)
+        task = eng._eval_task
+        if task is not None:
+            await task
+        return time.perf_counter() - t0
+
+    elapsed = asyncio.run(run())
+    print(f"回放 {symbol}: {replay.frames} 帧，用时 {elapsed:.2f} 秒（{replay.frames / max(elapsed, 1e-9):.0f} 帧/秒），"
+          f"最终状态 {eng.state}")
+    for t in trader.trades:
+        ts = time.strftime("%m-%d %H:%M:%S", time.localtime(t["ts"] / 1000))
+        print(f"  {ts} {t['side']:<12} {t['qty']:.6f} @ {t['price']:.2f}  盈亏 {t['pnl']:.4f}  手续费 {t['fee']:.4f}")
+    print(f"  成交 {len(trader.trades)} 笔，权益 {trader.equity(eng.last_price):.4f}")
+
+
+def _export(paths: List[str]):
+    out = sys.stdout
+    for path in paths:
+        for _, raw in iter_frames(path):
+            out.write(raw)
+            out.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情 websocket 录制文件工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info", help="文件概况")
+    p.add_argument("files", nargs="+")
+    p = sub.add_parser("replay", help="用模拟成交回放到引擎")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--speed", type=float, default=0, help="回放速度：1 按录制节奏，10 为十倍速，0 全速")
+    p.add_argument("--symbol", help="组合流录制中回放的交易对（默认第一个）")
+    p.add_argument("--period", type=int, help="覆盖录制时的 BOLL 周期")
+    p.add_argument("--std", type=float, help="覆盖录制时的 BOLL 标准差倍数")
+    p.add_argument("--balance", type=float, default=config.DEFAULT_MARGIN)
+    p.add_argument("--verbose", action="store_true", help="打印状态机日志（带录制时间）")
+    p = sub.add_parser("export", help="导出原始行情帧（每行一帧）")
+    p.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        _info(args.files)
+    elif args.command == "replay":
+        _replay(args)
+    else:
+        _export(args.files)
+
+
+if __name__ == "__main__":
+    main()